@@ -6,9 +6,19 @@ from application.interfaces.Idatabase_session import IDatabaseSession
 from application.interfaces.Irepository_bd_dict import IRepositoryDBDict
 from application.orchestration import Orchestration
 from application.services.view_service import ViewService
+from core.ai.checkpoint_compactor import CheckpointCompactor
+from core.ai.checkpointer import SQLiteCheckpointSaver
 from core.config.logging_config import configure_logging
+from core.repository.repository_archive import RepositoryArchive
 from core.repository.repository_bd_dict import RepositoryDBDict
+from core.repository.repository_chat_summary import RepositoryChatSummary
+from core.repository.repository_checkpoint import RepositoryCheckpoint
+from core.repository.repository_conversation_digest import RepositoryConversationDigest
+from core.repository.repository_media import RepositoryMedia
+from core.repository.repository_response_cache import RepositoryResponseCache
+from core.repository.repository_search import RepositorySearch
 from core.repository.sqlite_session import SQLiteDatabaseSession
+from core.repository.write_behind_flusher import WriteBehindFlusher
 from presentation.main_window import MainWindow
 
 
@@ -19,8 +29,32 @@ logger = logging.getLogger(__name__)
 if __name__ == "__main__":
     database: IDatabaseSession = SQLiteDatabaseSession()
     repository: IRepositoryDBDict = RepositoryDBDict(database=database)
+    checkpointer = SQLiteCheckpointSaver(
+        repository=RepositoryCheckpoint(database=database),
+        legacy_repository=repository,
+    )
 
-    orchestrator = Orchestration(repository=repository)
+    CheckpointCompactor(saver=checkpointer).start()
+
+    flusher = WriteBehindFlusher(repository=repository)
+    chat_summary_repository = RepositoryChatSummary(database=database)
+    chat_summary_repository.backfill(
+        message_count=lambda chat_id: checkpointer.get_messages(
+            config={"configurable": {"thread_id": str(chat_id), "checkpoint_ns": ""}}, start=0, end=0
+        )[0]
+    )
+
+    orchestrator = Orchestration(
+        repository=repository,
+        checkpointer=checkpointer,
+        flusher=flusher,
+        media_repository=RepositoryMedia(database=database),
+        chat_summary_repository=chat_summary_repository,
+        search_repository=RepositorySearch(database=database),
+        archive_repository=RepositoryArchive(database=database),
+        response_cache_repository=RepositoryResponseCache(database=database),
+        conversation_digest_repository=RepositoryConversationDigest(database=database),
+    )
     view_service = ViewService(orchestrator=orchestrator)
 
     def run_tk():
@@ -9,5 +9,9 @@ class IDatabaseSession(Protocol):
     def get_session(self) -> Generator[Session, any, None]:
         pass
 
+    @contextmanager
+    def get_read_session(self) -> Generator[Session, any, None]:
+        pass
+
     def get_next_id(self, model: Type[Base]) -> int:
         pass
\ No newline at end of file
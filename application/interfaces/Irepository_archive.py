@@ -0,0 +1,21 @@
+from typing import Protocol
+
+from domain.entities.chat_archive import ChatArchive
+
+
+class IRepositoryArchive(Protocol):
+
+    def archive_chat(self, chat_id: int) -> ChatArchive | None:
+        pass
+
+    def rehydrate(self, chat_id: int) -> bool:
+        pass
+
+    def get(self, chat_id: int) -> ChatArchive | None:
+        pass
+
+    def load_rows(self, chat_id: int) -> dict[str, list[dict]] | None:
+        pass
+
+    def stale_chats(self, older_than: float, limit: int = 100) -> list[int]:
+        pass
@@ -14,6 +14,15 @@ class IRepositoryDBDict(Protocol):
     def get_chat(self, record_id: int) -> AIState | None:
         pass
 
+    def get_chat_column(self, record_id: int, col_name: str) -> bytes | None:
+        pass
+
+    def get_chat_columns(self, record_id: int, col_names: list[str]) -> dict[str, bytes | None] | None:
+        pass
+
+    def save_columns(self, records: dict[int, dict[str, bytes]]) -> None:
+        pass
+
     def get_list_chats(self) -> (int, str):
         pass
 
@@ -0,0 +1,18 @@
+from typing import Callable, Protocol
+
+from domain.entities.chat_summary import ChatSummary
+
+
+class IRepositoryChatSummary(Protocol):
+
+    def record_turn(self, chat_id: int, title: str | None, message_count: int, media_bytes: int) -> ChatSummary:
+        pass
+
+    def get(self, chat_id: int) -> ChatSummary | None:
+        pass
+
+    def list_page(self, limit: int = 50, before: tuple[float, int] | None = None) -> list[ChatSummary]:
+        pass
+
+    def backfill(self, message_count: Callable[[int], int] | None = None) -> int:
+        pass
@@ -0,0 +1,86 @@
+from typing import Protocol
+
+from domain.entities.chat_fork import ChatFork
+from domain.entities.checkpoint_record import (
+    CheckpointRecord,
+    CheckpointWriteRecord,
+    CheckpointBlobRecord,
+    CheckpointMessageRecord,
+)
+
+
+class IRepositoryCheckpoint(Protocol):
+
+    def put_checkpoint(
+        self,
+        checkpoint: CheckpointRecord,
+        blobs: list[CheckpointBlobRecord],
+        messages: list[CheckpointMessageRecord] | None = None,
+    ) -> None:
+        pass
+
+    def put_writes(self, writes: list[CheckpointWriteRecord]) -> None:
+        pass
+
+    def get_checkpoint(self, chat_id: int, checkpoint_ns: str = "", checkpoint_id: str | None = None) -> CheckpointRecord | None:
+        pass
+
+    def list_checkpoints(
+        self,
+        chat_id: int | None = None,
+        checkpoint_ns: str | None = None,
+        before: str | None = None,
+        limit: int | None = None,
+    ) -> list[CheckpointRecord]:
+        pass
+
+    def get_blobs(self, chat_id: int, checkpoint_ns: str, versions: dict[str, str]) -> list[CheckpointBlobRecord]:
+        pass
+
+    def get_messages(self, chat_id: int, checkpoint_ns: str, keys: list[str]) -> list[CheckpointMessageRecord]:
+        pass
+
+    def existing_message_keys(self, chat_id: int, checkpoint_ns: str, keys: list[str]) -> set[str]:
+        pass
+
+    def prune_messages(self, chat_id: int) -> int:
+        pass
+
+    def get_writes(self, chat_id: int, checkpoint_ns: str, checkpoint_id: str) -> list[CheckpointWriteRecord]:
+        pass
+
+    def has_checkpoints(self, chat_id: int) -> bool:
+        pass
+
+    def prune_checkpoints(self, chat_id: int, checkpoint_ns: str, keep: int) -> list[str]:
+        pass
+
+    def list_blob_keys(self, chat_id: int) -> list[tuple[str, str, str]]:
+        pass
+
+    def delete_blobs(self, chat_id: int, keys: list[tuple[str, str, str]]) -> None:
+        pass
+
+    def chats_over_retention(self, keep: int) -> list[int]:
+        pass
+
+    def pin_checkpoint(self, chat_id: int, checkpoint_ns: str, checkpoint_id: str, name: str | None = None) -> None:
+        pass
+
+    def unpin_checkpoint(self, chat_id: int, checkpoint_ns: str, checkpoint_id: str) -> None:
+        pass
+
+    def incremental_vacuum(self, max_pages: int | None = None) -> int:
+        pass
+
+    def create_fork(self, chat_id: int, parent_chat_id: int, parent_checkpoint_id: str) -> ChatFork:
+        pass
+
+    def get_fork(self, chat_id: int) -> ChatFork | None:
+        pass
+
+    def list_forks(self, parent_chat_id: int) -> list[ChatFork]:
+        pass
+
+    def delete_chat(self, chat_id: int, fork_versions: dict[int, dict[str, str]] | None = None) -> None:
+        pass
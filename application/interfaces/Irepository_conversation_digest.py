@@ -0,0 +1,12 @@
+from typing import Protocol
+
+from domain.entities.conversation_digest import ConversationDigest
+
+
+class IRepositoryConversationDigest(Protocol):
+
+    def get(self, chat_id: int) -> ConversationDigest | None:
+        pass
+
+    def put(self, digest: ConversationDigest) -> None:
+        pass
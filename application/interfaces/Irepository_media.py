@@ -0,0 +1,15 @@
+from typing import Protocol
+
+from domain.entities.media_blob import MediaBlob
+
+
+class IRepositoryMedia(Protocol):
+
+    def put(self, data: bytes, mime_type: str) -> str:
+        pass
+
+    def get(self, sha256: str) -> MediaBlob | None:
+        pass
+
+    def exists(self, sha256: str) -> bool:
+        pass
@@ -0,0 +1,13 @@
+from typing import Any, Protocol
+
+
+class IRepositoryResponseCache(Protocol):
+
+    def get(self, key: str, ttl: float) -> Any | None:
+        pass
+
+    def put(self, key: str, model: str, response: Any, max_bytes: int) -> None:
+        pass
+
+    def clear(self) -> int:
+        pass
@@ -0,0 +1,18 @@
+from typing import Protocol
+
+from domain.entities.search_result import SearchResult
+
+
+class IRepositorySearch(Protocol):
+
+    def index_turn(self, chat_id: int, messages: list[tuple[str, str]], message_count: int) -> bool:
+        pass
+
+    def reindex_chat(self, chat_id: int, messages: list[tuple[str, str]]) -> None:
+        pass
+
+    def chats_to_backfill(self, limit: int = 100) -> list[int]:
+        pass
+
+    def search(self, query: str, limit: int = 20) -> list[SearchResult]:
+        pass
@@ -1,10 +1,37 @@
 import logging
+import os
+from concurrent.futures import Future
+from typing import Callable
 import numpy as np
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from application.interfaces.Irepository_archive import IRepositoryArchive
 from application.interfaces.Irepository_bd_dict import IRepositoryDBDict
+from application.interfaces.Irepository_chat_summary import IRepositoryChatSummary
+from application.interfaces.Irepository_conversation_digest import IRepositoryConversationDigest
+from application.interfaces.Irepository_media import IRepositoryMedia
+from application.interfaces.Irepository_response_cache import IRepositoryResponseCache
+from application.interfaces.Irepository_search import IRepositorySearch
+from application.services.agent_cache import AgentCache
 from application.services.ai_service import AIService
+from application.services.archive_service import ArchiveService
 from application.services.asr_service import ASRService
+from application.services.media_service import MediaService
+from application.services.response_cache_service import ResponseCacheService
 from application.services.screenshot_service import ScreenshotService
+from application.services.search_service import SearchService
 from application.services.hot_key_service import HotkeyService
+from core.ai.agent_runtime import AgentRuntime
+from core.ai.ai_agent import model_factory
+from core.ai.checkpointer import SQLiteCheckpointSaver
+from core.ai.conversation_digest import ConversationDigester
+from core.config.config import settings
+from core.media.image_pipeline import ImagePipeline
+from core.media.video_sampler import VideoSampler
+from core.repository.write_behind_flusher import WriteBehindFlusher
+from domain.entities.chat_page import ChatPage
+from domain.entities.chat_summary import ChatSummary
+from domain.entities.media_handle import MediaHandle
+from domain.entities.search_result import SearchResult
 from domain.enums.ai_model import AIModels
 
 
@@ -12,9 +39,47 @@ logger = logging.getLogger(__name__)
 
 
 class Orchestration:
-    def __init__(self, repository: IRepositoryDBDict):
+    def __init__(
+        self,
+        repository: IRepositoryDBDict,
+        checkpointer: BaseCheckpointSaver | None = None,
+        flusher: WriteBehindFlusher | None = None,
+        media_repository: IRepositoryMedia | None = None,
+        chat_summary_repository: IRepositoryChatSummary | None = None,
+        search_repository: IRepositorySearch | None = None,
+        archive_repository: IRepositoryArchive | None = None,
+        response_cache_repository: IRepositoryResponseCache | None = None,
+        conversation_digest_repository: IRepositoryConversationDigest | None = None,
+    ):
         logger.info("init orchestration")
         self.__repository: IRepositoryDBDict = repository
+        self.__checkpointer: BaseCheckpointSaver | None = checkpointer
+        self.__flusher: WriteBehindFlusher | None = flusher
+        self.__chat_summary_repository: IRepositoryChatSummary | None = chat_summary_repository
+        self.__search_service: SearchService | None = (
+            SearchService(repository=search_repository, checkpointer=checkpointer) if search_repository else None
+        )
+        self.__media_service: MediaService | None = (
+            MediaService(repository=media_repository) if media_repository else None
+        )
+        self.__response_cache: ResponseCacheService | None = (
+            ResponseCacheService(repository=response_cache_repository) if response_cache_repository else None
+        )
+        # Сжатие старых ходов включается настройкой DIGEST_THRESHOLD_TOKENS
+        self.__digester: ConversationDigester | None = (
+            ConversationDigester(
+                repository=conversation_digest_repository,
+                model=model_factory(model=AIModels(settings.DIGEST_MODEL)),
+            )
+            if conversation_digest_repository and settings.DIGEST_THRESHOLD_TOKENS > 0 else None
+        )
+        self.__image_pipeline = ImagePipeline()
+        self.__video_sampler = VideoSampler()
+        self.__agent_cache = AgentCache()
+        self.__runtime = AgentRuntime()
+        self.__archive_service: ArchiveService | None = (
+            ArchiveService(repository=archive_repository) if archive_repository else None
+        )
 
     def init_services(self):
         self.__screenshot_service = ScreenshotService()
@@ -31,13 +96,33 @@ class Orchestration:
         )
         self.asr_service.start_speach_service()
         self.__ai_service: AIService = self.create_ai_agent()
+        if self.__search_service:
+            self.__search_service.start_backfill()
+        if self.__archive_service:
+            self.__archive_service.start()
 
     def create_ai_agent(self, chat_id: int | None = None) -> AIService:
+        if chat_id is not None:
+            cached = self.__agent_cache.get(chat_id=chat_id)
+            if cached is not None:
+                self.__ai_service = cached
+                return self.__ai_service
+            if self.__archive_service:
+                self.__archive_service.open_chat(chat_id=chat_id)
         self.__ai_service: AIService = AIService(
             model=AIModels.GEMINI_2_5_FLASH_LITE_PREVIEW_06_17,
             repository=self.__repository,
             chat_id=chat_id,
+            checkpointer=self.__checkpointer,
+            flusher=self.__flusher,
+            media_service=self.__media_service,
+            chat_summary_repository=self.__chat_summary_repository,
+            search_service=self.__search_service,
+            response_cache=self.__response_cache,
+            digester=self.__digester,
+            image_pipeline=self.__image_pipeline,
         )
+        self.__agent_cache.put(self.__ai_service)
         return self.__ai_service
 
     def get_current_chat_id(self) -> int:
@@ -46,16 +131,107 @@ class Orchestration:
     def get_list_chats(self) -> (int, str):
         return self.__repository.get_list_chats()
 
-    def send_message(self, message: list[dict[str, str]]):
-        result = self.__ai_service.invoke(human_message=message)
+    def get_chat_page(self, limit: int = 50, before: tuple[float, int] | None = None) -> list[ChatSummary]:
+        if self.__chat_summary_repository is None:
+            # Без сводок - только id чатов, одной страницей
+            return [ChatSummary(chat_id=chat_id) for (chat_id, _) in self.__repository.get_list_chats()] if before is None else []
+        return self.__chat_summary_repository.list_page(limit=limit, before=before)
+
+    def get_chat_summary(self, chat_id: int) -> ChatSummary | None:
+        if self.__chat_summary_repository is None:
+            return ChatSummary(chat_id=chat_id)
+        return self.__chat_summary_repository.get(chat_id=chat_id)
+
+    def fork_chat(self, chat_id: int | None = None, turns_back: int = 0) -> int | None:
+        """
+        Ветка чата без копирования истории: в её начале - состояние чата turns_back ходов назад.
+        Ветка становится текущим чатом. Возвращает её id или None, если ветвить нечего.
+        """
+        if not isinstance(self.__checkpointer, SQLiteCheckpointSaver) or settings.CHECKPOINTER_BACKEND == "memory":
+            logger.warning("Chat forking requires the sqlite checkpointer backend")
+            return None
+        chat_id = chat_id or self.get_current_chat_id()
+        if self.__archive_service:
+            self.__archive_service.open_chat(chat_id=chat_id)
+        config = {"configurable": {"thread_id": f"{chat_id}", "checkpoint_ns": ""}}
+        if turns_back:
+            # Каждый ход начинается с чекпоинта source=input, его родитель - конец предыдущего хода
+            inputs = list(self.__checkpointer.list(config, filter={"source": "input"}, limit=turns_back))
+            if len(inputs) < turns_back or inputs[-1].parent_config is None:
+                logger.warning(f"Chat {chat_id} has less than {turns_back} turns to fork from")
+                return None
+            config = inputs[-1].parent_config
+
+        new_chat_id = self.__repository.get_next_id()
+        try:
+            fork_config = self.__checkpointer.fork_thread(config=config, thread_id=f"{new_chat_id}")
+        except ValueError as e:
+            logger.warning(f"Fork error: {e}")
+            return None
+
+        if self.__chat_summary_repository:
+            parent = self.__chat_summary_repository.get(chat_id=chat_id)
+            message_count, _ = self.__checkpointer.get_messages(config=fork_config, start=0, end=0)
+            self.__chat_summary_repository.record_turn(
+                chat_id=new_chat_id,
+                title=f"{parent.title if parent and parent.title else f'Чат {chat_id}'} (ветка)",
+                message_count=message_count,
+                media_bytes=0,
+            )
+        if self.__search_service:
+            self.__search_service.reindex_chat(chat_id=new_chat_id)
+        self.create_ai_agent(chat_id=new_chat_id)
+        return new_chat_id
+
+    def search_chats(self, query: str, limit: int = 20) -> list[SearchResult]:
+        if self.__search_service is None:
+            return []
+        return self.__search_service.search(query=query, limit=limit)
+
+    def send_message(self, message: list[dict[str, str]], use_cache: bool = False):
+        result = self.__ai_service.invoke(human_message=message, use_cache=use_cache)
         logger.info(f"send_message result: {result}")
         return result
 
-    def get_ai_chat(self, chat_id: int):
+    def submit_message(
+        self,
+        message: list[dict[str, str]],
+        on_delta: Callable[[str], None] | None = None,
+        use_cache: bool = False,
+    ) -> tuple[int, Future]:
+        """
+        Отправляет сообщение в текущий чат через AgentRuntime, не дожидаясь ответа.
+
+        Сервис чата берётся в момент вызова, поэтому переключение чата во время запроса
+        не влияет на то, куда уйдёт ответ. С on_delta ответ модели стримится по частям
+        (вызывается из потока рантайма). use_cache разрешает ответ из кэша одиночных запросов.
+        Возвращает id чата и Future с итоговым ответом.
+        """
+        ai_service = self.__ai_service
+        chat_id = ai_service.get_current_chat_id()
+        request = lambda: ai_service.astream(human_message=message, on_delta=on_delta, use_cache=use_cache)
+        future = self.__runtime.submit(chat_id=chat_id, request=request)
+        return chat_id, future
+
+    def sample_video(self, path: str, on_progress: Callable[[float], None] | None = None) -> list[dict]:
+        """Блоки сообщения с ключевыми кадрами видео вместо самого файла"""
+        frames = self.__video_sampler.sample(path=path, on_progress=on_progress)
+        return VideoSampler.to_content(name=os.path.basename(path), frames=frames)
+
+    def get_ai_chat(self, chat_id: int, limit: int | None = None) -> ChatPage:
         self.__ai_service = self.create_ai_agent(chat_id=chat_id)
-        result = self.__ai_service.get_chat_messages()
+        result = self.__ai_service.get_chat_messages(limit=limit)
         return result
 
+    def get_chat_messages(self, before: int | None = None, limit: int | None = None) -> ChatPage:
+        return self.__ai_service.get_chat_messages(before=before, limit=limit)
+
+    def resolve_media(self, handle: MediaHandle) -> str | None:
+        if handle.chat_id != self.__ai_service.get_current_chat_id():
+            logger.warning(f"Media handle of chat {handle.chat_id} requested while chat {self.get_current_chat_id()} is open")
+            return None
+        return self.__ai_service.resolve_media(handle=handle)
+
     def get_screenshot(self, coords: tuple) -> np.ndarray:
         result = self.__screenshot_service.take_screenshot(bbox=coords)
         return result
@@ -69,4 +245,9 @@ class Orchestration:
 
     def stop_all(self):
         self.stop_speach_service()
+        self.__runtime.stop()
+        # Состояние чатов из кэша уходит флашеру до его остановки
+        self.__agent_cache.clear()
+        if self.__flusher:
+            self.__flusher.shutdown()
 
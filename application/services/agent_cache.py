@@ -0,0 +1,80 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from application.services.ai_service import AIService
+from core.config.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class AgentCache:
+    """
+    LRU открытых чатов: повторное открытие недавнего чата не пересоздаёт AIService.
+
+    Вытесняются самые давние чаты сверх max_size; при вытеснении состояние чата
+    сохраняется через close(). Текущий (последний открытый) чат не вытесняется никогда.
+
+    max_bytes действует только в режиме CHECKPOINTER_BACKEND="memory", где сервис держит
+    всю историю чата (AIService.memory_usage). С SQLiteCheckpointSaver сервис истории
+    не хранит - граф и медиа общие для всех чатов, - и вытеснение идёт только по числу чатов.
+    """
+
+    def __init__(self, max_size: int = settings.AGENT_CACHE_SIZE, max_bytes: int = settings.AGENT_CACHE_MAX_BYTES):
+        self.max_size: int = max_size
+        self.max_bytes: int = max_bytes
+        self.__services: OrderedDict[int, AIService] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, chat_id: int) -> AIService | None:
+        with self.__lock:
+            service = self.__services.get(chat_id)
+            if service is not None:
+                self.__services.move_to_end(chat_id)
+            return service
+
+    def put(self, service: AIService):
+        with self.__lock:
+            self.__services[service.get_current_chat_id()] = service
+            self.__services.move_to_end(service.get_current_chat_id())
+            evicted = self.__take_evicted()
+        for chat_id, evicted_service in evicted:
+            self.__close(chat_id=chat_id, service=evicted_service)
+
+    def pop(self, chat_id: int) -> AIService | None:
+        with self.__lock:
+            return self.__services.pop(chat_id, None)
+
+    def clear(self):
+        with self.__lock:
+            evicted = list(self.__services.items())
+            self.__services.clear()
+        for chat_id, service in evicted:
+            self.__close(chat_id=chat_id, service=service)
+
+    def __take_evicted(self) -> list[tuple[int, AIService]]:
+        evicted = []
+        if self.max_size <= 0:
+            # Кэш выключен: держим только текущий чат
+            while len(self.__services) > 1:
+                evicted.append(self.__services.popitem(last=False))
+            return evicted
+        while len(self.__services) > self.max_size:
+            evicted.append(self.__services.popitem(last=False))
+        if self.max_bytes > 0 and len(self.__services) > 1:
+            sizes = {chat_id: service.memory_usage() for chat_id, service in self.__services.items()}
+            total = sum(sizes.values())
+            while total > self.max_bytes and len(self.__services) > 1:
+                chat_id, service = self.__services.popitem(last=False)
+                total -= sizes[chat_id]
+                evicted.append((chat_id, service))
+        return evicted
+
+    @staticmethod
+    def __close(chat_id: int, service: AIService):
+        try:
+            service.close()
+            logger.info(f"Chat {chat_id} evicted from agent cache")
+        except Exception as e:
+            logger.error(f"Agent cache eviction error for chat {chat_id}: {e}")
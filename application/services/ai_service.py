@@ -1,9 +1,26 @@
+import asyncio
 import logging
-from langchain_core.messages import SystemMessage
+from typing import Callable
+from langchain_core.messages import BaseMessage, SystemMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
 from application.interfaces.Irepository_bd_dict import IRepositoryDBDict
-from core.ai.ai_agent import model_factory, LLMAgent
+from application.interfaces.Irepository_chat_summary import IRepositoryChatSummary
+from application.services.media_service import MediaService
+from application.services.response_cache_service import ResponseCacheService
+from application.services.search_service import SearchService
+from core.ai.ai_agent import model_factory, shared_agent, LLMAgent
+from core.ai.checkpointer import SQLiteCheckpointSaver, prune_in_memory_saver
+from core.ai.context_window import context_window_factory
+from core.ai.conversation_digest import ConversationDigester
 from core.ai.db_dict import SQLAlchemyDBDict
+from core.config.config import settings
+from core.media.image_pipeline import ImagePipeline
+from core.repository.write_behind_flusher import WriteBehindFlusher
+from domain.entities.chat_page import ChatPage
+from domain.entities.media_handle import MediaHandle
 from domain.enums.ai_model import AIModels
+from domain.enums.content_media_type import ContentMediaType
 
 
 logger = logging.getLogger(__name__)
@@ -16,44 +33,289 @@ class AIService:
         model: AIModels = AIModels.GEMINI_2_0_FLASH,
         chat_id: str | int | None = None,
         system_prompt: str | list[str | dict] = "",
+        checkpointer: BaseCheckpointSaver | None = None,
+        flusher: WriteBehindFlusher | None = None,
+        media_service: MediaService | None = None,
+        chat_summary_repository: IRepositoryChatSummary | None = None,
+        search_service: SearchService | None = None,
+        response_cache: ResponseCacheService | None = None,
+        digester: ConversationDigester | None = None,
+        image_pipeline: ImagePipeline | None = None,
     ):
         logger.info(f"model: {model}")
         self.model = model_factory(model=model)
+        self.model_name: str = model.value
+        self.system_prompt: str | list[str | dict] = system_prompt
         self.repository = repository
+        self.media_service: MediaService | None = media_service
+        self.chat_summary_repository: IRepositoryChatSummary | None = chat_summary_repository
+        self.search_service: SearchService | None = search_service
+        self.response_cache: ResponseCacheService | None = response_cache
+        self.image_pipeline: ImagePipeline | None = image_pipeline
 
         system_message = SystemMessage(content=system_prompt)
-        self.default_dict_factory, self.next_id_record = SQLAlchemyDBDict.db_dict_factory(
-            record_id=chat_id, repository=self.repository
-        )
+        message_transformer = media_service.expand_messages if media_service else None
+        context_window = context_window_factory(model=model)
+        if checkpointer is None or settings.CHECKPOINTER_BACKEND == "memory":
+            # Старый режим: вся история чата в памяти, сохранение целыми pickle-колонками
+            self.default_dict_factory, self.next_id_record = SQLAlchemyDBDict.db_dict_factory(
+                record_id=chat_id, repository=self.repository, flusher=flusher
+            )
+            checkpointer = InMemorySaver(factory=self.default_dict_factory)
+            # У каждого чата свой InMemorySaver, граф компилируется под него
+            graph = None
+        else:
+            self.next_id_record = chat_id if chat_id else self.repository.get_next_id()
+            graph = shared_agent(
+                model=self.model,
+                checkpointer=checkpointer,
+                message_transformer=message_transformer,
+                context_window=context_window,
+                digester=digester,
+            )
+
         self._agent = LLMAgent(
-            default_dict_factory=self.default_dict_factory,
+            checkpointer=checkpointer,
             system_message=system_message,
             model=self.model,
             tools=[],
             chat_id=self.next_id_record,
+            message_transformer=message_transformer,
+            context_window=context_window,
+            digester=digester,
+            graph=graph,
         )
 
     def get_current_chat_id(self) -> int:
         return self.next_id_record
 
-    def get_chat_messages(self):
-        result = [
-            {i.type: i.content}
-            for i in self._agent.checkpointer.get(config=self._agent._config)
-            .get("channel_values", {})
-            .get("messages", [])
+    def get_chat_messages(self, before: int | None = None, limit: int | None = None) -> ChatPage:
+        """
+        Страница истории: limit сообщений, предшествующих индексу before (без before - самые новые).
+
+        Медиа в сообщениях заменяются на media_handle, данные отдаёт resolve_media.
+        С SQLiteCheckpointSaver из базы читаются только сообщения страницы, история целиком не хранится.
+        """
+        if before is None:
+            total, page = self.__read_messages(start=-limit if limit else None, end=None)
+            start = total - len(page)
+        else:
+            start = 0 if limit is None else max(0, before - limit)
+            total, page = self.__read_messages(start=start, end=before)
+        messages = [
+            {message.type: self.__with_media_handles(content=message.content, message_index=index)}
+            for index, message in enumerate(page, start)
         ]
+        return ChatPage(messages=messages, before=start if start > 0 else None)
+
+    def resolve_media(self, handle: MediaHandle) -> str | None:
+        """base64 медиа по handle из get_chat_messages"""
+        if handle.sha256:
+            return self.media_service.get_base64(sha256=handle.sha256) if self.media_service else None
+        _, page = self.__read_messages(start=handle.message_index, end=handle.message_index + 1)
+        try:
+            block = page[0].content[handle.block_index]
+        except (IndexError, TypeError, AttributeError):
+            logger.warning(f"Media handle not found: {handle}")
+            return None
+        if block.get("type") == ContentMediaType.IMAGE_URL.value:
+            return block["image_url"].split(";base64,", 1)[-1]
+        return block.get("data")
+
+    def memory_usage(self) -> int:
+        """
+        Примерный объём (байт) истории чата, которую сервис держит в памяти. Только для
+        InMemorySaver: SQLiteCheckpointSaver читает историю из базы, и в памяти сервиса её нет - 0
+        """
+        size = 0
+        checkpointer = self._agent.checkpointer
+        if isinstance(checkpointer, InMemorySaver):
+            size += sum(len(data) for _, data in checkpointer.blobs.values())
+            for namespaces in checkpointer.storage.values():
+                for checkpoints in namespaces.values():
+                    size += sum(len(checkpoint[1]) + len(metadata[1]) for checkpoint, metadata, _ in checkpoints.values())
+        return size
+
+    def close(self):
+        """Сохраняет состояние, вызывается при вытеснении из кэша чатов"""
+        self.__sync_legacy_state()
+
+    def __read_messages(self, start: int | None, end: int | None) -> tuple[int, list[BaseMessage]]:
+        """Срез [start:end] истории чата и число сообщений в ней"""
+        checkpointer = self._agent.checkpointer
+        if isinstance(checkpointer, SQLiteCheckpointSaver):
+            total, messages = checkpointer.get_messages(config=self._agent._config, start=start, end=end)
+            return total, list(messages)
+        # InMemorySaver и так держит всю историю чата в памяти
+        checkpoint = checkpointer.get(config=self._agent._config) or {}
+        messages = checkpoint.get("channel_values", {}).get("messages", [])
+        return len(messages), messages[start:end]
+
+    def __with_media_handles(self, content: list | str, message_index: int) -> list | str:
+        if not isinstance(content, list):
+            return content
+        result = []
+        for block_index, block in enumerate(content):
+            if not isinstance(block, dict):
+                result.append(block)
+                continue
+            block_type = block.get("type")
+            if block_type == ContentMediaType.MEDIA_REF.value:
+                mime_type, sha256 = block.get("mime_type"), block.get("sha256")
+            elif block_type == ContentMediaType.IMAGE_URL.value and isinstance(block.get("image_url"), str) \
+                    and block["image_url"].startswith("data:"):
+                mime_type, sha256 = block["image_url"][len("data:"):].split(";base64,", 1)[0], None
+            elif block_type == ContentMediaType.MEDIA.value:
+                mime_type, sha256 = block.get("mime_type"), None
+            else:
+                result.append(block)
+                continue
+            handle = MediaHandle(
+                chat_id=self.next_id_record,
+                message_index=message_index,
+                block_index=block_index,
+                mime_type=mime_type,
+                sha256=sha256,
+            )
+            result.append({"type": ContentMediaType.MEDIA_HANDLE.value, "handle": handle})
         return result
 
     def invoke(self,
-               human_message: list[dict[str, str]] = None
+               human_message: list[dict[str, str]] = None,
+               use_cache: bool = False,
                ):
+        """use_cache - разрешить ответ из ResponseCacheService (только для первого сообщения чата)"""
+        human_message = self.__prepare_images(human_message)
+        media_bytes = MediaService.media_bytes(human_message)
+        human_message = self.__to_refs(human_message)
+        try:
+            cache_key, answer = self.__cached_answer(human_message=human_message, use_cache=use_cache)
+            if answer is not None:
+                response = self._agent.append_turn(content=human_message, answer=answer)
+            else:
+                response = self._agent.invoke(
+                    content=human_message,
+                    temperature=0.1
+                )
+                self.__cache_answer(cache_key=cache_key, response=response)
+            logger.info(f"Последнее сообщение: {response}")
+            self.__after_turn(human_message=human_message, response=response, media_bytes=media_bytes)
+            return response
+        finally:
+            self.__finish_turn()
+
+    async def ainvoke(self,
+                      human_message: list[dict[str, str]] = None,
+                      use_cache: bool = False,
+                      ):
+        """То же, что invoke, для AgentRuntime: запросы к базе - в пуле потоков"""
+        return await self.astream(human_message=human_message, on_delta=None, use_cache=use_cache)
+
+    async def astream(self,
+                      human_message: list[dict[str, str]],
+                      on_delta: Callable[[str], None] | None,
+                      use_cache: bool = False,
+                      ):
+        """То же, что invoke, но текст ответа по мере генерации уходит в on_delta (если задан)"""
+        human_message = await asyncio.to_thread(self.__prepare_images, human_message)
+        media_bytes = MediaService.media_bytes(human_message)
+        human_message = await asyncio.to_thread(self.__to_refs, human_message)
         try:
-            response = self._agent.invoke(
-                content=human_message,
-                temperature=0.1
+            cache_key, answer = await asyncio.to_thread(
+                self.__cached_answer, human_message=human_message, use_cache=use_cache
             )
+            if answer is not None:
+                response = await self._agent.aappend_turn(content=human_message, answer=answer)
+                if on_delta:
+                    on_delta(SearchService.message_text(answer))
+            elif on_delta:
+                response = await self._agent.astream(
+                    content=human_message,
+                    on_delta=on_delta,
+                    temperature=0.1
+                )
+            else:
+                response = await self._agent.ainvoke(
+                    content=human_message,
+                    temperature=0.1
+                )
+            if answer is None:
+                await asyncio.to_thread(self.__cache_answer, cache_key=cache_key, response=response)
             logger.info(f"Последнее сообщение: {response}")
+            await asyncio.to_thread(
+                self.__after_turn, human_message=human_message, response=response, media_bytes=media_bytes
+            )
             return response
         finally:
-            self._agent.checkpointer.stack.close()
\ No newline at end of file
+            await asyncio.to_thread(self.__finish_turn)
+
+    def __cached_answer(self, human_message: list[dict[str, str]] | str, use_cache: bool) -> tuple[str | None, list | str | None]:
+        """Ключ кэша и ответ из него; без ключа, если кэш не разрешён или у чата уже есть история"""
+        if not use_cache or self.response_cache is None or self.__read_messages(start=0, end=0)[0]:
+            return None, None
+        cache_key = ResponseCacheService.key(
+            model=self.model_name, system_prompt=self.system_prompt, content=human_message
+        )
+        answer = self.response_cache.get(key=cache_key)
+        if answer is not None:
+            logger.info(f"Response cache hit for chat {self.next_id_record}")
+        return cache_key, answer
+
+    def __cache_answer(self, cache_key: str | None, response: list[dict]):
+        if cache_key is None or not response or not response[-1].get("ai"):
+            return
+        self.response_cache.put(key=cache_key, model=self.model_name, answer=response[-1]["ai"])
+
+    def __prepare_images(self, human_message: list[dict[str, str]] | str) -> list[dict[str, str]] | str:
+        if self.image_pipeline:
+            # Уменьшение и перекодирование до сохранения: в историю и в запрос уходит уже лёгкая версия
+            return self.image_pipeline.process_content(human_message)
+        return human_message
+
+    def __to_refs(self, human_message: list[dict[str, str]] | str) -> list[dict[str, str]] | str:
+        if self.media_service:
+            # В историю попадают только ссылки на медиа, сами байты - один раз в media_blob
+            return self.media_service.to_refs(human_message)
+        return human_message
+
+    def __after_turn(self, human_message: list[dict[str, str]] | str, response: list[dict], media_bytes: int):
+        self.__record_summary(human_message=human_message, media_bytes=media_bytes)
+        if self.search_service:
+            self.search_service.index_turn(
+                chat_id=self.next_id_record,
+                human_message=human_message,
+                response=response,
+                message_count=self._agent.message_count,
+            )
+
+    def __finish_turn(self):
+        self.__sync_legacy_state()
+
+    def __record_summary(self, human_message: list[dict[str, str]] | str, media_bytes: int):
+        """Обновляет строку chat_summary для списка чатов"""
+        if self.chat_summary_repository is None:
+            return
+        if isinstance(human_message, str):
+            title = human_message
+        else:
+            title = next(
+                (block.get("text") for block in human_message or [] if isinstance(block, dict) and block.get("text")),
+                None,
+            )
+        try:
+            self.chat_summary_repository.record_turn(
+                chat_id=self.next_id_record,
+                title=" ".join(title.split())[:80] if title else None,
+                message_count=self._agent.message_count,
+                media_bytes=media_bytes,
+            )
+        except Exception as e:
+            logger.error(f"Chat summary error: {e}")
+
+    def __sync_legacy_state(self):
+        """SQLiteCheckpointSaver пишет сразу в put, синхронизация нужна только InMemorySaver"""
+        checkpointer = self._agent.checkpointer
+        if isinstance(checkpointer, InMemorySaver):
+            prune_in_memory_saver(checkpointer)
+            for db_dict in (checkpointer.storage, checkpointer.writes, checkpointer.blobs):
+                db_dict.sync_data()
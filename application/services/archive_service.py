@@ -0,0 +1,64 @@
+import logging
+import threading
+import time
+
+from application.interfaces.Irepository_archive import IRepositoryArchive
+from core.config.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveService:
+    """Уводит давно не открывавшиеся чаты в архив и прозрачно поднимает их при открытии"""
+
+    def __init__(self, repository: IRepositoryArchive, after_days: float = settings.ARCHIVE_AFTER_DAYS):
+        self.__repository: IRepositoryArchive = repository
+        self.__after_days: float = after_days
+        self.__in_use: set[int] = set()
+        self.__lock = threading.Lock()
+        self.__thread: threading.Thread | None = None
+
+    def open_chat(self, chat_id: int):
+        """Отмечает чат открытым (такие не архивируются) и возвращает его из архива, если нужно"""
+        with self.__lock:
+            self.__in_use.add(chat_id)
+        try:
+            self.__repository.rehydrate(chat_id=chat_id)
+        except Exception as e:
+            logger.error(f"Rehydrate error for chat {chat_id}: {e}")
+
+    def start(self):
+        """Один проход архивации в фоне при запуске, ARCHIVE_AFTER_DAYS <= 0 - архивация выключена"""
+        if self.__after_days <= 0 or self.__thread is not None:
+            return
+        self.__thread = threading.Thread(target=self.run_once, name="ChatArchiver", daemon=True)
+        self.__thread.start()
+
+    def run_once(self) -> int:
+        older_than = time.time() - self.__after_days * 86400
+        archived = 0
+        skipped: set[int] = set()
+        while True:
+            chat_ids = [
+                chat_id for chat_id in self.__repository.stale_chats(older_than=older_than, limit=len(skipped) + 50)
+                if chat_id not in skipped
+            ]
+            if not chat_ids:
+                break
+            for chat_id in chat_ids:
+                # Блокировка держится на время архивации, чтобы open_chat не открыл чат посередине
+                with self.__lock:
+                    if chat_id in self.__in_use:
+                        skipped.add(chat_id)
+                        continue
+                    try:
+                        if self.__repository.archive_chat(chat_id=chat_id):
+                            archived += 1
+                        else:
+                            skipped.add(chat_id)
+                    except Exception as e:
+                        logger.error(f"Archive error for chat {chat_id}: {e}")
+                        skipped.add(chat_id)
+        logger.info(f"Archive pass finished, chats archived: {archived}")
+        return archived
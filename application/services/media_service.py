@@ -0,0 +1,138 @@
+import base64
+import logging
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import BaseMessage
+
+from application.interfaces.Irepository_media import IRepositoryMedia
+from domain.enums.content_media_type import ContentMediaType
+
+
+logger = logging.getLogger(__name__)
+
+
+class MediaService:
+    """
+    Вынос медиафайлов из сообщений в RepositoryMedia.
+
+    В истории чата остаются только ссылки {"type": "media_ref", "sha256": ...},
+    данные подставляются обратно лишь при сборке запроса к модели.
+    """
+
+    def __init__(self, repository: IRepositoryMedia, cache_size: int = 16):
+        self.__repository: IRepositoryMedia = repository
+        self.__cache_size = cache_size
+        # sha256 -> base64, содержимое по хешу неизменно, поэтому кэш не устаревает
+        self.__cache: OrderedDict[str, str] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def to_refs(self, content: list[dict] | str) -> list[dict] | str:
+        """Заменяет встроенные base64 медиа ссылками на media_blob"""
+        if not isinstance(content, list):
+            return content
+        result = []
+        for block in content:
+            try:
+                result.append(self.__to_ref(block) or block)
+            except Exception as e:
+                logger.error(f"Media ref error: {e}")
+                result.append(block)
+        return result
+
+    def expand_messages(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Копии сообщений со встроенными данными вместо ссылок, сама история не меняется"""
+        result = []
+        for message in messages:
+            if isinstance(message.content, list) and any(self.is_ref(block) for block in message.content):
+                message = message.model_copy(
+                    update={"content": [self.__expand_block(block) for block in message.content]}
+                )
+            result.append(message)
+        return result
+
+    def get_base64(self, sha256: str) -> str | None:
+        with self.__lock:
+            if sha256 in self.__cache:
+                self.__cache.move_to_end(sha256)
+                return self.__cache[sha256]
+
+        media = self.__repository.get(sha256=sha256)
+        if media is None:
+            logger.warning(f"Media {sha256} not found")
+            return None
+        base64_data = base64.b64encode(media.data).decode("utf-8")
+        self.__remember(sha256=sha256, base64_data=base64_data)
+        return base64_data
+
+    @staticmethod
+    def media_bytes(content: list[dict] | str) -> int:
+        """Примерный размер встроенных в сообщение медиа в байтах"""
+        if not isinstance(content, list):
+            return 0
+        size = 0
+        for block in content:
+            if not isinstance(block, dict):
+                continue
+            if block.get("type") == ContentMediaType.IMAGE_URL.value and isinstance(block.get("image_url"), str):
+                size += len(block["image_url"].split(";base64,", 1)[-1]) * 3 // 4
+            elif block.get("type") == ContentMediaType.MEDIA.value and block.get("data"):
+                size += len(block["data"]) * 3 // 4
+        return size
+
+    @staticmethod
+    def is_ref(block) -> bool:
+        return isinstance(block, dict) and block.get("type") == ContentMediaType.MEDIA_REF.value
+
+    def __to_ref(self, block) -> dict | None:
+        if not isinstance(block, dict):
+            return None
+        block_type = block.get("type")
+        if block_type == ContentMediaType.IMAGE_URL.value:
+            image_url = block.get("image_url")
+            if isinstance(image_url, dict):
+                image_url = image_url.get("url")
+            if not isinstance(image_url, str) or not image_url.startswith("data:") or ";base64," not in image_url:
+                # Внешние ссылки оставляем как есть
+                return None
+            mime_type, base64_data = image_url[len("data:"):].split(";base64,", 1)
+        elif block_type == ContentMediaType.MEDIA.value and block.get("data"):
+            mime_type, base64_data = block.get("mime_type"), block["data"]
+        else:
+            return None
+
+        data = base64.b64decode(base64_data)
+        sha256 = self.__repository.put(data=data, mime_type=mime_type)
+        self.__remember(sha256=sha256, base64_data=base64_data)
+        return {
+            "type": ContentMediaType.MEDIA_REF.value,
+            "sha256": sha256,
+            "mime_type": mime_type,
+            "block_type": block_type,
+            # Размер нужен для оценки токенов аудио и видео без чтения самих данных
+            "size": len(data),
+        }
+
+    def __remember(self, sha256: str, base64_data: str):
+        with self.__lock:
+            self.__cache[sha256] = base64_data
+            self.__cache.move_to_end(sha256)
+            while len(self.__cache) > self.__cache_size:
+                self.__cache.popitem(last=False)
+
+    def __expand_block(self, block):
+        if not self.is_ref(block):
+            return block
+        base64_data = self.get_base64(sha256=block["sha256"])
+        if base64_data is None:
+            return {"type": ContentMediaType.TEXT.value, "text": "[медиафайл недоступен]"}
+        if block.get("block_type") == ContentMediaType.IMAGE_URL.value:
+            return {
+                "type": ContentMediaType.IMAGE_URL.value,
+                "image_url": f"data:{block['mime_type']};base64,{base64_data}",
+            }
+        return {
+            "type": ContentMediaType.MEDIA.value,
+            "data": base64_data,
+            "mime_type": block["mime_type"],
+        }
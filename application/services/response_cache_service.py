@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import json
+import logging
+
+from application.interfaces.Irepository_response_cache import IRepositoryResponseCache
+from core.config.config import settings
+from domain.enums.content_media_type import ContentMediaType
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCacheService:
+    """
+    Кэш ответов модели на одиночные запросы (быстрые действия со скриншотами).
+
+    Ключ - хеш модели, системного промпта, нормализованного текста и байтов медиа.
+    Ответ зависит только от ключа лишь без истории, поэтому AIService обращается
+    к кэшу только для первого сообщения чата и только если запрос явно это разрешил.
+    """
+
+    def __init__(
+        self,
+        repository: IRepositoryResponseCache,
+        ttl: float = settings.RESPONSE_CACHE_TTL,
+        max_bytes: int = settings.RESPONSE_CACHE_MAX_BYTES,
+    ):
+        self.__repository: IRepositoryResponseCache = repository
+        self.__ttl: float = ttl
+        self.__max_bytes: int = max_bytes
+
+    @classmethod
+    def key(cls, model: str, system_prompt: str | list, content: list[dict] | str) -> str:
+        normalized = {
+            "model": model,
+            "system": cls.__normalize(system_prompt),
+            "content": cls.__normalize(content),
+        }
+        return hashlib.sha256(json.dumps(normalized, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | list | None:
+        try:
+            return self.__repository.get(key=key, ttl=self.__ttl)
+        except Exception as e:
+            logger.error(f"Response cache read error: {e}")
+            return None
+
+    def put(self, key: str, model: str, answer: str | list):
+        try:
+            self.__repository.put(key=key, model=model, response=answer, max_bytes=self.__max_bytes)
+        except Exception as e:
+            logger.error(f"Response cache write error: {e}")
+
+    @classmethod
+    def __normalize(cls, content: list | dict | str) -> list | str:
+        if isinstance(content, str):
+            return " ".join(content.split())
+        if isinstance(content, dict):
+            return cls.__normalize_block(content)
+        return [cls.__normalize(block) for block in content]
+
+    @classmethod
+    def __normalize_block(cls, block: dict) -> dict | str:
+        block_type = block.get("type")
+        # Медиа - по хешу байтов: одно и то же изображение из буфера и из файла даёт один ключ
+        if block_type == ContentMediaType.MEDIA_REF.value:
+            return {"media": block["sha256"]}
+        if block_type == ContentMediaType.IMAGE_URL.value:
+            image_url = block.get("image_url")
+            if isinstance(image_url, dict):
+                image_url = image_url.get("url")
+            if isinstance(image_url, str) and image_url.startswith("data:") and ";base64," in image_url:
+                return {"media": cls.__media_hash(image_url.split(";base64,", 1)[1])}
+            return {"image_url": image_url}
+        if block_type == ContentMediaType.MEDIA.value and block.get("data"):
+            return {"media": cls.__media_hash(block["data"])}
+        if block_type == ContentMediaType.TEXT.value:
+            return cls.__normalize(block.get("text", ""))
+        return json.dumps(block, ensure_ascii=False, sort_keys=True, default=str)
+
+    @staticmethod
+    def __media_hash(base64_data: str) -> str:
+        return hashlib.sha256(base64.b64decode(base64_data)).hexdigest()
@@ -0,0 +1,117 @@
+import logging
+import queue
+import threading
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from application.interfaces.Irepository_search import IRepositorySearch
+from domain.entities.search_result import SearchResult
+
+
+logger = logging.getLogger(__name__)
+
+
+class SearchService:
+    """
+    Полнотекстовый поиск по истории: индексация новых ходов и фоновая индексация старых чатов.
+
+    Ход, который нельзя просто дописать в индекс (вызовы инструментов, ответ из кэша,
+    обрезка истории в режиме "history"), ставит чат в очередь на полную переиндексацию.
+    """
+
+    def __init__(self, repository: IRepositorySearch, checkpointer: BaseCheckpointSaver | None = None):
+        self.__repository: IRepositorySearch = repository
+        self.__checkpointer: BaseCheckpointSaver | None = checkpointer
+        self.__backfill_thread: threading.Thread | None = None
+        self.__reindex_queue: queue.Queue[int] = queue.Queue()
+        self.__reindex_pending: set[int] = set()
+        self.__reindex_thread: threading.Thread | None = None
+        self.__lock = threading.Lock()
+
+    def index_turn(self, chat_id: int, human_message: list[dict] | str, response: list[dict], message_count: int):
+        messages = [("human", self.message_text(human_message))]
+        for message in response:
+            for role, content in message.items():
+                if role != "human":
+                    messages.append((role, self.message_text(content)))
+        try:
+            if not self.__repository.index_turn(chat_id=chat_id, messages=messages, message_count=message_count):
+                logger.info(f"Chat {chat_id} index is out of sync, scheduled for reindex")
+                self.schedule_reindex(chat_id=chat_id)
+        except Exception as e:
+            logger.error(f"Search index error: {e}")
+
+    def schedule_reindex(self, chat_id: int):
+        """Переиндексирует чат в фоне; повторный запрос до окончания переиндексации ничего не делает"""
+        if self.__checkpointer is None:
+            return
+        with self.__lock:
+            if chat_id in self.__reindex_pending:
+                return
+            self.__reindex_pending.add(chat_id)
+            if self.__reindex_thread is None:
+                self.__reindex_thread = threading.Thread(target=self.__reindex_loop, name="SearchReindexer", daemon=True)
+                self.__reindex_thread.start()
+        self.__reindex_queue.put(chat_id)
+
+    def __reindex_loop(self):
+        while True:
+            chat_id = self.__reindex_queue.get()
+            # Снимается до чтения истории: ход, записанный во время переиндексации, снова поставит чат в очередь
+            with self.__lock:
+                self.__reindex_pending.discard(chat_id)
+            self.reindex_chat(chat_id=chat_id)
+
+    def search(self, query: str, limit: int = 20) -> list[SearchResult]:
+        return self.__repository.search(query=query, limit=limit)
+
+    def start_backfill(self):
+        """Индексирует чаты из старой базы в фоне, запуск приложения не ждёт"""
+        if self.__checkpointer is None or self.__backfill_thread is not None:
+            return
+        self.__backfill_thread = threading.Thread(target=self.__backfill, name="SearchBackfill", daemon=True)
+        self.__backfill_thread.start()
+
+    def __backfill(self):
+        processed: set[int] = set()
+        indexed = 0
+        while True:
+            chat_ids = [
+                chat_id for chat_id in self.__repository.chats_to_backfill(limit=len(processed) + 50)
+                if chat_id not in processed
+            ]
+            if not chat_ids:
+                break
+            for chat_id in chat_ids:
+                processed.add(chat_id)
+                if self.reindex_chat(chat_id=chat_id):
+                    indexed += 1
+        logger.info(f"Search backfill finished, chats indexed: {indexed}")
+
+    def reindex_chat(self, chat_id: int) -> bool:
+        """Индексирует чат заново по его последнему чекпоинту"""
+        if self.__checkpointer is None:
+            return False
+        try:
+            checkpoint = self.__checkpointer.get({"configurable": {"thread_id": f"{chat_id}"}}) or {}
+            messages = checkpoint.get("channel_values", {}).get("messages", [])
+            self.__repository.reindex_chat(
+                chat_id=chat_id,
+                messages=[(message.type, self.message_text(message.content)) for message in messages],
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Search reindex error for chat {chat_id}: {e}")
+            return False
+
+    @staticmethod
+    def message_text(content: list[dict] | str) -> str:
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return "\n".join(
+                block if isinstance(block, str) else block.get("text", "")
+                for block in content
+                if isinstance(block, str) or (isinstance(block, dict) and block.get("type") == "text")
+            )
+        return ""
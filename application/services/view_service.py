@@ -1,14 +1,21 @@
 import base64
 import io
 import logging
+import os
 import threading
+from concurrent.futures import Future
 from typing import Callable
 
 import numpy as np
 from PIL import Image, ImageTk
 
 from application.orchestration import Orchestration
+from core.config.config import settings
 from core.event_dispatcher import dispatcher
+from domain.entities.chat_page import ChatPage
+from domain.entities.chat_summary import ChatSummary
+from domain.entities.media_handle import MediaHandle
+from domain.entities.search_result import SearchResult
 from domain.enums.signal import Signal
 from domain.enums.status_statusbar import Status
 
@@ -19,40 +26,90 @@ logger = logging.getLogger(__name__)
 class ViewService(object):
     def __init__(self, orchestrator: Orchestration):
         self.orchestrator: Orchestration = orchestrator
+        self.__pending_requests: int = 0
+        self.__pending_lock = threading.Lock()
 
     def get_chat_list(self) -> dict:
         result = {id: message for (id, message) in self.orchestrator.get_list_chats()}
         return result
 
+    def get_chat_page(self, limit: int = 50, before: tuple[float, int] | None = None) -> list[ChatSummary]:
+        return self.orchestrator.get_chat_page(limit=limit, before=before)
+
+    def get_chat_summary(self, chat_id: int) -> ChatSummary | None:
+        return self.orchestrator.get_chat_summary(chat_id=chat_id)
+
+    def search_chats(self, query: str, limit: int = 20) -> list[SearchResult]:
+        return self.orchestrator.search_chats(query=query, limit=limit)
+
+    def get_current_chat_id(self) -> int:
+        return self.orchestrator.get_current_chat_id()
+
     def create_new_chat(self) -> int:
         self.orchestrator.create_ai_agent()
         return self.orchestrator.get_current_chat_id()
 
-    def get_chat(self, chat_id: int):
-        record = self.orchestrator.get_ai_chat(chat_id=chat_id)
+    def fork_chat(self, chat_id: int, turns_back: int = 0) -> int | None:
+        return self.orchestrator.fork_chat(chat_id=chat_id, turns_back=turns_back)
+
+    def get_chat(self, chat_id: int, limit: int | None = None) -> ChatPage:
+        record = self.orchestrator.get_ai_chat(chat_id=chat_id, limit=limit)
         return record
 
-    def __send_message_thread(self, message: list[dict[str, str]], callback: Callable):
+    def get_older_messages(self, before: int, limit: int | None = None) -> ChatPage:
+        return self.orchestrator.get_chat_messages(before=before, limit=limit)
+
+    def resolve_media(self, handle: MediaHandle) -> str | None:
+        return self.orchestrator.resolve_media(handle=handle)
+
+    def send_message(
+        self,
+        message: list[dict[str, str]],
+        callback: Callable,
+        on_delta: Callable | None = None,
+        use_cache: bool = False,
+    ) -> int:
+        """
+        Ставит сообщение в очередь AgentRuntime. Запросы разных чатов идут параллельно,
+        callback вызывается из потока рантайма с ответом и id чата, которому он принадлежит,
+        окно само переносит его в поток Tk (after), как и для sample_video.
+        on_delta(delta=..., chat_id=...) получает текст ответа по мере генерации,
+        use_cache разрешает ответ из кэша для первого сообщения чата.
+        Возвращает id чата, в который ушло сообщение.
+        """
+        with self.__pending_lock:
+            self.__pending_requests += 1
+        dispatcher.send(signal=Signal.set_status, status=Status.WAITING_AGENT_RESPONSE)
+        chat_id = self.orchestrator.get_current_chat_id()
+        chat_id, future = self.orchestrator.submit_message(
+            message=message,
+            on_delta=(lambda delta: on_delta(delta=delta, chat_id=chat_id)) if on_delta else None,
+            use_cache=use_cache,
+        )
+        future.add_done_callback(
+            lambda done: self.__on_message_done(future=done, chat_id=chat_id, callback=callback)
+        )
+        return chat_id
+
+    def __on_message_done(self, future: Future, chat_id: int, callback: Callable):
+        with self.__pending_lock:
+            self.__pending_requests -= 1
+            pending = self.__pending_requests
         try:
-            response = self.orchestrator.send_message(message=message)
-            callback(messages=response)
-            dispatcher.send(signal=Signal.set_status, status=Status.IDLE)
+            response = future.result()
+        except Exception as e:
+            logger.critical(f"received exception: {e}")
+            dispatcher.send(signal=Signal.set_status, status=Status.ERROR)
+            # Окну нужно убрать начатый стримом ответ; поле ввода при ошибке не очищается
+            callback(messages=[], chat_id=chat_id, error=e)
+            return
+        try:
+            callback(messages=response, chat_id=chat_id)
+            if not pending:
+                dispatcher.send(signal=Signal.set_status, status=Status.IDLE)
         except Exception as e:
             logger.critical(f"received exception: {e}")
             dispatcher.send(signal=Signal.set_status, status=Status.ERROR)
-        finally:
-            pass
-
-    def send_message(self, message: list[dict[str, str]], callback: Callable):
-        dispatcher.send(signal=Signal.set_status, status=Status.WAITING_AGENT_RESPONSE)
-        threading.Thread(
-            target=self.__send_message_thread,
-            kwargs={
-                "message":message,
-                "callback": callback
-            },
-            daemon=True
-        ).start()
 
     def get_screenshot(self, coords: tuple) -> np.ndarray:
         result = self.orchestrator.get_screenshot(coords=coords)
@@ -63,12 +120,38 @@ class ViewService(object):
         self.coords = coords
 
     def start_record_audio(self):
-        return self.orchestrator.asr_service.real_time_asr.start_recording_audio()
+        return self.orchestrator.asr_service.real_time_asr.start_recording_audio(encode=True)
 
-    def stop_record_audio(self):
+    def stop_record_audio(self) -> tuple[str, str]:
+        """base64 и mime_type записи (OGG/Opus, FLAC или WAV - смотря что доступно)"""
         buffer = self.orchestrator.asr_service.real_time_asr.stop_recording_audio()
-        base64_wav_audio = self.orchestrator.asr_service.real_time_asr.convert_to_wav_base64(audio_array=buffer)
-        return base64_wav_audio
+        return self.orchestrator.asr_service.real_time_asr.take_recorded_audio(audio_array=buffer)
+
+    def needs_video_sampling(self, path: str) -> bool:
+        """Видео больше VIDEO_INLINE_MAX_BYTES отправляется ключевыми кадрами, см. sample_video"""
+        return os.path.getsize(path) > settings.VIDEO_INLINE_MAX_BYTES
+
+    def sample_video(self, path: str, callback: Callable):
+        """
+        Готовит ключевые кадры видео в фоновом потоке, прогресс - в статус-баре.
+        callback(content=..., error=...) вызывается из этого потока.
+        """
+        def on_progress(progress: float):
+            dispatcher.send(signal=Signal.set_status, status=Status.PROCESSING_VIDEO, detail=f"{progress:.0%}")
+
+        def run():
+            try:
+                content = self.orchestrator.sample_video(path=path, on_progress=on_progress)
+            except Exception as e:
+                logger.error(f"Video sampling error: {e}")
+                dispatcher.send(signal=Signal.set_status, status=Status.ERROR)
+                callback(content=None, error=e)
+                return
+            dispatcher.send(signal=Signal.set_status, status=Status.FINISHED_VIDEO)
+            callback(content=content)
+
+        dispatcher.send(signal=Signal.set_status, status=Status.PROCESSING_VIDEO)
+        threading.Thread(target=run, name="VideoSampler", daemon=True).start()
 
     def base64_to_image(self, base64_string, max_width=300, max_height=200):
         """Конвертирует base64 строку в ImageTk.PhotoImage с ограничением размера"""
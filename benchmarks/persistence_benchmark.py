@@ -0,0 +1,263 @@
+"""
+Бенчмарк слоя хранения чатов на синтетических данных.
+
+Генерирует chats чатов по messages сообщений (медиа размером media_size байт в каждом
+media_every-м сообщении пользователя) во временном файле SQLite и меряет загрузку чата,
+синхронизацию, ход диалога, список чатов и get_next_id для обоих режимов хранения:
+memory (InMemorySaver поверх SQLAlchemyDBDict) и sqlite (SQLiteCheckpointSaver).
+Модель - FakeListChatModel, сеть не нужна. Результат - JSON для сравнения между изменениями:
+
+    python -m benchmarks.persistence_benchmark --chats 50 --messages 400 --media-size 200000 -o before.json
+"""
+import argparse
+import base64
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver, empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+
+from core.ai.ai_agent import LLMAgent
+from core.ai.checkpointer import SQLiteCheckpointSaver
+from core.ai.db_dict import SQLAlchemyDBDict
+from core.repository.models.ai_state_model import AIStateModel
+from core.repository.repository_bd_dict import RepositoryDBDict
+from core.repository.repository_chat_summary import RepositoryChatSummary
+from core.repository.repository_checkpoint import RepositoryCheckpoint
+from core.repository.sqlite_session import SQLiteDatabaseSession
+
+
+logger = logging.getLogger(__name__)
+
+
+RESOURCE_AVAILABLE = False
+
+try:
+    # Только Unix; на Windows пиковая память берётся из psutil, если он установлен
+    import resource
+
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    pass
+
+
+BACKENDS = ("memory", "sqlite")
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """Статистика по замерам в миллисекундах"""
+    ordered = sorted(samples)
+    return {
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int) -> dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def peak_rss_kb() -> int | None:
+    """Пиковая память процесса в КБ или None, если платформа её не сообщает"""
+    if RESOURCE_AVAILABLE:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # На macOS ru_maxrss в байтах, на Linux - в килобайтах
+        return peak // 1024 if platform.system() == "Darwin" else peak
+    try:
+        import psutil
+    except ImportError:
+        return None
+    # peak_wset есть только на Windows
+    peak = getattr(psutil.Process().memory_info(), "peak_wset", None)
+    return peak // 1024 if peak is not None else None
+
+
+def written_bytes() -> int | None:
+    """Байты, переданные процессом в write() (Linux), включая WAL"""
+    try:
+        with open("/proc/self/io") as file:
+            for line in file:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def database_size(db_path: Path) -> int:
+    return sum(
+        path.stat().st_size
+        for path in (db_path, db_path.with_name(db_path.name + "-wal"))
+        if path.exists()
+    )
+
+
+def synthetic_messages(messages: int, media_size: int, media_every: int) -> list:
+    media = base64.b64encode(os.urandom(media_size)).decode("utf-8") if media_size else None
+    result = []
+    for index in range(messages):
+        text = f"Synthetic message {index}. " + "lorem ipsum dolor sit amet " * 20
+        if index % 2:
+            result.append(AIMessage(content=text))
+        elif media and (index // 2) % media_every == 0:
+            result.append(HumanMessage(content=[
+                {"type": "text", "text": text},
+                {"type": "image_url", "image_url": f"data:image/png;base64,{media}"},
+            ]))
+        else:
+            result.append(HumanMessage(content=text))
+    return result
+
+
+def seed_chat(checkpointer: BaseCheckpointSaver, chat_id: int, messages: list):
+    """Один чекпоинт с готовой историей, как после импорта"""
+    version = checkpointer.get_next_version(None, None)
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": messages}
+    checkpoint["channel_versions"] = {"messages": version}
+    checkpointer.put(
+        {"configurable": {"thread_id": str(chat_id), "checkpoint_ns": ""}},
+        checkpoint,
+        {"source": "input", "step": -1, "parents": {}},
+        {"messages": version},
+    )
+
+
+class PersistenceBenchmark:
+    def __init__(self, args: argparse.Namespace, db_path: Path):
+        self.args = args
+        self.db_path = db_path
+        self.database = SQLiteDatabaseSession(db_url=f"sqlite+pysqlite:///{db_path}")
+        self.repository = RepositoryDBDict(database=self.database)
+        self.chat_summary_repository = RepositoryChatSummary(database=self.database)
+        # Без retention: замеряется рост истории, а не политика хранения
+        self.checkpointer = SQLiteCheckpointSaver(repository=RepositoryCheckpoint(database=self.database), retention=0)
+
+    def run(self, backend: str) -> dict:
+        result = {"backend": backend}
+        started = time.perf_counter()
+        size_before = database_size(self.db_path)
+        for chat_id in range(1, self.args.chats + 1):
+            messages = synthetic_messages(
+                messages=self.args.messages, media_size=self.args.media_size, media_every=self.args.media_every
+            )
+            if backend == "memory":
+                saver = self.__memory_saver(chat_id=chat_id)
+                seed_chat(checkpointer=saver, chat_id=chat_id, messages=messages)
+                self.__sync(saver)
+            else:
+                seed_chat(checkpointer=self.checkpointer, chat_id=chat_id, messages=messages)
+            self.chat_summary_repository.record_turn(
+                chat_id=chat_id, title=f"chat {chat_id}", message_count=len(messages), media_bytes=0
+            )
+        result["seed_s"] = round(time.perf_counter() - started, 3)
+        result["database_bytes"] = database_size(self.db_path) - size_before
+        result["peak_rss_kb_after_seed"] = peak_rss_kb()
+
+        chat_id = self.args.chats
+        config = {"configurable": {"thread_id": str(chat_id), "checkpoint_ns": ""}}
+        if backend == "memory":
+            result["load"] = measure(lambda: self.__memory_saver(chat_id=chat_id).get_tuple(config), self.args.repeat)
+            saver = self.__memory_saver(chat_id=chat_id)
+            # Без изменений: sync_data всё равно сериализует колонки и сравнивает с базой
+            result["sync"] = measure(lambda: self.__sync(saver), self.args.repeat)
+        else:
+            result["load"] = measure(lambda: self.checkpointer.get_tuple(config), self.args.repeat)
+        result["peak_rss_kb_after_load"] = peak_rss_kb()
+
+        result["turn"] = self.__turns(backend=backend, chat_id=chat_id)
+        result["list_chats"] = measure(self.repository.get_list_chats, self.args.repeat)
+        result["list_chat_page"] = measure(lambda: self.chat_summary_repository.list_page(limit=50), self.args.repeat)
+        result["get_next_id"] = measure(lambda: self.database.get_next_id(model=AIStateModel), self.args.repeat)
+        result["peak_rss_kb"] = peak_rss_kb()
+        return result
+
+    def __turns(self, backend: str, chat_id: int) -> dict:
+        saver = self.__memory_saver(chat_id=chat_id) if backend == "memory" else self.checkpointer
+        agent = LLMAgent(
+            model=FakeListChatModel(responses=["synthetic answer " * 20]),
+            tools=[],
+            system_message=SystemMessage(content=""),
+            chat_id=chat_id,
+            checkpointer=saver,
+        )
+        samples, written, grown = [], [], []
+        for index in range(self.args.turns):
+            wchar_before, size_before = written_bytes(), database_size(self.db_path)
+            started = time.perf_counter()
+            agent.invoke(f"synthetic turn {index}")
+            if backend == "memory":
+                self.__sync(saver)
+            samples.append(time.perf_counter() - started)
+            if wchar_before is not None:
+                written.append(written_bytes() - wchar_before)
+            grown.append(database_size(self.db_path) - size_before)
+        result = summarize(samples)
+        result["bytes_written_per_turn"] = int(statistics.median(written)) if written else None
+        result["database_growth_per_turn"] = int(statistics.median(grown))
+        return result
+
+    def __memory_saver(self, chat_id: int) -> InMemorySaver:
+        factory, _ = SQLAlchemyDBDict.db_dict_factory(repository=self.repository, record_id=chat_id)
+        return InMemorySaver(factory=factory)
+
+    @staticmethod
+    def __sync(saver: InMemorySaver):
+        for db_dict in (saver.storage, saver.writes, saver.blobs):
+            db_dict.sync_data()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк хранения чатов на синтетических данных")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=200, help="сообщений в каждом чате")
+    parser.add_argument("--media-size", type=int, default=100_000, help="байт медиа во вложении, 0 - без медиа")
+    parser.add_argument("--media-every", type=int, default=5, help="вложение в каждом N-м сообщении пользователя")
+    parser.add_argument("--turns", type=int, default=10, help="ходов диалога для замера записи")
+    parser.add_argument("--repeat", type=int, default=10, help="повторов каждого замера")
+    parser.add_argument("--backend", choices=[*BACKENDS, "all"], default="all")
+    parser.add_argument("-o", "--output", default=None, help="файл для JSON, по умолчанию stdout")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    report = {
+        "params": {key: value for key, value in vars(args).items() if key != "output"},
+        "python": platform.python_version(),
+        "results": [],
+    }
+    for backend in BACKENDS if args.backend == "all" else (args.backend,):
+        # Каждый режим - в своей базе, чтобы размеры и время не смешивались
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            benchmark = PersistenceBenchmark(args=args, db_path=Path(tmp_dir) / "benchmark.db")
+            report["results"].append(benchmark.run(backend=backend))
+            # SQLAlchemyDBDict синхронизируется в __del__ - собираем их, пока файл базы на месте
+            gc.collect()
+            benchmark.database.engine.dispose()
+            benchmark.database.read_engine.dispose()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
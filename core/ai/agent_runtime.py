@@ -0,0 +1,79 @@
+import asyncio
+import atexit
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable
+
+from core.config.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class AgentRuntime:
+    """
+    Один поток с циклом asyncio для запросов к агентам.
+
+    Запросы разных чатов выполняются параллельно (не больше max_concurrency одновременно),
+    запросы одного чата - строго по очереди в порядке отправки. Поток на запрос не создаётся:
+    ожидание модели - это await внутри цикла, блокирующие вызовы уходят в asyncio.to_thread.
+    """
+
+    def __init__(self, max_concurrency: int = settings.AGENT_MAX_CONCURRENCY):
+        self.max_concurrency: int = max_concurrency
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__thread: threading.Thread | None = None
+        self.__ready = threading.Event()
+        self.__start_lock = threading.Lock()
+        # Создаются и используются только в потоке цикла
+        self.__chat_locks: dict[int, asyncio.Lock] = {}
+        self.__pending: dict[int, int] = {}
+        self.__semaphore: asyncio.Semaphore | None = None
+
+    def start(self):
+        with self.__start_lock:
+            if self.__thread is not None:
+                return
+            self.__thread = threading.Thread(target=self.__run, name="AgentRuntime", daemon=True)
+            self.__thread.start()
+        self.__ready.wait()
+        atexit.register(self.stop)
+
+    def stop(self):
+        loop, thread = self.__loop, self.__thread
+        if loop is None or thread is None or not loop.is_running():
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+
+    def submit(self, chat_id: int, request: Callable[[], Awaitable[Any]]) -> Future:
+        """Ставит запрос чата в очередь, результат - concurrent.futures.Future для любого потока"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.__run_request(chat_id=chat_id, request=request), self.__loop)
+
+    async def __run_request(self, chat_id: int, request: Callable[[], Awaitable[Any]]) -> Any:
+        # asyncio.Lock отпускает ожидающих в порядке очереди - ходы одного чата не перемешиваются
+        chat_lock = self.__chat_locks.setdefault(chat_id, asyncio.Lock())
+        self.__pending[chat_id] = self.__pending.get(chat_id, 0) + 1
+        try:
+            async with chat_lock:
+                async with self.__semaphore:
+                    return await request()
+        finally:
+            self.__pending[chat_id] -= 1
+            if not self.__pending[chat_id]:
+                del self.__pending[chat_id]
+                del self.__chat_locks[chat_id]
+
+    def __run(self):
+        self.__loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.__loop)
+        self.__semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        self.__ready.set()
+        logger.info(f"Agent runtime started, max concurrency: {self.max_concurrency}")
+        try:
+            self.__loop.run_forever()
+        finally:
+            self.__loop.close()
+            logger.info("Agent runtime stopped")
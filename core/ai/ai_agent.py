@@ -1,16 +1,25 @@
 import logging
-from collections import defaultdict
-from typing import Sequence, Type
+import threading
+from functools import lru_cache
+from typing import Callable, Sequence
 from langchain_core.language_models import LanguageModelLike, BaseChatModel
-from langchain_core.messages import SystemMessage, trim_messages, RemoveMessage
-from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+)
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import BaseTool
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.errors import GraphRecursionError
-from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import create_react_agent
+from core.ai.context_window import ContextWindowManager
+from core.ai.conversation_digest import ConversationDigester
+from core.ai.rate_limit import model_rate_limiter, LangChainRateLimiter, RateLimitFeedback
 from core.config.config import settings
 from domain.enums.ai_model import AIModels
 
@@ -18,8 +27,77 @@ from domain.enums.ai_model import AIModels
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
 def model_factory(model: AIModels) -> BaseChatModel:
-    return ChatGoogleGenerativeAI(model=model.value, api_key=settings.GEMINI_API_KEY)
+    """Один клиент на модель: клиент без состояния чата и разделяется всеми чатами"""
+    return ChatGoogleGenerativeAI(
+        model=model.value,
+        api_key=settings.GEMINI_API_KEY,
+        # Общая квота модели на все чаты; ошибки 429 снижают скорость корзины
+        rate_limiter=LangChainRateLimiter(limiter=model_rate_limiter, key=model.value),
+        callbacks=[RateLimitFeedback(limiter=model_rate_limiter, key=model.value)],
+    )
+
+
+def compile_agent(
+    model: LanguageModelLike,
+    tools: Sequence[BaseTool],
+    checkpointer: BaseCheckpointSaver,
+    message_transformer: Callable[[list[BaseMessage]], list[BaseMessage]] | None = None,
+    context_window: ContextWindowManager | None = None,
+    digester: ConversationDigester | None = None,
+) -> CompiledStateGraph:
+    # Подготовка сообщений только для запроса к модели (краткое содержание старых ходов, обрезка по бюджету,
+    # подстановка медиа по ссылкам). Через prompt, а не pre_model_hook: результат не попадает в каналы графа
+    # и не сохраняется в чекпоинт
+    def transform_messages_prompt(state, config: RunnableConfig) -> list[BaseMessage]:
+        messages = state["messages"]
+        if digester:
+            messages = digester.apply(chat_id=int(config["configurable"]["thread_id"]), messages=messages)
+        if context_window:
+            messages = context_window.trim(messages)
+        return message_transformer(messages) if message_transformer else messages
+
+    # pre_model_hook нужен только для обрезки самой истории
+    pre_model_hook = context_window.trim_history_hook if context_window and context_window.mode == "history" else None
+
+    return create_react_agent(
+        # prompt=system_message,
+        prompt=transform_messages_prompt if message_transformer or context_window or digester else None,
+        pre_model_hook=pre_model_hook,
+        model=model,
+        tools=tools,
+        checkpointer=checkpointer
+    )
+
+
+# Граф не зависит от чата (чат - это thread_id в config), поэтому с общим чекпоинтером
+# скомпилированный граф переиспользуется всеми чатами. Модели pydantic не хэшируются - ключ по id,
+# а сами объекты хранятся рядом с графом, чтобы id не переиспользовался
+_shared_agents: dict[tuple, tuple[LanguageModelLike, BaseCheckpointSaver, CompiledStateGraph]] = {}
+_shared_agents_lock = threading.Lock()
+
+
+def shared_agent(
+    model: LanguageModelLike,
+    checkpointer: BaseCheckpointSaver,
+    message_transformer: Callable[[list[BaseMessage]], list[BaseMessage]] | None = None,
+    context_window: ContextWindowManager | None = None,
+    digester: ConversationDigester | None = None,
+) -> CompiledStateGraph:
+    key = (id(model), id(checkpointer), message_transformer, id(context_window), id(digester))
+    with _shared_agents_lock:
+        if key not in _shared_agents:
+            graph = compile_agent(
+                model=model,
+                tools=[],
+                checkpointer=checkpointer,
+                message_transformer=message_transformer,
+                context_window=context_window,
+                digester=digester,
+            )
+            _shared_agents[key] = (model, checkpointer, graph)
+        return _shared_agents[key][2]
 
 class LLMAgent:
     def __init__(
@@ -28,37 +106,29 @@ class LLMAgent:
         tools: Sequence[BaseTool],
         system_message: SystemMessage,
         chat_id: int,
-        default_dict_factory: Type[defaultdict,]
+        checkpointer: BaseCheckpointSaver,
+        message_transformer: Callable[[list[BaseMessage]], list[BaseMessage]] | None = None,
+        graph: CompiledStateGraph | None = None,
+        context_window: ContextWindowManager | None = None,
+        digester: ConversationDigester | None = None,
     ):
         self._model = model
 
-        # This function will be called every time before the node that calls LLM
-        def pre_model_hook(state):
-            trimmed_messages = trim_messages(
-                state["messages"],
-                strategy="last",
-                token_counter=count_tokens_approximately,
-                max_tokens=200000,
-                start_on="human",
-                end_on=("human", "tool"),
-                include_system=True
-            )
-            # pprint.pp(trimmed_messages)
-
-            # return {"llm_input_messages": trimmed_messages} #обрезать только для модели, но историю хранить всю
-            return {"messages": [RemoveMessage(REMOVE_ALL_MESSAGES)] + trimmed_messages}# обрезать историю в том числе
-
-        # Единый record_id для всех таблиц
-        self.checkpointer = InMemorySaver(factory=default_dict_factory)
+        # Чекпоинтер создаётся снаружи: SQLiteCheckpointSaver общий для всех чатов, чаты различаются по thread_id
+        self.checkpointer = checkpointer
         logger.info(f"init agent system_message: {system_message}")
-        self._agent = create_react_agent(
-            # prompt=system_message,
-            # pre_model_hook=pre_model_hook,
+        self._agent = graph if graph is not None else compile_agent(
             model=model,
             tools=tools,
-            checkpointer=self.checkpointer
+            checkpointer=self.checkpointer,
+            message_transformer=message_transformer,
+            context_window=context_window,
+            digester=digester,
         )
 
+        # Сколько сообщений в истории после последнего invoke
+        self.message_count: int = 0
+
         self._config: RunnableConfig = {
             "configurable": {"thread_id": f"{chat_id}"},
             "recursion_limit": 100,
@@ -74,6 +144,7 @@ class LLMAgent:
             "role": "user",
             "content": content
         }
+        result: dict = {}
         try:
             logger.info(f"invoke {message}")
             result = self._agent.invoke(
@@ -89,6 +160,104 @@ class LLMAgent:
         except Exception as e:
             logger.error(f"InvokeError: {e}")
             raise e
+        return self.__response(result)
+
+    async def ainvoke(
+        self,
+        content: list[dict[str, str]],
+        temperature: float=0.1
+    ) -> str:
+        """Отправляет сообщение в чат, не блокируя цикл событий"""
+        message: dict = {
+            "role": "user",
+            "content": content
+        }
+        result: dict = {}
+        try:
+            logger.info(f"ainvoke {message}")
+            result = await self._agent.ainvoke(
+                input = {
+                    "messages": [message],
+                    "temperature": temperature
+                },
+                config=self._config
+            )
+        except GraphRecursionError:
+
+            logger.warning("⚠️ Достигнут лимит reasoning.")
+        except Exception as e:
+            logger.error(f"InvokeError: {e}")
+            raise e
+        return self.__response(result)
+
+    async def astream(
+        self,
+        content: list[dict[str, str]],
+        on_delta: Callable[[str], None],
+        temperature: float=0.1
+    ) -> str:
+        """
+        Как ainvoke, но текст ответа модели по мере генерации отдаётся в on_delta.
+        Возвращает то же, что ainvoke, - итоговые сообщения хода.
+        """
+        message: dict = {
+            "role": "user",
+            "content": content
+        }
+        result: dict = {}
+        try:
+            logger.info(f"astream {message}")
+            async for mode, data in self._agent.astream(
+                input = {
+                    "messages": [message],
+                    "temperature": temperature
+                },
+                config=self._config,
+                stream_mode=["messages", "values"],
+            ):
+                if mode == "values":
+                    result = data
+                    continue
+                chunk, metadata = data
+                # Только ответ модели: сообщения инструментов и входные сообщения не стримим
+                if isinstance(chunk, AIMessageChunk) and metadata.get("langgraph_node") == "agent":
+                    delta = self.__chunk_text(chunk.content)
+                    if delta:
+                        on_delta(delta)
+        except GraphRecursionError:
+
+            logger.warning("⚠️ Достигнут лимит reasoning.")
+        except Exception as e:
+            logger.error(f"InvokeError: {e}")
+            raise e
+        return self.__response(result)
+
+    def append_turn(self, content: list[dict[str, str]] | str, answer: list | str) -> list[dict]:
+        """Записывает в историю готовый ход без запроса к модели (ответ из кэша)"""
+        self._agent.update_state(self._config, self.__turn_update(content=content, answer=answer), as_node="agent")
+        return self.__response(self._agent.get_state(self._config).values)
+
+    async def aappend_turn(self, content: list[dict[str, str]] | str, answer: list | str) -> list[dict]:
+        await self._agent.aupdate_state(self._config, self.__turn_update(content=content, answer=answer), as_node="agent")
+        return self.__response((await self._agent.aget_state(self._config)).values)
+
+    @staticmethod
+    def __turn_update(content: list[dict[str, str]] | str, answer: list | str) -> dict:
+        # От имени узла agent: ответ без вызовов инструментов завершает граф, как после обычного хода
+        return {"messages": [HumanMessage(content=content), AIMessage(content=answer)]}
+
+    @staticmethod
+    def __chunk_text(content: list | str) -> str:
+        if isinstance(content, str):
+            return content
+        return "".join(
+            block.get("text", "") if isinstance(block, dict) else str(block)
+            for block in content
+            if not isinstance(block, dict) or block.get("type") == "text"
+        )
+
+    def __response(self, result: dict) -> list[dict]:
+        self.message_count = len(result.get('messages', []))
         result = [{i.type: i.content} for i in result.get('messages', [])]
         return result[-2:]
 
@@ -0,0 +1,65 @@
+import atexit
+import logging
+import threading
+
+from core.ai.checkpointer import SQLiteCheckpointSaver
+from core.config.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointCompactor:
+    """
+    Фоновая сборка мусора чекпоинтов.
+
+    Первый проход обходит все чаты, где чекпоинтов больше retention (база до введения политики),
+    дальше - только чаты, в которых saver удалял чекпоинты. После сборки blob'ов
+    свободные страницы возвращаются файлу через incremental_vacuum.
+    """
+
+    def __init__(self, saver: SQLiteCheckpointSaver, interval: float = settings.COMPACTION_INTERVAL):
+        self.__saver: SQLiteCheckpointSaver = saver
+        self.__interval = interval
+        self.__stop = threading.Event()
+        self.__initial_pass = True
+        self.__thread = threading.Thread(target=self.__loop, name="CheckpointCompactor", daemon=True)
+
+    def start(self):
+        if self.__interval <= 0 or self.__thread.is_alive():
+            return
+        self.__thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.__stop.set()
+
+    def run_once(self) -> int:
+        """Один проход сборки, возвращает число удалённых blob'ов"""
+        if self.__initial_pass:
+            chat_ids = set(self.__saver.repository.chats_over_retention(keep=self.__saver.retention))
+            self.__initial_pass = False
+        else:
+            chat_ids = set()
+        chat_ids.update(self.__saver.take_dirty_chats())
+
+        removed = 0
+        for chat_id in sorted(chat_ids):
+            if self.__stop.is_set():
+                break
+            try:
+                removed += self.__saver.compact_thread(chat_id=chat_id)
+            except Exception as e:
+                logger.error(f"Compaction error for chat {chat_id}: {e}")
+        if removed:
+            self.__saver.repository.incremental_vacuum()
+        logger.info(f"Compaction pass: {len(chat_ids)} chats, {removed} blobs removed")
+        return removed
+
+    def __loop(self):
+        while not self.__stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Compaction error: {e}")
+            self.__stop.wait(self.__interval)
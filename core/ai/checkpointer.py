@@ -0,0 +1,676 @@
+import asyncio
+import hashlib
+import logging
+import random
+import threading
+from collections import Counter
+from typing import Any, AsyncIterator, Iterator, Sequence
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from application.interfaces.Irepository_bd_dict import IRepositoryDBDict
+from application.interfaces.Irepository_checkpoint import IRepositoryCheckpoint
+from core.ai.context_window import count_tokens
+from core.config.config import settings
+from core.repository import codec
+from core.repository.repository_checkpoint import (
+    MESSAGES_CHANNEL,
+    MESSAGE_REFS_TYPE,
+    decode_message_refs,
+    encode_message_refs,
+)
+from domain.entities.checkpoint_record import (
+    CheckpointRecord,
+    CheckpointWriteRecord,
+    CheckpointBlobRecord,
+    CheckpointMessageRecord,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Длина хэша содержимого в ключе сообщения (hex, 64 бита): различает только версии одного id,
+# а список ключей каждой версии канала растёт с историей
+MESSAGE_DIGEST_SIZE = 16
+
+
+def prune_in_memory_saver(saver: InMemorySaver, keep: int = settings.CHECKPOINT_RETENTION) -> int:
+    """
+    Политика хранения для InMemorySaver (режим pickle-колонок): оставляет keep последних
+    чекпоинтов каждого namespace, концы веток и точки ветвления, и удаляет blob'ы,
+    на которые больше не ссылается ни один чекпоинт. Возвращает число удалённых чекпоинтов.
+    """
+    if keep <= 0:
+        return 0
+    pruned = 0
+    live_blobs: set[tuple] = set()
+    for thread_id, namespaces in list(saver.storage.items()):
+        for checkpoint_ns, checkpoints in namespaces.items():
+            children = Counter(parent_id for _, _, parent_id in checkpoints.values() if parent_id)
+            for checkpoint_id in sorted(checkpoints, reverse=True)[keep:]:
+                if children[checkpoint_id] == 1:
+                    del checkpoints[checkpoint_id]
+                    saver.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+                    pruned += 1
+            for checkpoint, _, _ in checkpoints.values():
+                versions = saver.serde.loads_typed(checkpoint)["channel_versions"]
+                live_blobs.update(
+                    (thread_id, checkpoint_ns, channel, version) for channel, version in versions.items()
+                )
+    if pruned:
+        for key in [key for key in saver.blobs if key not in live_blobs]:
+            del saver.blobs[key]
+        logger.info(f"Pruned {pruned} in-memory checkpoints")
+    return pruned
+
+
+class CodecSerializer(SerializerProtocol):
+    """Сжимает байты вложенного сериализатора кодеком состояния, старые несжатые значения читаются как есть"""
+
+    def __init__(self, serde: SerializerProtocol | None = None):
+        self.serde: SerializerProtocol = serde or JsonPlusSerializer()
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        value_type, value_data = self.serde.dumps_typed(obj)
+        return value_type, codec.encode_bytes(value_data)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        value_type, value_data = data
+        return self.serde.loads_typed((value_type, codec.decode_bytes(value_data)))
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    Чекпоинтер LangGraph поверх построчных таблиц checkpoint / checkpoint_write / checkpoint_blob.
+
+    В памяти ничего не держит: каждый get_tuple/list читает только нужные строки,
+    каждый put/put_writes вставляет только новые. Канал messages пишется построчно:
+    новая версия - это строки только новых сообщений и список ключей всех сообщений.
+
+    После каждого put старые чекпоинты сверх retention удаляются, а чат помечается
+    для сборки blob'ов, которую выполняет compact_thread (см. CheckpointCompactor).
+    """
+
+    def __init__(
+        self,
+        repository: IRepositoryCheckpoint,
+        legacy_repository: IRepositoryDBDict | None = None,
+        serde: SerializerProtocol | None = None,
+        retention: int = settings.CHECKPOINT_RETENTION,
+    ):
+        super().__init__(serde=CodecSerializer(serde))
+        self.repository: IRepositoryCheckpoint = repository
+        self.legacy_repository: IRepositoryDBDict | None = legacy_repository
+        self.retention = retention
+        self.__checked_threads: set[str] = set()
+        self.__lock = threading.Lock()
+        # put и сборка blob'ов не должны пересекаться: новый чекпоинт ссылается на уже записанные blob'ы
+        self.__compaction_lock = threading.RLock()
+        self.__dirty_chats: set[int] = set()
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id: str = config["configurable"]["thread_id"]
+        checkpoint_ns: str = config["configurable"].get("checkpoint_ns", "")
+        chat_id = self._ensure_thread(thread_id)
+        record = self.repository.get_checkpoint(
+            chat_id=chat_id,
+            checkpoint_ns=checkpoint_ns,
+            checkpoint_id=get_checkpoint_id(config),
+        )
+        if record is None:
+            return None
+        return self._to_checkpoint_tuple(thread_id=thread_id, record=record)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        chat_id = None
+        checkpoint_ns = None
+        checkpoint_id = None
+        if config:
+            chat_id = self._ensure_thread(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            checkpoint_id = get_checkpoint_id(config)
+
+        records = self.repository.list_checkpoints(
+            chat_id=chat_id,
+            checkpoint_ns=checkpoint_ns,
+            before=get_checkpoint_id(before) if before else None,
+            # С фильтром по метаданным лимит применяется уже после фильтрации
+            limit=None if filter or checkpoint_id else limit,
+        )
+        for record in records:
+            if checkpoint_id and record.checkpoint_id != checkpoint_id:
+                continue
+
+            metadata = self.serde.loads_typed((record.metadata_type, record.metadata_data))
+            if filter and not all(
+                query_value == metadata.get(query_key)
+                for query_key, query_value in filter.items()
+            ):
+                continue
+
+            if limit is not None and limit <= 0:
+                break
+            elif limit is not None:
+                limit -= 1
+
+            yield self._to_checkpoint_tuple(
+                thread_id=str(record.chat_id),
+                record=record,
+                metadata=metadata,
+            )
+
+    def get_messages(
+        self,
+        config: RunnableConfig,
+        start: int | None = None,
+        end: int | None = None,
+    ) -> tuple[int, Sequence[BaseMessage]]:
+        """
+        Срез [start:end] канала messages чекпоинта из config (или последнего) и общее число сообщений.
+
+        Читаются список ключей и строки только сообщений среза. Чаты, ещё не переведённые
+        на построчное хранение (до первого нового хода), разбираются целиком.
+        """
+        chat_id, checkpoint_ns, keys, messages = self.__messages_source(config)
+        if keys is None:
+            return len(messages), messages[start:end]
+        return len(keys), self._load_messages(chat_id=chat_id, checkpoint_ns=checkpoint_ns, keys=keys[start:end])
+
+    def iter_messages(self, config: RunnableConfig, batch_size: int = 100) -> tuple[int, Iterator[BaseMessage]]:
+        """Число сообщений и итератор по ним: строки читаются пачками по batch_size, в памяти - одна пачка"""
+        chat_id, checkpoint_ns, keys, messages = self.__messages_source(config)
+        if keys is None:
+            return len(messages), iter(messages)
+
+        def batches() -> Iterator[BaseMessage]:
+            for offset in range(0, len(keys), batch_size):
+                yield from self._load_messages(
+                    chat_id=chat_id, checkpoint_ns=checkpoint_ns, keys=keys[offset:offset + batch_size]
+                )
+
+        return len(keys), batches()
+
+    def __messages_source(self, config: RunnableConfig) -> tuple[int, str, Sequence[str] | None, Sequence[BaseMessage]]:
+        """(chat_id, checkpoint_ns, ключи сообщений, []) или, для целого blob'а старого формата, (..., None, сообщения)"""
+        chat_id = self._ensure_thread(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        record = self.repository.get_checkpoint(
+            chat_id=chat_id, checkpoint_ns=checkpoint_ns, checkpoint_id=get_checkpoint_id(config)
+        )
+        if record is None:
+            return chat_id, checkpoint_ns, [], []
+        version = self.serde.loads_typed((record.checkpoint_type, record.checkpoint_data))["channel_versions"].get(
+            MESSAGES_CHANNEL
+        )
+        blobs = self.repository.get_blobs(
+            chat_id=chat_id, checkpoint_ns=checkpoint_ns, versions={MESSAGES_CHANNEL: version}
+        ) if version is not None else []
+        if not blobs or blobs[0].value_type == "empty":
+            return chat_id, checkpoint_ns, [], []
+        if blobs[0].value_type == MESSAGE_REFS_TYPE:
+            return chat_id, checkpoint_ns, decode_message_refs(blobs[0].value_data), []
+        return chat_id, checkpoint_ns, None, self.serde.loads_typed((blobs[0].value_type, blobs[0].value_data))
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        c = checkpoint.copy()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        chat_id = self._ensure_thread(thread_id)
+        values: dict[str, Any] = c.pop("channel_values")
+
+        checkpoint_type, checkpoint_data = self.serde.dumps_typed(c)
+        metadata_type, metadata_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self.__compaction_lock:
+            # Пишем только каналы, версия которых изменилась в этом шаге
+            blobs = []
+            messages = []
+            for channel, version in new_versions.items():
+                value = values.get(channel)
+                if channel not in values:
+                    value_type, value_data = "empty", b""
+                elif channel == MESSAGES_CHANNEL and self.__is_message_list(value):
+                    # Проверка уже записанных сообщений - под той же блокировкой, что и их сборка
+                    value_data, records = self._message_refs(
+                        chat_id=chat_id, checkpoint_ns=checkpoint_ns, messages=value
+                    )
+                    value_type = MESSAGE_REFS_TYPE
+                    messages.extend(records)
+                else:
+                    value_type, value_data = self.serde.dumps_typed(value)
+                blobs.append(
+                    CheckpointBlobRecord(
+                        chat_id=chat_id,
+                        checkpoint_ns=checkpoint_ns,
+                        channel=channel,
+                        version=str(version),
+                        value_type=value_type,
+                        value_data=value_data,
+                    )
+                )
+
+            self.repository.put_checkpoint(
+                checkpoint=CheckpointRecord(
+                    chat_id=chat_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint["id"],
+                    parent_checkpoint_id=config["configurable"].get("checkpoint_id"),
+                    checkpoint_type=checkpoint_type,
+                    checkpoint_data=checkpoint_data,
+                    metadata_type=metadata_type,
+                    metadata_data=metadata_data,
+                ),
+                blobs=blobs,
+                messages=messages,
+            )
+            if self.retention > 0 and self.repository.prune_checkpoints(
+                chat_id=chat_id, checkpoint_ns=checkpoint_ns, keep=self.retention
+            ):
+                with self.__lock:
+                    self.__dirty_chats.add(chat_id)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        chat_id = self._ensure_thread(thread_id)
+
+        records = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_data = self.serde.dumps_typed(value)
+            records.append(
+                CheckpointWriteRecord(
+                    chat_id=chat_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint_id,
+                    task_id=task_id,
+                    idx=WRITES_IDX_MAP.get(channel, idx),
+                    channel=channel,
+                    value_type=value_type,
+                    value_data=value_data,
+                    task_path=task_path,
+                )
+            )
+        self.repository.put_writes(writes=records)
+
+    def delete_thread(self, thread_id: str) -> None:
+        # Ветки получают копию точки ветвления и только тех blob'ов, на которые она ссылается
+        forks = self.repository.list_forks(parent_chat_id=int(thread_id))
+        with self.__compaction_lock:
+            fork_versions = {}
+            for fork in forks:
+                record = self.repository.get_checkpoint(
+                    chat_id=int(thread_id), checkpoint_id=fork.parent_checkpoint_id
+                )
+                if record is not None:
+                    checkpoint = self.serde.loads_typed((record.checkpoint_type, record.checkpoint_data))
+                    fork_versions[fork.chat_id] = checkpoint["channel_versions"]
+            self.repository.delete_chat(chat_id=int(thread_id), fork_versions=fork_versions)
+        with self.__lock:
+            self.__checked_threads.discard(str(thread_id))
+            self.__dirty_chats.discard(int(thread_id))
+            self.__dirty_chats.update(fork.chat_id for fork in forks)
+
+    # Асинхронный интерфейс для ainvoke/astream: те же синхронные вызовы в пуле потоков,
+    # чтобы запросы к SQLite не блокировали цикл событий
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        records = await asyncio.to_thread(
+            lambda: [*self.list(config, filter=filter, before=before, limit=limit)]
+        )
+        for record in records:
+            yield record
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def fork_thread(self, config: RunnableConfig, thread_id: str) -> RunnableConfig:
+        """
+        Создаёт чат thread_id - ветку чата из config в его чекпоинте (или последнем).
+
+        Ничего не копирует: история читается из родителя, в ветку пишутся только новые ходы.
+        """
+        chat_id = self._ensure_thread(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        record = self.repository.get_checkpoint(
+            chat_id=chat_id, checkpoint_ns=checkpoint_ns, checkpoint_id=get_checkpoint_id(config)
+        )
+        if record is None:
+            raise ValueError(f"Nothing to fork in chat {chat_id}")
+        self.repository.create_fork(
+            chat_id=int(thread_id), parent_chat_id=chat_id, parent_checkpoint_id=record.checkpoint_id
+        )
+        with self.__lock:
+            self.__checked_threads.add(str(thread_id))
+        return {
+            "configurable": {
+                "thread_id": str(thread_id),
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": record.checkpoint_id,
+            }
+        }
+
+    def take_dirty_chats(self) -> set[int]:
+        """Чаты, у которых после последней сборки удалялись чекпоинты"""
+        with self.__lock:
+            chats, self.__dirty_chats = self.__dirty_chats, set()
+        return chats
+
+    def compact_thread(self, chat_id: int) -> int:
+        """
+        Применяет retention ко всем namespace чата и удаляет blob'ы,
+        на которые не ссылается ни один оставшийся чекпоинт. Возвращает число удалённых blob'ов.
+        """
+        with self.__compaction_lock:
+            live_blobs: set[tuple[str, str, str]] = set()
+            for checkpoint_ns in {record.checkpoint_ns for record in self.repository.list_checkpoints(chat_id=chat_id)}:
+                if self.retention > 0:
+                    self.repository.prune_checkpoints(chat_id=chat_id, checkpoint_ns=checkpoint_ns, keep=self.retention)
+                for record in self.repository.list_checkpoints(chat_id=chat_id, checkpoint_ns=checkpoint_ns):
+                    checkpoint = self.serde.loads_typed((record.checkpoint_type, record.checkpoint_data))
+                    live_blobs.update(
+                        (checkpoint_ns, channel, str(version))
+                        for channel, version in checkpoint["channel_versions"].items()
+                    )
+            unused = [key for key in self.repository.list_blob_keys(chat_id=chat_id) if key not in live_blobs]
+            self.repository.delete_blobs(chat_id=chat_id, keys=unused)
+            # Сообщения, оставшиеся только в удалённых версиях канала messages
+            self.repository.prune_messages(chat_id=chat_id)
+        return len(unused)
+
+    def pin(self, config: RunnableConfig, name: str | None = None) -> None:
+        """Защищает чекпоинт из config от удаления политикой хранения"""
+        self.repository.pin_checkpoint(
+            chat_id=self._ensure_thread(config["configurable"]["thread_id"]),
+            checkpoint_ns=config["configurable"].get("checkpoint_ns", ""),
+            checkpoint_id=get_checkpoint_id(config),
+            name=name,
+        )
+
+    def unpin(self, config: RunnableConfig) -> None:
+        self.repository.unpin_checkpoint(
+            chat_id=self._ensure_thread(config["configurable"]["thread_id"]),
+            checkpoint_ns=config["configurable"].get("checkpoint_ns", ""),
+            checkpoint_id=get_checkpoint_id(config),
+        )
+
+    def get_next_version(self, current: str | None, channel: None) -> str:
+        # Тот же формат версий, что и у InMemorySaver, чтобы импортированные чаты продолжали нумерацию
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        next_v = current_v + 1
+        next_h = random.random()
+        return f"{next_v:032}.{next_h:016}"
+
+    def _to_checkpoint_tuple(
+        self,
+        thread_id: str,
+        record: CheckpointRecord,
+        metadata: CheckpointMetadata | None = None,
+    ) -> CheckpointTuple:
+        checkpoint: Checkpoint = self.serde.loads_typed((record.checkpoint_type, record.checkpoint_data))
+        if metadata is None:
+            metadata = self.serde.loads_typed((record.metadata_type, record.metadata_data))
+        writes = self.repository.get_writes(
+            chat_id=record.chat_id,
+            checkpoint_ns=record.checkpoint_ns,
+            checkpoint_id=record.checkpoint_id,
+        )
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": record.checkpoint_ns,
+                    "checkpoint_id": record.checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_blobs(
+                    chat_id=record.chat_id,
+                    checkpoint_ns=record.checkpoint_ns,
+                    versions=checkpoint["channel_versions"],
+                ),
+            },
+            metadata=metadata,
+            pending_writes=[
+                (write.task_id, write.channel, self.serde.loads_typed((write.value_type, write.value_data)))
+                for write in writes
+            ],
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": record.checkpoint_ns,
+                        "checkpoint_id": record.parent_checkpoint_id,
+                    }
+                }
+                if record.parent_checkpoint_id
+                else None
+            ),
+        )
+
+    def _load_blobs(self, chat_id: int, checkpoint_ns: str, versions: ChannelVersions) -> dict[str, Any]:
+        result: dict[str, Any] = {}
+        for blob in self.repository.get_blobs(chat_id=chat_id, checkpoint_ns=checkpoint_ns, versions=versions):
+            if blob.value_type == "empty":
+                continue
+            if blob.value_type == MESSAGE_REFS_TYPE:
+                result[blob.channel] = self._load_messages(
+                    chat_id=chat_id, checkpoint_ns=checkpoint_ns, keys=decode_message_refs(blob.value_data)
+                )
+                continue
+            result[blob.channel] = self.serde.loads_typed((blob.value_type, blob.value_data))
+        return result
+
+    def _load_messages(self, chat_id: int, checkpoint_ns: str, keys: Sequence[str]) -> Sequence[BaseMessage]:
+        """Сообщения по ключам в порядке keys"""
+        rows = {
+            row.message_key: row
+            for row in self.repository.get_messages(chat_id=chat_id, checkpoint_ns=checkpoint_ns, keys=keys)
+        }
+        messages = []
+        for key in keys:
+            row = rows.get(key)
+            if row is None:
+                logger.error(f"Message {key} of chat {chat_id} not found")
+                continue
+            messages.append(self.serde.loads_typed((row.value_type, row.value_data)))
+        return messages
+
+    def _message_refs(
+        self,
+        chat_id: int,
+        checkpoint_ns: str,
+        messages: Sequence[BaseMessage],
+    ) -> tuple[bytes, Sequence[CheckpointMessageRecord]]:
+        """
+        Список ключей версии канала messages и строки ещё не записанных сообщений.
+
+        add_messages заменяет сообщение с тем же id на месте (update_state, правка вызова
+        инструмента), поэтому ключ - id вместе с хэшем содержимого: изменённое сообщение
+        получает новую строку, а неизменные только хэшируются, но не сжимаются и не пишутся.
+        """
+        dumped = [self.dump_message(message) for message in messages]
+        keys = [key for key, _, _ in dumped]
+        known = self.repository.existing_message_keys(chat_id=chat_id, checkpoint_ns=checkpoint_ns, keys=keys)
+        records = []
+        for key, value_type, value_data in dumped:
+            if key in known:
+                continue
+            known.add(key)
+            records.append(
+                CheckpointMessageRecord(
+                    chat_id=chat_id,
+                    checkpoint_ns=checkpoint_ns,
+                    message_key=key,
+                    value_type=value_type,
+                    value_data=codec.encode_bytes(value_data),
+                )
+            )
+        return encode_message_refs(keys), records
+
+    def dump_message(self, message: BaseMessage) -> tuple[str, str, bytes]:
+        """
+        Ключ строки checkpoint_message и сообщение, сериализованное без сжатия.
+
+        Строка пишется один раз, поэтому число токенов считается до сериализации и
+        сохраняется вместе с ней.
+        """
+        count_tokens(message)
+        value_type, value_data = self.serde.serde.dumps_typed(message)
+        digest = hashlib.sha256(value_data).hexdigest()[:MESSAGE_DIGEST_SIZE]
+        return (f"{message.id}:{digest}" if message.id else f"sha256:{digest}"), value_type, value_data
+
+    @staticmethod
+    def __is_message_list(value: Any) -> bool:
+        return isinstance(value, list) and all(isinstance(message, BaseMessage) for message in value)
+
+    def _ensure_thread(self, thread_id: str) -> int:
+        """Один раз за сессию проверяет, не нужно ли перенести чат из старого формата"""
+        chat_id = int(thread_id)
+        if str(thread_id) in self.__checked_threads:
+            return chat_id
+        with self.__lock:
+            if str(thread_id) not in self.__checked_threads:
+                if self.legacy_repository and not self.repository.has_checkpoints(chat_id=chat_id):
+                    self._import_legacy_state(chat_id=chat_id)
+                self.__checked_threads.add(str(thread_id))
+        return chat_id
+
+    def _import_legacy_state(self, chat_id: int):
+        """Переносит чат из pickle-колонок ai_state (InMemorySaver поверх SQLAlchemyDBDict) в построчные таблицы"""
+        try:
+            columns = self.legacy_repository.get_chat_columns(
+                record_id=chat_id,
+                col_names=["data_storage", "data_writes", "data_state"],
+            )
+            if not columns or not columns["data_storage"]:
+                return
+
+            storage = codec.loads(columns["data_storage"])
+            writes = codec.loads(columns["data_writes"]) if columns["data_writes"] else {}
+            blobs = codec.loads(columns["data_state"]) if columns["data_state"] else {}
+
+            blob_records = [
+                CheckpointBlobRecord(
+                    chat_id=chat_id,
+                    checkpoint_ns=checkpoint_ns,
+                    channel=channel,
+                    version=str(version),
+                    value_type=value_type,
+                    value_data=value_data,
+                )
+                for (_, checkpoint_ns, channel, version), (value_type, value_data) in blobs.items()
+            ]
+
+            imported = 0
+            for namespaces in storage.values():
+                for checkpoint_ns, checkpoints in namespaces.items():
+                    for checkpoint_id, (checkpoint, metadata, parent_checkpoint_id) in checkpoints.items():
+                        self.repository.put_checkpoint(
+                            checkpoint=CheckpointRecord(
+                                chat_id=chat_id,
+                                checkpoint_ns=checkpoint_ns,
+                                checkpoint_id=checkpoint_id,
+                                parent_checkpoint_id=parent_checkpoint_id,
+                                checkpoint_type=checkpoint[0],
+                                checkpoint_data=checkpoint[1],
+                                metadata_type=metadata[0],
+                                metadata_data=metadata[1],
+                            ),
+                            blobs=blob_records if not imported else [],
+                        )
+                        imported += 1
+
+            write_records = []
+            for (_, checkpoint_ns, checkpoint_id), task_writes in writes.items():
+                for (task_id, idx), (_, channel, (value_type, value_data), *rest) in task_writes.items():
+                    write_records.append(
+                        CheckpointWriteRecord(
+                            chat_id=chat_id,
+                            checkpoint_ns=checkpoint_ns,
+                            checkpoint_id=checkpoint_id,
+                            task_id=task_id,
+                            idx=idx,
+                            channel=channel,
+                            value_type=value_type,
+                            value_data=value_data,
+                            task_path=rest[0] if rest else "",
+                        )
+                    )
+            self.repository.put_writes(writes=write_records)
+            logger.info(f"Imported legacy chat {chat_id}: {imported} checkpoints, {len(write_records)} writes")
+        except Exception as e:
+            logger.error(f"Legacy import error for chat {chat_id}: {e}")
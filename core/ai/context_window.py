@@ -0,0 +1,159 @@
+import json
+import logging
+from functools import lru_cache
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from core.config.config import settings
+from domain.enums.ai_model import AIModels
+from domain.enums.content_media_type import ContentMediaType, MIME_TYPE_MAP, MimeType
+
+
+logger = logging.getLogger(__name__)
+
+
+# Версия оценки токенов: при изменении констант ниже её нужно поднять, старые сохранённые числа пересчитаются
+TOKEN_ESTIMATOR_VERSION = 1
+# Ключ в additional_kwargs сообщения: число токенов сохраняется вместе со строкой сообщения в чекпоинте
+TOKEN_COUNT_KEY = f"aimate_token_count_v{TOKEN_ESTIMATOR_VERSION}"
+CHARS_PER_TOKEN = 4.0
+TOKENS_PER_MESSAGE = 3
+# Gemini делит изображение на плитки 768x768 по 258 токенов, экран 1920x1080 - 6 плиток
+IMAGE_TOKENS = 6 * 258
+AUDIO_TOKENS_PER_SECOND = 32
+VIDEO_TOKENS_PER_SECOND = 263
+# Длительность по размеру. Запись с микрофона - 16 кГц моно: wav 16 бит, flac ~половина wav,
+# ogg - Opus ~24 кбит/с; прочее аудио ~128 кбит/с, видео ~2 Мбит/с
+AUDIO_BYTES_PER_SECOND: dict[str, int] = {
+    MimeType.WAV.value: 32000,
+    MimeType.FLAC.value: 16000,
+    MimeType.OGG.value: 3000,
+}
+DEFAULT_AUDIO_BYTES_PER_SECOND = 16000
+VIDEO_BYTES_PER_SECOND = 250000
+# Ссылки на медиа, сохранённые до появления size в media_ref
+DEFAULT_MEDIA_SECONDS = 60
+
+
+class ContextWindowManager:
+    """
+    Обрезка истории чата под бюджет токенов модели.
+
+    Число токенов считается один раз на сообщение и хранится в его additional_kwargs
+    под ключом с версией оценки, поэтому на каждом ходе считаются только новые сообщения. Окно - последние сообщения
+    в пределах бюджета, начиная с сообщения пользователя.
+
+    mode "model" - обрезается только запрос к модели, история хранится целиком;
+    mode "history" - лишние сообщения удаляются и из истории чата.
+    """
+
+    def __init__(self, max_tokens: int, mode: str = "model"):
+        self.max_tokens: int = max_tokens
+        self.mode: str = mode
+
+    def trim(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Последние сообщения в пределах бюджета, для запроса к модели"""
+        start = self.__window_start(messages)
+        if not start:
+            return messages
+        system = [messages[0]] if isinstance(messages[0], SystemMessage) else []
+        return system + messages[start:]
+
+    def trim_history_hook(self, state: dict) -> dict:
+        """pre_model_hook для mode "history": старые сообщения удаляются из состояния графа"""
+        messages = state["messages"]
+        start = self.__window_start(messages)
+        if not start:
+            return {}
+        system = [messages[0]] if isinstance(messages[0], SystemMessage) else []
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + system + messages[start:]}
+
+    def __window_start(self, messages: list[BaseMessage]) -> int:
+        """Индекс первого сообщения окна, 0 - обрезать нечего"""
+        if self.max_tokens <= 0 or not messages:
+            return 0
+        first = 1 if isinstance(messages[0], SystemMessage) else 0
+        budget = self.max_tokens - (count_tokens(messages[0]) if first else 0)
+        total = 0
+        start = len(messages)
+        # Счёт с конца: старые сообщения за границей окна не просматриваются
+        for index in range(len(messages) - 1, first - 1, -1):
+            total += count_tokens(messages[index])
+            if total > budget and start < len(messages):
+                break
+            start = index
+        if start == first:
+            return 0
+        # Окно начинается с сообщения пользователя; если такого в окне нет - с последнего,
+        # пусть и сверх бюджета, иначе модель получит ответ без вопроса
+        human = next((index for index in range(start, len(messages)) if isinstance(messages[index], HumanMessage)), None)
+        if human is None:
+            human = next(
+                (index for index in range(start - 1, first - 1, -1) if isinstance(messages[index], HumanMessage)),
+                first,
+            )
+        if human > first:
+            logger.info(f"Context trimmed to {self.max_tokens} tokens: {human - first} of {len(messages)} messages dropped")
+        return human if human > first else 0
+
+
+def count_tokens(message: BaseMessage) -> int:
+    """
+    Токены сообщения; считаются один раз и сохраняются в его additional_kwargs.
+
+    Словарь заменяется, а не дополняется: его могут разделять копии сообщения
+    (model_copy копирует неглубоко) с другим содержимым.
+    """
+    tokens = message.additional_kwargs.get(TOKEN_COUNT_KEY)
+    if tokens is None:
+        # Для ответов модели известно точное число токенов из usage_metadata
+        if isinstance(message, AIMessage) and message.usage_metadata:
+            tokens = message.usage_metadata.get("output_tokens") or _content_tokens(message.content)
+        else:
+            tokens = _content_tokens(message.content)
+        message.additional_kwargs = {**message.additional_kwargs, TOKEN_COUNT_KEY: tokens}
+    return tokens
+
+
+def _content_tokens(content: list | str) -> int:
+    if isinstance(content, str):
+        return TOKENS_PER_MESSAGE + int(len(content) / CHARS_PER_TOKEN)
+    return TOKENS_PER_MESSAGE + sum(_block_tokens(block) for block in content)
+
+
+def _block_tokens(block: dict | str) -> int:
+    if isinstance(block, str):
+        return int(len(block) / CHARS_PER_TOKEN)
+    block_type = block.get("type")
+    if block_type == ContentMediaType.TEXT.value:
+        return int(len(block.get("text", "")) / CHARS_PER_TOKEN)
+    if block_type == ContentMediaType.IMAGE_URL.value:
+        return IMAGE_TOKENS
+    if block_type == ContentMediaType.MEDIA_REF.value:
+        return media_tokens(mime_type=block.get("mime_type"), size=block.get("size"))
+    if block_type == ContentMediaType.MEDIA.value:
+        return media_tokens(mime_type=block.get("mime_type"), size=len(block.get("data", "")) * 3 // 4)
+    return int(len(json.dumps(block, ensure_ascii=False, default=str)) / CHARS_PER_TOKEN)
+
+
+def media_tokens(mime_type: str | None, size: int | None) -> int:
+    """Оценка токенов медиа Gemini по типу и размеру в байтах"""
+    media_type = MIME_TYPE_MAP.get(mime_type, ContentMediaType.UNKNOWN)
+    if media_type == ContentMediaType.AUDIO:
+        bytes_per_second = AUDIO_BYTES_PER_SECOND.get(mime_type, DEFAULT_AUDIO_BYTES_PER_SECOND)
+        seconds = size / bytes_per_second if size is not None else DEFAULT_MEDIA_SECONDS
+        return max(1, int(seconds * AUDIO_TOKENS_PER_SECOND))
+    if media_type == ContentMediaType.VIDEO:
+        seconds = size / VIDEO_BYTES_PER_SECOND if size is not None else DEFAULT_MEDIA_SECONDS
+        return max(1, int(seconds * VIDEO_TOKENS_PER_SECOND))
+    return IMAGE_TOKENS
+
+
+@lru_cache(maxsize=None)
+def context_window_factory(model: AIModels) -> ContextWindowManager:
+    """Один менеджер на модель, чтобы общий граф модели тоже был один"""
+    return ContextWindowManager(
+        max_tokens=settings.CONTEXT_MODEL_LIMITS.get(model.value, settings.CONTEXT_MAX_TOKENS),
+        mode=settings.CONTEXT_TRIM_MODE,
+    )
@@ -0,0 +1,168 @@
+import logging
+import queue
+import threading
+import time
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from application.interfaces.Irepository_conversation_digest import IRepositoryConversationDigest
+from core.ai.context_window import count_tokens
+from core.config.config import settings
+from domain.entities.conversation_digest import ConversationDigest
+from domain.enums.content_media_type import ContentMediaType
+
+
+logger = logging.getLogger(__name__)
+
+
+DIGEST_PROMPT = (
+    "Сожми начало разговора пользователя с ассистентом в краткое содержание на языке разговора. "
+    "Сохрани факты, данные пользователя, принятые решения, договорённости и открытые вопросы, "
+    "опусти приветствия и повторы. Ответь только кратким содержанием."
+)
+DIGEST_MESSAGE = "Краткое содержание начала разговора:\n{summary}"
+ROLE_NAMES = {"human": "Пользователь", "ai": "Ассистент", "tool": "Инструмент", "system": "Система"}
+
+
+class ConversationDigester:
+    """
+    Фоновое сжатие старых ходов чата в краткое содержание.
+
+    Когда несжатая часть истории превышает threshold токенов, всё, кроме последних keep_tokens,
+    пересказывает дешёвая модель в отдельном потоке, запрос пользователя этого не ждёт.
+    Исходная история не меняется: в conversation_digest хранятся summary и указатель на последний
+    вошедший в него message.id, а в запрос к модели уходят summary и сообщения после указателя.
+    """
+
+    def __init__(
+        self,
+        repository: IRepositoryConversationDigest,
+        model: BaseChatModel,
+        model_name: str = settings.DIGEST_MODEL,
+        threshold: int = settings.DIGEST_THRESHOLD_TOKENS,
+        keep_tokens: int = settings.DIGEST_KEEP_TOKENS,
+    ):
+        self.__repository: IRepositoryConversationDigest = repository
+        self.__model: BaseChatModel = model
+        self.__model_name: str = model_name
+        self.threshold: int = threshold
+        self.keep_tokens: int = keep_tokens
+        # chat_id -> (digest, готовое сообщение с summary) или None, если сжатия у чата ещё не было
+        self.__digests: dict[int, tuple[ConversationDigest, SystemMessage] | None] = {}
+        self.__pending: set[int] = set()
+        self.__lock = threading.Lock()
+        self.__queue: queue.Queue = queue.Queue()
+        self.__thread: threading.Thread | None = None
+
+    def apply(self, chat_id: int, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Сообщения для запроса к модели: summary вместо сжатых ходов; при необходимости ставит сжатие в очередь"""
+        if self.threshold <= 0 or not messages:
+            return messages
+        cached = self.__get(chat_id=chat_id)
+        start = self.__position(digest=cached[0], messages=messages) if cached else 0
+        summary = cached[0].summary if start else None
+        if sum(count_tokens(message) for message in messages[start:]) > self.threshold:
+            self.__schedule(chat_id=chat_id, summary=summary, messages=messages, start=start)
+        return [cached[1]] + messages[start:] if start else messages
+
+    def __position(self, digest: ConversationDigest, messages: list[BaseMessage]) -> int:
+        """Индекс первого несжатого сообщения, 0 - указатель не найден (история обрезана или чат другой ветки)"""
+        if digest.covered <= len(messages) and messages[digest.covered - 1].id == digest.last_message_id:
+            return digest.covered
+        for index, message in enumerate(messages):
+            if message.id == digest.last_message_id:
+                return index + 1
+        return 0
+
+    def __get(self, chat_id: int) -> tuple[ConversationDigest, SystemMessage] | None:
+        with self.__lock:
+            if chat_id in self.__digests:
+                return self.__digests[chat_id]
+        try:
+            digest = self.__repository.get(chat_id=chat_id)
+        except Exception as e:
+            logger.error(f"Digest read error for chat {chat_id}: {e}")
+            return None
+        cached = (digest, self.__message(digest)) if digest else None
+        with self.__lock:
+            return self.__digests.setdefault(chat_id, cached)
+
+    def __schedule(self, chat_id: int, summary: str | None, messages: list[BaseMessage], start: int):
+        # Граница сжатия - начало хода пользователя перед последними keep_tokens
+        total = 0
+        end = len(messages)
+        while end > start and total + count_tokens(messages[end - 1]) <= self.keep_tokens:
+            end -= 1
+            total += count_tokens(messages[end])
+        end = next((index for index in range(end, len(messages)) if isinstance(messages[index], HumanMessage)), None)
+        if end is None or end <= start:
+            return
+        with self.__lock:
+            if chat_id in self.__pending:
+                return
+            self.__pending.add(chat_id)
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name="ConversationDigester", daemon=True)
+                self.__thread.start()
+        self.__queue.put((chat_id, summary, messages[start:end], end, messages[end - 1].id))
+
+    def __run(self):
+        while True:
+            chat_id, summary, messages, covered, last_message_id = self.__queue.get()
+            try:
+                self.__summarize(
+                    chat_id=chat_id,
+                    summary=summary,
+                    messages=messages,
+                    covered=covered,
+                    last_message_id=last_message_id,
+                )
+            except Exception as e:
+                logger.error(f"Digest error for chat {chat_id}: {e}")
+            finally:
+                with self.__lock:
+                    self.__pending.discard(chat_id)
+
+    def __summarize(self, chat_id: int, summary: str | None, messages: list[BaseMessage], covered: int, last_message_id: str):
+        started = time.perf_counter()
+        transcript = "\n\n".join(
+            f"{ROLE_NAMES.get(message.type, message.type)}: {self.__message_text(message.content)}" for message in messages
+        )
+        if summary:
+            transcript = f"{DIGEST_MESSAGE.format(summary=summary)}\n\nПродолжение разговора:\n\n{transcript}"
+        response = self.__model.invoke([SystemMessage(content=DIGEST_PROMPT), HumanMessage(content=transcript)])
+        digest = ConversationDigest(
+            chat_id=chat_id,
+            summary=self.__message_text(response.content).strip(),
+            covered=covered,
+            last_message_id=last_message_id,
+            model=self.__model_name,
+            updated_at=time.time(),
+        )
+        self.__repository.put(digest=digest)
+        with self.__lock:
+            self.__digests[chat_id] = (digest, self.__message(digest))
+        logger.info(
+            f"Chat {chat_id} digest updated: {covered} messages covered, "
+            f"{time.perf_counter() - started:.2f} seconds"
+        )
+
+    @staticmethod
+    def __message(digest: ConversationDigest) -> SystemMessage:
+        # Одно сообщение на версию summary: его число токенов посчитается один раз
+        return SystemMessage(content=DIGEST_MESSAGE.format(summary=digest.summary))
+
+    @staticmethod
+    def __message_text(content: list | str) -> str:
+        if isinstance(content, str):
+            return content
+        parts = []
+        for block in content:
+            if isinstance(block, str):
+                parts.append(block)
+            elif block.get("type") == ContentMediaType.TEXT.value:
+                parts.append(block.get("text", ""))
+            else:
+                parts.append("[медиафайл]")
+        return " ".join(parts)
@@ -1,19 +1,67 @@
 import logging
 import pickle
+import threading
+import time
 from collections import defaultdict
 
 from application.interfaces.Irepository_bd_dict import IRepositoryDBDict
+from core.config.config import settings
+from core.repository import codec
 from core.repository.models.ai_state_model import AIStateModel
+from core.repository.write_behind_flusher import WriteBehindFlusher
 from domain.entities.ai_state import AIState
 
 logger = logging.getLogger(__name__)
 
 
+STATE_COLUMNS: list[str] = [
+    AIStateModel.data_state.key,
+    AIStateModel.data_storage.key,
+    AIStateModel.data_writes.key,
+    AIStateModel.data_default.key,
+]
+
+
+class RecordReadCache:
+    """
+    Кратковременный кэш строки ai_state, общий для всех SQLAlchemyDBDict одной фабрики.
+
+    Первое обращение читает все колонки состояния одним запросом, каждая колонка
+    отдаётся один раз и сразу забывается, чтобы не держать копии больших blob'ов.
+    """
+
+    def __init__(self, repository: IRepositoryDBDict, record_id: str | int, ttl: float = settings.READ_CACHE_TTL):
+        self.__repository: IRepositoryDBDict = repository
+        self.__record_id = record_id
+        self.__ttl = ttl
+        self.__columns: dict[str, bytes | None] | None = None
+        self.__loaded_at = 0.0
+        self.__lock = threading.Lock()
+
+    def pop(self, col_name: str) -> bytes | None:
+        with self.__lock:
+            if self.__columns is None or time.monotonic() - self.__loaded_at > self.__ttl:
+                columns = self.__repository.get_chat_columns(record_id=self.__record_id, col_names=STATE_COLUMNS)
+                self.__columns = columns if columns is not None else dict.fromkeys(STATE_COLUMNS)
+                self.__loaded_at = time.monotonic()
+            if col_name in self.__columns:
+                return self.__columns.pop(col_name)
+        # Колонку уже забрали (или её нет в STATE_COLUMNS) - читаем точечно
+        return self.__repository.get_chat_column(record_id=self.__record_id, col_name=col_name)
+
+
 class SQLAlchemyDBDict(defaultdict):
     @classmethod
-    def db_dict_factory(cls, repository: IRepositoryDBDict, record_id: str | int = None, col_name: str = None):
+    def db_dict_factory(
+        cls,
+        repository: IRepositoryDBDict,
+        record_id: str | int = None,
+        col_name: str = None,
+        flusher: WriteBehindFlusher | None = None,
+    ):
         if not record_id:
             record_id = repository.get_next_id()
+        read_cache = RecordReadCache(repository=repository, record_id=record_id)
 
         def create_db_dict(default_factory=None):
             if col_name:
@@ -27,16 +75,33 @@ class SQLAlchemyDBDict(defaultdict):
                     _col_name = AIStateModel.data_storage.key
                 else:
                     _col_name = AIStateModel.data_default.key
-            instance = cls(default_factory=default_factory, col_name=_col_name, record_id=record_id, repository=repository)
+            instance = cls(
+                default_factory=default_factory,
+                col_name=_col_name,
+                record_id=record_id,
+                repository=repository,
+                flusher=flusher,
+                read_cache=read_cache,
+            )
             return instance
 
         return create_db_dict, record_id
 
-    def __init__(self, default_factory, col_name, record_id: str | int, repository: IRepositoryDBDict):
+    def __init__(
+        self,
+        default_factory,
+        col_name,
+        record_id: str | int,
+        repository: IRepositoryDBDict,
+        flusher: WriteBehindFlusher | None = None,
+        read_cache: RecordReadCache | None = None,
+    ):
         super().__init__(default_factory)
         self.col_name = col_name
         self.record_id: str | int = record_id
         self.bd_repository: IRepositoryDBDict = repository
+        self.flusher: WriteBehindFlusher | None = flusher
+        self.read_cache: RecordReadCache | None = read_cache
 
         try:
             self.load_from_db()
@@ -45,10 +110,15 @@ class SQLAlchemyDBDict(defaultdict):
 
     def load_from_db(self):
         try:
-            ai_state = self.bd_repository.get_chat(record_id=self.record_id)
-            if ai_state:
-                data = pickle.loads(getattr(ai_state, self.col_name, None))
-                super().update(data)
+            if self.read_cache:
+                raw = self.read_cache.pop(col_name=self.col_name)
+            else:
+                raw = self.bd_repository.get_chat_column(record_id=self.record_id, col_name=self.col_name)
+            if raw:
+                pickled_data = codec.decode_bytes(raw)
+                super().update(pickle.loads(pickled_data))
+                if self.flusher:
+                    self.flusher.remember(record_id=self.record_id, col_name=self.col_name, raw=pickled_data)
         except Exception as e:
             logger.error(f"load_from_db error, {e}")
         logger.info(f"Loaded from {self.record_id}")
@@ -57,14 +127,19 @@ class SQLAlchemyDBDict(defaultdict):
         try:
             logger.info(f"Syncing from {self.record_id}")
             data = dict(self)
-            pickled_data = pickle.dumps(data)
-            if data:
+            # Сериализация здесь, в потоке хода, и при флашере: вложенные словари InMemorySaver
+            # (чат -> ns -> чекпоинт) меняются следующим ходом, и снимок storage, сериализованный
+            # позже, разошёлся бы со снимками blobs и writes. Флашеру остаются сжатие и запись
+            pickled_data = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            if data and self.flusher:
+                self.flusher.mark_dirty(record_id=self.record_id, col_name=self.col_name, raw=pickled_data)
+            elif data:
                 ai_state = self.bd_repository.get_chat(record_id=self.record_id)
                 if ai_state is None:
-                    ai_state = AIState(**{"id":self.record_id, self.col_name:pickled_data})
+                    ai_state = AIState(**{"id":self.record_id, self.col_name:codec.encode_bytes(pickled_data)})
                     self.bd_repository.create(ai_state=ai_state)
-                elif getattr(ai_state, self.col_name, None) != pickled_data:
-                    setattr(ai_state, self.col_name, pickled_data)
+                elif codec.decode_bytes(getattr(ai_state, self.col_name, None) or b"") != pickled_data:
+                    setattr(ai_state, self.col_name, codec.encode_bytes(pickled_data))
                     self.bd_repository.update(ai_state=ai_state)
 
         except Exception as e:
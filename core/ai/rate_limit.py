@@ -1,8 +1,15 @@
+import asyncio
 import logging
+import re
 import threading
 import time
 from functools import wraps
-from typing import ParamSpec, TypeVar, Callable
+from typing import Any, ParamSpec, TypeVar, Callable
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from core.config.config import settings
 
 
 logger = logging.getLogger(__name__)
@@ -12,59 +19,248 @@ P = ParamSpec("P")
 R = TypeVar("R")
 
 
+DEFAULT_KEY = "default"
+# Подсказка сервера о паузе в тексте ошибки квоты: "retry in 12.5s" / "'retryDelay': '12s'"
+RETRY_DELAY_PATTERN = re.compile(r"retry(?:Delay'?:\s*'?|\s+in\s+)(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+class TokenBucket:
+    """
+    Корзина токенов с пополнением rate_per_minute и адаптивным снижением скорости (AIMD).
+
+    acquire резервирует токен под блокировкой и возвращает время ожидания - спит вызывающий
+    уже без блокировки, поэтому параллельные вызовы не выстраиваются в очередь, пока квота есть.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None, min_rate_per_minute: float = 1.0):
+        self.max_rate_per_minute: float = rate_per_minute
+        self.rate_per_minute: float = rate_per_minute
+        self.min_rate_per_minute: float = min(min_rate_per_minute, rate_per_minute)
+        # Не больше четверти минутной квоты сразу: с пополнением за минуту уходит не больше 1.25 квоты,
+        # а если сервер всё же ответит 429, скорость снизит backoff
+        self.capacity: float = capacity if capacity is not None else max(1.0, rate_per_minute / 4)
+        self.tokens: float = self.capacity
+        self.blocked_until: float = 0.0
+        self.updated_at: float = time.monotonic()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+
+    def reserve(self, blocking: bool = True) -> float | None:
+        """Занимает токен; сколько секунд подождать перед вызовом, None - токена нет и ждать нельзя"""
+        with self.lock:
+            now = time.monotonic()
+            self.__refill(now)
+            wait_time = max(0.0, self.blocked_until - now)
+            if self.tokens < 1:
+                wait_time = max(wait_time, (1 - self.tokens) * 60 / self.rate_per_minute)
+            if wait_time > 0 and not blocking:
+                return None
+            # Токен может уйти в минус: это очередь уже зарезервированных вызовов
+            self.tokens -= 1
+            self.calls += 1
+            if wait_time > 0:
+                self.waits += 1
+                self.total_wait += wait_time
+                self.max_wait = max(self.max_wait, wait_time)
+            return wait_time
+
+    def on_rate_limited(self, retry_after: float | None = None):
+        """Ответ 429 / исчерпана квота: скорость вдвое ниже, новые вызовы ждут паузу сервера"""
+        with self.lock:
+            now = time.monotonic()
+            self.__refill(now)
+            self.rate_per_minute = max(self.min_rate_per_minute, self.rate_per_minute / 2)
+            self.tokens = min(self.tokens, 0.0)
+            pause = retry_after if retry_after is not None else 60 / self.rate_per_minute
+            self.blocked_until = max(self.blocked_until, now + pause)
+            self.throttled += 1
+        logger.warning(f"Rate limited, new rate: {self.rate_per_minute:.1f}/min, pause: {pause:.1f}s")
+
+    def on_success(self):
+        """Успешный вызов: скорость понемногу возвращается к квоте"""
+        if self.rate_per_minute >= self.max_rate_per_minute:
+            return
+        with self.lock:
+            self.__refill(time.monotonic())
+            self.rate_per_minute = min(self.max_rate_per_minute, self.rate_per_minute + self.max_rate_per_minute / 10)
+
+    def set_rate(self, rate_per_minute: float):
+        with self.lock:
+            self.__refill(time.monotonic())
+            self.max_rate_per_minute = rate_per_minute
+            self.rate_per_minute = rate_per_minute
+            self.min_rate_per_minute = min(self.min_rate_per_minute, rate_per_minute)
+            self.capacity = max(1.0, rate_per_minute / 4)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def metrics(self) -> dict[str, float]:
+        with self.lock:
+            self.__refill(time.monotonic())
+            return {
+                "tokens": round(self.tokens, 3),
+                "capacity": self.capacity,
+                "rate_per_minute": round(self.rate_per_minute, 3),
+                "max_rate_per_minute": self.max_rate_per_minute,
+                "calls": self.calls,
+                "waits": self.waits,
+                "total_wait": round(self.total_wait, 3),
+                "max_wait": round(self.max_wait, 3),
+                "throttled": self.throttled,
+            }
+
+    def __refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_minute / 60)
+        self.updated_at = now
+
+
 class RateLimiter:
-    def __init__(self, max_calls_per_minute: int):
+    """
+    Ограничение частоты вызовов с отдельной корзиной на ключ (модель, инструмент).
+
+    Квота ключа берётся из limits, для остальных - max_calls_per_minute.
+    """
+
+    def __init__(self, max_calls_per_minute: int, limits: dict[str, int] | None = None):
         self.max_calls_per_minute = max_calls_per_minute
-        self.min_interval = 60 / max_calls_per_minute
+        self.limits: dict[str, int] = dict(limits or {})
         self.lock = threading.Lock()
-        self.last_call = 0.0
-        self.call_times = []  # лог вызовов
+        self.__buckets: dict[str, TokenBucket] = {}
 
-    def update_rate_limit(self, new_limit: int):
-        self.max_calls_per_minute = new_limit
-        self.min_interval = 60 / new_limit
-        logger.info(
-            f"update_rate_limit: {new_limit}, new min interval: {self.min_interval}"
-        )
-
-    def wait(self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> Callable[P, R]:
+    def bucket(self, key: str = DEFAULT_KEY) -> TokenBucket:
         with self.lock:
-            start_exec_time = time.time()
-            wait_time = self.min_interval - (start_exec_time - self.last_call)
-            if self.last_call and wait_time > 0:
-                logger.info(f"wait befor call for: {wait_time} seconds")
-                time.sleep(wait_time)
-
-            self._log_call(time.time())
-            self.last_call = time.time()
+            if key not in self.__buckets:
+                self.__buckets[key] = TokenBucket(rate_per_minute=self.limits.get(key, self.max_calls_per_minute))
+            return self.__buckets[key]
+
+    def update_rate_limit(self, new_limit: int, key: str | None = None):
+        if key is None:
+            self.max_calls_per_minute = new_limit
+            with self.lock:
+                buckets = [bucket for bucket_key, bucket in self.__buckets.items() if bucket_key not in self.limits]
+        else:
+            self.limits[key] = new_limit
+            buckets = [self.bucket(key)]
+        for bucket in buckets:
+            bucket.set_rate(new_limit)
+        logger.info(f"update_rate_limit: {new_limit} for {key or 'all keys'}")
+
+    def acquire(self, key: str = DEFAULT_KEY, blocking: bool = True) -> bool:
+        wait_time = self.bucket(key).reserve(blocking=blocking)
+        if wait_time is None:
+            return False
+        if wait_time > 0:
+            logger.info(f"[RateLimiter] {key}: wait before call for {wait_time:.2f} seconds")
+            time.sleep(wait_time)
+        return True
+
+    async def aacquire(self, key: str = DEFAULT_KEY, blocking: bool = True) -> bool:
+        wait_time = self.bucket(key).reserve(blocking=blocking)
+        if wait_time is None:
+            return False
+        if wait_time > 0:
+            logger.info(f"[RateLimiter] {key}: wait before call for {wait_time:.2f} seconds")
+            await asyncio.sleep(wait_time)
+        return True
+
+    def wait(self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+        """Вызывает func после получения токена общей корзины; сам вызов идёт без блокировки"""
+        self.acquire()
+        try:
             result = func(*args, **kwargs)
-            return result
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.report_rate_limited(retry_after=retry_after(e))
+            raise
+        self.report_success()
+        return result
+
+    def report_rate_limited(self, key: str = DEFAULT_KEY, retry_after: float | None = None):
+        self.bucket(key).on_rate_limited(retry_after=retry_after)
+
+    def report_success(self, key: str = DEFAULT_KEY):
+        self.bucket(key).on_success()
+
+    def metrics(self) -> dict[str, dict[str, float]]:
+        """Текущие токены, скорость и статистика ожиданий по ключам"""
+        with self.lock:
+            buckets = dict(self.__buckets)
+        return {key: bucket.metrics() for key, bucket in buckets.items()}
+
 
-    def _log_call(self, now):
-        readable = time.strftime("%H:%M:%S", time.localtime(now))
-        logger.info(f"[RateLimiter] Tool called at {readable}")
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    429 / RESOURCE_EXHAUSTED от Gemini. google-genai кладёт их в code и status ClientError,
+    langchain оборачивает ClientError в своё исключение (raise ... from e), поэтому смотрим всю цепочку.
+    Текст ошибки не проверяется: "429" или "quota" в нём бывают и у других ошибок.
+    """
+    seen: set[int] = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if any(getattr(error, attr, None) == 429 for attr in ("code", "status_code")):
+            return True
+        if getattr(error, "status", None) == "RESOURCE_EXHAUSTED":
+            return True
+        error = error.__cause__ or error.__context__
+    return False
 
-        # Добавляем новый вызов
-        self.call_times.append(now)
 
-        # Очистим старые вызовы (старше 60 сек) — если нужно контролировать окно
-        one_minute_ago = now - 60
-        self.call_times = [t for t in self.call_times if t >= one_minute_ago]
+def retry_after(error: BaseException) -> float | None:
+    # retryDelay лежит в деталях исходной ClientError, обёртка langchain его может не повторять
+    seen: set[int] = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        match = RETRY_DELAY_PATTERN.search(str(error))
+        if match:
+            return float(match.group(1))
+        error = error.__cause__ or error.__context__
+    return None
 
-        # Проверка: если вдруг вызовов стало больше чем разрешено
-        if len(self.call_times) > self.max_calls_per_minute:
-            logger.info(
-                f"[RateLimiter][WARNING] Exceeded rate: {len(self.call_times)} calls in the last minute"
-            )
 
+class LangChainRateLimiter(BaseRateLimiter):
+    """Корзина RateLimiter в роли rate_limiter модели langchain"""
 
+    def __init__(self, limiter: RateLimiter, key: str):
+        self.limiter = limiter
+        self.key = key
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        return self.limiter.acquire(key=self.key, blocking=blocking)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return await self.limiter.aacquire(key=self.key, blocking=blocking)
+
+
+class RateLimitFeedback(BaseCallbackHandler):
+    """Сообщает RateLimiter об успешных вызовах модели и об ошибках квоты - по ним работает backoff"""
+
+    def __init__(self, limiter: RateLimiter, key: str):
+        self.limiter = limiter
+        self.key = key
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        self.limiter.report_success(key=self.key)
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        if is_rate_limit_error(error):
+            self.limiter.report_rate_limited(key=self.key, retry_after=retry_after(error))
+
+
+# Инструменты агента
 rate_limiter: RateLimiter = RateLimiter(10)
+# Запросы к моделям, ключ - имя модели
+model_rate_limiter: RateLimiter = RateLimiter(
+    max_calls_per_minute=settings.MODEL_RATE_LIMIT_PER_MINUTE,
+    limits=settings.MODEL_RATE_LIMITS,
+)
 
 
 def rate_limited_tools_per_minute(func: Callable[P, R]) -> Callable[P, R]:
     @wraps(func)
     def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
-        result = rate_limiter.wait(func=func, *args, **kwargs)
+        result = rate_limiter.wait(func, *args, **kwargs)
         return result
     return wrapper
-
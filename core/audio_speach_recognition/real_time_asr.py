@@ -13,6 +13,8 @@ import numpy as np
 from core.audio_speach_recognition.speach_recognizer import SpeechRecognizer
 from application.services.hot_key_service import HotkeyService
 from core.event_dispatcher import dispatcher
+from core.media.audio_encoder import AudioEncoder
+from domain.enums.content_media_type import MimeType
 from domain.enums.signal import Signal
 from domain.enums.status_statusbar import Status
 
@@ -90,6 +92,8 @@ class RealTimeASR:
         self.__recording_speech = False
         self.__manual_recording = False
         self.__manual_start_time = None
+        # Сжатие записи для вложения, создаётся только для записи с кнопки окна
+        self.__recording_encoder: AudioEncoder | None = None
 
         # Настройки для распознавания
         self.__min_speech_length = int(0.3 * target_sample_rate)
@@ -405,9 +409,11 @@ class RealTimeASR:
             )
             recognition_thread.start()
 
-    def start_recording_audio(self):
+    def start_recording_audio(self, encode: bool = False):
+        """encode - сжимать запись по ходу для вложения в сообщение, см. take_recorded_audio"""
         if not self.__manual_recording:
             dispatcher.send(signal=Signal.set_status, status=Status.STARTED_RECORD)
+            self.__recording_encoder = AudioEncoder(sample_rate=self.__target_sample_rate) if encode else None
             self.__manual_recording = True
             self.__manual_start_time = time.time()
             self.__speech_buffer = []
@@ -488,6 +494,9 @@ class RealTimeASR:
 
                     # Сохраняем данные только во время записи
                     if self.__manual_recording:
+                        encoder = self.__recording_encoder
+                        if encoder is not None:
+                            encoder.write(chunk_data)
                         self.__speech_buffer.extend(chunk_data)
                         if len(self.__speech_buffer) > self.__max_speech_length:
                             self.__speech_buffer = self.__speech_buffer[-self.__max_speech_length:]
@@ -501,6 +510,13 @@ class RealTimeASR:
         logger.info("Процесс обработки аудио остановлен...")
 
 
+    def take_recorded_audio(self, audio_array) -> tuple[str, str]:
+        """base64 и mime_type записи: сжатой по ходу записи, если она шла с encode, иначе WAV из audio_array"""
+        encoder, self.__recording_encoder = self.__recording_encoder, None
+        if encoder is None:
+            return self.convert_to_wav_base64(audio_array=audio_array), MimeType.WAV.value
+        return base64.b64encode(encoder.finish()).decode("utf-8"), encoder.mime_type
+
     def convert_to_wav_base64(self, audio_array) -> str:
         """Конвертация numpy array в WAV и кодирование в base64"""
         # Нормализуем и конвертируем в 16-bit PCM
@@ -17,6 +17,81 @@ class Settings(BaseSettings):
 
     #sqlite
     DATABASE_FILE_NAME: str = "database.db"
+    # Профиль PRAGMA: safe, balanced, fast (см. PRAGMA_PROFILES в sqlite_session.py)
+    SQLITE_PRAGMA_PROFILE: str = "balanced"
+    # Точечные переопределения PRAGMA поверх профиля, например {"mmap_size": 0}
+    SQLITE_PRAGMAS: dict[str, str | int] = {}
+    # Соединений только на чтение в пуле (UI, загрузка чатов)
+    SQLITE_READ_POOL_SIZE: int = 4
+    # Сколько (сек) писатель ждёт единственное соединение на запись
+    SQLITE_WRITE_TIMEOUT: float = 30.0
+    # Размер кэша подготовленных выражений sqlite3 на соединение
+    SQLITE_CACHED_STATEMENTS: int = 256
+    # Логирование SQL-запросов SQLAlchemy
+    SQLITE_ECHO: bool = False
+
+    # "sqlite" - построчный SQLiteCheckpointSaver, "memory" - InMemorySaver поверх SQLAlchemyDBDict
+    CHECKPOINTER_BACKEND: str = "sqlite"
+    # Окно (сек) для схлопывания повторных записей SQLAlchemyDBDict в фоновом флашере
+    WRITE_BEHIND_DELAY: float = 0.5
+    # Сколько последних чекпоинтов хранить на чат (0 - все); именованные, точки ветвления и концы веток не удаляются
+    CHECKPOINT_RETENTION: int = 10
+    # Период (сек) фоновой компактизации: сборка неиспользуемых blob'ов и incremental_vacuum
+    COMPACTION_INTERVAL: float = 600.0
+    # Через сколько дней без изменений чат уходит в архивный сегмент (0 - не архивировать)
+    ARCHIVE_AFTER_DAYS: float = 30.0
+    # Размер (байт), после которого архив пишет в новый файл сегмента
+    ARCHIVE_SEGMENT_SIZE: int = 64 * 1024 * 1024
+    # Сколько открытых чатов держать в памяти для быстрого переключения (0 - только текущий)
+    AGENT_CACHE_SIZE: int = 8
+    # Предел (байт) оценочного объёма истории чатов в кэше, сверх него давние чаты вытесняются (0 - без предела).
+    # Только для CHECKPOINTER_BACKEND="memory": с sqlite история в кэше не хранится, предел - AGENT_CACHE_SIZE
+    AGENT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    # Сколько запросов к модели (по разным чатам) выполняется одновременно
+    AGENT_MAX_CONCURRENCY: int = 4
+    # Запросов в минуту к модели по умолчанию
+    MODEL_RATE_LIMIT_PER_MINUTE: int = 15
+    # Квоты отдельных моделей (имя модели -> запросов в минуту), например {"gemini-2.0-flash": 15}
+    MODEL_RATE_LIMITS: dict[str, int] = {}
+    # Бюджет (токенов) истории в запросе к модели (0 - без обрезки)
+    CONTEXT_MAX_TOKENS: int = 200000
+    # Бюджеты отдельных моделей (имя модели -> токенов)
+    CONTEXT_MODEL_LIMITS: dict[str, int] = {}
+    # "model" - обрезать только запрос к модели, "history" - удалять старые сообщения и из истории чата
+    CONTEXT_TRIM_MODE: str = "model"
+    # Сколько (токенов) несжатой истории чата допускается, сверх этого старые ходы в фоне
+    # пересказываются в краткое содержание (0 - сжатие выключено)
+    DIGEST_THRESHOLD_TOKENS: int = 0
+    # Сколько (токенов) последних сообщений остаётся в запросе без сжатия
+    DIGEST_KEEP_TOKENS: int = 8000
+    # Дешёвая модель для сжатия
+    DIGEST_MODEL: str = "gemini-2.0-flash-lite"
+    # Предел (пикселей) длинной стороны изображения перед отправкой модели (0 - не уменьшать)
+    IMAGE_MAX_SIDE: int = 2048
+    # Сколько изображений одного сообщения подготавливаются параллельно
+    IMAGE_PIPELINE_WORKERS: int = 4
+    # Сжатие записи с микрофона для вложения: opus (OGG/Opus) или flac (без потерь); без soundfile - WAV
+    AUDIO_FORMAT: str = "opus"
+    # Видео до этого размера (байт) отправляется как есть, со звуком; большее - ключевыми кадрами
+    VIDEO_INLINE_MAX_BYTES: int = 4 * 1024 * 1024
+    # Сколько кадров в секунду брать из видео (для длинных видео реже, см. VIDEO_MAX_FRAMES)
+    VIDEO_SAMPLE_FPS: float = 1.0
+    # Предел (пикселей) длинной стороны кадра
+    VIDEO_FRAME_MAX_SIDE: int = 1280
+    # Сколько кадров максимум на одно видео
+    VIDEO_MAX_FRAMES: int = 120
+    # Предел (байт) суммарного размера кадров одного видео, сверх него кадры прореживаются
+    VIDEO_MAX_BYTES: int = 8 * 1024 * 1024
+    # Время жизни (сек) ответа в кэше одиночных запросов (0 - без срока)
+    RESPONSE_CACHE_TTL: float = 7 * 24 * 3600.0
+    # Предел (байт) кэша ответов, сверх него вытесняются давно не использованные (0 - без предела)
+    RESPONSE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    # Время жизни (сек) общего кэша строки ai_state при открытии чата
+    READ_CACHE_TTL: float = 5.0
+    # Кодек сохраняемого состояния: raw, zlib, lzma, zstd (без пакета zstandard используется zlib)
+    STATE_CODEC: str = "zstd"
+    # Уровень сжатия для STATE_CODEC, None - уровень кодека по умолчанию
+    STATE_CODEC_LEVEL: Optional[int] = None
 
 
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8', extra='ignore')
@@ -30,4 +105,11 @@ class Settings(BaseSettings):
         url = f"sqlite+pysqlite:///{db_path}"
         return url
 
+    ARCHIVE_DIR: Optional[str] = None
+    @validator("ARCHIVE_DIR", pre=True, always=True)
+    def assemble_archive_dir(cls, v: str | None) -> str:
+        if isinstance(v, str):
+            return v
+        return os.path.join(os.path.abspath("."), "core", "cache", "archive")
+
 settings = Settings() 
\ No newline at end of file
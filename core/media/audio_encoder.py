@@ -0,0 +1,100 @@
+import io
+import logging
+import threading
+import wave
+
+import numpy as np
+
+from core.config.config import settings
+from domain.enums.content_media_type import MimeType
+
+
+logger = logging.getLogger(__name__)
+
+
+SOUNDFILE_AVAILABLE = False
+
+try:
+    import soundfile as sf
+
+    SOUNDFILE_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError - пакет есть, но не найдена libsndfile
+    logger.warning("soundfile not available, audio will be attached as WAV")
+
+
+# AUDIO_FORMAT -> (format, subtype, mime_type) для soundfile
+AUDIO_FORMATS: dict[str, tuple[str, str, str]] = {
+    "opus": ("OGG", "OPUS", MimeType.OGG.value),
+    "flac": ("FLAC", "PCM_16", MimeType.FLAC.value),
+}
+
+
+class AudioEncoder:
+    """
+    Сжатие записи с микрофона по мере поступления блоков, к концу записи файл уже готов.
+
+    Пробует AUDIO_FORMAT (opus - OGG/Opus, flac - FLAC без потерь), затем FLAC,
+    без soundfile или нужного кодека в libsndfile пишет обычный 16-битный WAV.
+    """
+
+    def __init__(self, sample_rate: int, audio_format: str = settings.AUDIO_FORMAT):
+        self.sample_rate: int = sample_rate
+        self.frames: int = 0
+        self.__buffer = io.BytesIO()
+        self.__lock = threading.Lock()
+        self.__sound_file = None
+        self.__wav_file: wave.Wave_write | None = None
+        self.mime_type: str = self.__open(audio_format=audio_format)
+        self.__finished = False
+
+    def write(self, samples: np.ndarray):
+        """Дописывает блок float-сэмплов в диапазоне [-1, 1]"""
+        samples = np.clip(np.asarray(samples, dtype=np.float32), -1.0, 1.0)
+        with self.__lock:
+            if self.__finished:
+                return
+            if self.__sound_file is not None:
+                self.__sound_file.write(samples)
+            else:
+                self.__wav_file.writeframes((samples * 32767).astype(np.int16).tobytes())
+            self.frames += len(samples)
+
+    def finish(self) -> bytes:
+        """Закрывает файл и возвращает его байты, дальнейшие write игнорируются"""
+        with self.__lock:
+            if not self.__finished:
+                self.__finished = True
+                if self.__sound_file is not None:
+                    self.__sound_file.close()
+                else:
+                    self.__wav_file.close()
+        data = self.__buffer.getvalue()
+        logger.info(f"Audio encoded: {self.frames / self.sample_rate:.1f}s, {len(data)} bytes, {self.mime_type}")
+        return data
+
+    def __open(self, audio_format: str) -> str:
+        if SOUNDFILE_AVAILABLE:
+            for name in dict.fromkeys((audio_format, "flac")):
+                if name not in AUDIO_FORMATS:
+                    continue
+                file_format, subtype, mime_type = AUDIO_FORMATS[name]
+                try:
+                    self.__sound_file = sf.SoundFile(
+                        self.__buffer,
+                        mode="w",
+                        samplerate=self.sample_rate,
+                        channels=1,
+                        format=file_format,
+                        subtype=subtype,
+                    )
+                    return mime_type
+                except Exception as e:
+                    # Например, Opus без поддержки в libsndfile или с неподходящей частотой
+                    logger.warning(f"Audio format {name} not available: {e}")
+                    self.__buffer = io.BytesIO()
+        self.__wav_file = wave.open(self.__buffer, "wb")
+        self.__wav_file.setnchannels(1)
+        self.__wav_file.setsampwidth(2)
+        self.__wav_file.setframerate(self.sample_rate)
+        return MimeType.WAV.value
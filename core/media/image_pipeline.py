@@ -0,0 +1,147 @@
+import base64
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageStat, features
+
+from core.config.config import settings
+from domain.enums.content_media_type import ContentMediaType, MimeType
+
+
+logger = logging.getLogger(__name__)
+
+
+# Что перекодируем: svg - не растр, gif может быть анимированным
+SOURCE_MIME_TYPES = {MimeType.PNG.value, MimeType.JPEG.value, MimeType.BMP.value, MimeType.WEBP.value}
+# Снимок экрана, текст, схема: почти все пиксели - несколько цветов фона, текста и рамок
+GRAPHIC_TOP_COLORS = 32
+GRAPHIC_COVERAGE = 0.8
+# Средняя насыщенность (HSV, 0-255), ниже которой графика сохраняется в оттенках серого
+GRAYSCALE_SATURATION = 8
+SAMPLE_SIDE = 256
+PHOTO_QUALITY = 85
+# Прозрачные области заливаются этим цветом: иначе convert("L"/"RGB") делает их чёрными
+# и тёмный текст прозрачной схемы пропадает на чёрном фоне
+BACKGROUND_COLOR = (255, 255, 255)
+
+
+class ImagePipeline:
+    """
+    Подготовка изображений из сообщения перед отправкой модели.
+
+    Изображение уменьшается до max_side по длинной стороне (больше модель всё равно не различает),
+    снимки экрана и текст сохраняются в PNG без потерь - в оттенках серого или с палитрой,
+    фотографии - в WebP (JPEG, если Pillow собран без WebP). Результат берётся, только если он
+    меньше исходного. Прозрачность заменяется белым фоном. Несколько изображений одного
+    сообщения обрабатываются параллельно.
+    """
+
+    def __init__(self, max_side: int = settings.IMAGE_MAX_SIDE, workers: int = settings.IMAGE_PIPELINE_WORKERS):
+        self.max_side: int = max_side
+        self.__executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ImagePipeline")
+        self.__photo_format, self.__photo_mime_type = (
+            ("WEBP", MimeType.WEBP.value) if features.check("webp") else ("JPEG", MimeType.JPEG.value)
+        )
+
+    def process_content(self, content: list[dict] | str) -> list[dict] | str:
+        """Копия содержимого сообщения с подготовленными изображениями"""
+        if not isinstance(content, list):
+            return content
+        indexes = [index for index, block in enumerate(content) if self.__source(block)]
+        if not indexes:
+            return content
+        result = list(content)
+        if len(indexes) == 1:
+            result[indexes[0]] = self.__process_block(content[indexes[0]])
+            return result
+        for index, block in zip(indexes, self.__executor.map(self.__process_block, [content[i] for i in indexes])):
+            result[index] = block
+        return result
+
+    def process(self, data: bytes) -> tuple[bytes, str] | None:
+        """Подготовленные байты и их mime_type, None - исходное изображение не хуже"""
+        started = time.perf_counter()
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            resized = max(image.size) > self.max_side > 0
+            if resized:
+                image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+            image = self.__flatten(image)
+            if self.__is_graphic(image):
+                encoded, mime_type = self.__encode_graphic(image), MimeType.PNG.value
+            else:
+                encoded, mime_type = self.__encode_photo(image), self.__photo_mime_type
+            size = image.size
+        if len(encoded) >= len(data) and not resized:
+            return None
+        logger.info(
+            f"Image prepared: {len(data)} -> {len(encoded)} bytes, {size[0]}x{size[1]} {mime_type}, "
+            f"{time.perf_counter() - started:.3f} seconds"
+        )
+        return encoded, mime_type
+
+    def __process_block(self, block: dict) -> dict:
+        mime_type, base64_data = block["image_url"][len("data:"):].split(";base64,", 1)
+        try:
+            processed = self.process(base64.b64decode(base64_data))
+        except Exception as e:
+            logger.error(f"Image pipeline error: {e}")
+            return block
+        if processed is None:
+            return block
+        data, mime_type = processed
+        return {**block, "image_url": f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"}
+
+    @staticmethod
+    def __source(block) -> bool:
+        if not isinstance(block, dict) or block.get("type") != ContentMediaType.IMAGE_URL.value:
+            return False
+        image_url = block.get("image_url")
+        if not isinstance(image_url, str) or not image_url.startswith("data:") or ";base64," not in image_url:
+            return False
+        return image_url[len("data:"):].split(";base64,", 1)[0] in SOURCE_MIME_TYPES
+
+    @staticmethod
+    def __flatten(image: Image.Image) -> Image.Image:
+        """Изображение без альфа-канала: прозрачные пиксели накладываются на BACKGROUND_COLOR"""
+        if image.mode == "P" and "transparency" in image.info:
+            image = image.convert("RGBA")
+        if image.mode not in ("RGBA", "LA", "PA", "RGBa", "La"):
+            return image
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (*BACKGROUND_COLOR, 255))
+        return Image.alpha_composite(background, image).convert("RGB")
+
+    @staticmethod
+    def __sample(image: Image.Image) -> Image.Image:
+        # Выборка без сглаживания: цвета пикселей сохраняются как есть
+        sample = image.convert("RGB")
+        sample.thumbnail((SAMPLE_SIDE, SAMPLE_SIDE), Image.Resampling.NEAREST)
+        return sample
+
+    def __is_graphic(self, image: Image.Image) -> bool:
+        sample = self.__sample(image)
+        pixels = sample.width * sample.height
+        colors = sample.getcolors(maxcolors=pixels)
+        top = sum(count for count, _ in sorted(colors, reverse=True)[:GRAPHIC_TOP_COLORS])
+        return top >= pixels * GRAPHIC_COVERAGE
+
+    def __encode_graphic(self, image: Image.Image) -> bytes:
+        saturation = ImageStat.Stat(self.__sample(image).convert("HSV")).mean[1]
+        if saturation < GRAYSCALE_SATURATION:
+            image = image.convert("L")
+        else:
+            # Без дизеринга: края букв остаются чёткими, 256 цветов хватает на сглаживание шрифта
+            image = image.convert("RGB").quantize(colors=256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG", optimize=True)
+        return buffer.getvalue()
+
+    def __encode_photo(self, image: Image.Image) -> bytes:
+        if self.__photo_format == "JPEG" or image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, self.__photo_format, quality=PHOTO_QUALITY)
+        return buffer.getvalue()
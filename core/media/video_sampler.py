@@ -0,0 +1,155 @@
+import base64
+import logging
+import time
+from typing import Callable
+
+import numpy as np
+
+from core.config.config import settings
+from domain.enums.content_media_type import ContentMediaType, MimeType
+
+
+logger = logging.getLogger(__name__)
+
+
+CV2_AVAILABLE = False
+
+try:
+    import cv2
+
+    CV2_AVAILABLE = True
+except ImportError:
+    logger.warning("OpenCV not available, large videos cannot be attached")
+
+
+# При шаге от 2 секунд дешевле перемотка к каждому кадру, чем декодирование всех подряд
+SEEK_MIN_INTERVAL = 2.0
+# Кадр, не отличающийся от предыдущего (статичный экран записи), пропускается: на уменьшенных
+# кадрах яркость заметно (больше DIFF_LEVEL из 255) изменилась меньше чем у DUPLICATE_SHARE пикселей
+DIFF_SIZE = (160, 90)
+DIFF_LEVEL = 16
+DUPLICATE_SHARE = 0.0005
+FRAME_QUALITY = 80
+
+
+class VideoSampler:
+    """
+    Видео для модели в виде ключевых кадров: файл читается потоково, в памяти только сжатые кадры.
+
+    Кадры берутся не чаще fps в секунду и не больше max_frames на всё видео (для длинных записей
+    шаг растёт), уменьшаются до max_side и сжимаются в JPEG. Повторяющиеся кадры пропускаются,
+    а если кадры не укладываются в max_bytes, они равномерно прореживаются.
+    """
+
+    def __init__(
+        self,
+        fps: float = settings.VIDEO_SAMPLE_FPS,
+        max_side: int = settings.VIDEO_FRAME_MAX_SIDE,
+        max_frames: int = settings.VIDEO_MAX_FRAMES,
+        max_bytes: int = settings.VIDEO_MAX_BYTES,
+    ):
+        self.fps: float = fps
+        self.max_side: int = max_side
+        self.max_frames: int = max_frames
+        self.max_bytes: int = max_bytes
+
+    def sample(self, path: str, on_progress: Callable[[float], None] | None = None) -> list[tuple[float, bytes]]:
+        """Кадры (секунда от начала, JPEG); on_progress получает долю обработанного видео 0..1"""
+        if not CV2_AVAILABLE:
+            raise RuntimeError("Для вложения видео нужен пакет opencv-python")
+        started = time.perf_counter()
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise ValueError(f"Не удалось открыть видео {path}")
+        try:
+            source_fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+            frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+            duration = frame_count / source_fps if frame_count > 0 else 0.0
+            interval = max(1 / self.fps, duration / self.max_frames if duration else 0.0)
+            if duration and interval >= SEEK_MIN_INTERVAL:
+                source = self.__seek_frames(capture=capture, interval=interval, duration=duration)
+            else:
+                source = self.__sequential_frames(capture=capture, interval=interval, source_fps=source_fps)
+            frames = self.__collect(source=source, duration=duration, on_progress=on_progress)
+        finally:
+            capture.release()
+        frames = self.__fit_budget(frames)
+        logger.info(
+            f"Video sampled: {len(frames)} frames, every {interval:.1f}s, "
+            f"{sum(len(data) for _, data in frames)} bytes, {time.perf_counter() - started:.2f} seconds"
+        )
+        return frames
+
+    @staticmethod
+    def to_content(name: str, frames: list[tuple[float, bytes]]) -> list[dict]:
+        """Блоки сообщения: подпись с временем перед каждым кадром"""
+        content = [{
+            "type": ContentMediaType.TEXT.value,
+            "text": f"Видео {name}, ключевые кадры ({len(frames)}) с отметками времени:",
+        }]
+        for timestamp, data in frames:
+            minutes, seconds = divmod(int(timestamp), 60)
+            content.append({"type": ContentMediaType.TEXT.value, "text": f"[{minutes:02d}:{seconds:02d}]"})
+            content.append({
+                "type": ContentMediaType.IMAGE_URL.value,
+                "image_url": f"data:{MimeType.JPEG.value};base64,{base64.b64encode(data).decode('utf-8')}",
+            })
+        return content
+
+    @staticmethod
+    def __sequential_frames(capture, interval: float, source_fps: float):
+        # grab без retrieve не переводит пропускаемые кадры в BGR
+        index = 0
+        next_time = 0.0
+        while capture.grab():
+            timestamp = index / source_fps
+            index += 1
+            if timestamp + 1e-6 < next_time:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            next_time = timestamp + interval
+            yield timestamp, frame
+
+    @staticmethod
+    def __seek_frames(capture, interval: float, duration: float):
+        timestamp = 0.0
+        while timestamp < duration:
+            capture.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield timestamp, frame
+            timestamp += interval
+
+    def __collect(self, source, duration: float, on_progress: Callable[[float], None] | None) -> list[tuple[float, bytes]]:
+        frames = []
+        previous = None
+        for timestamp, frame in source:
+            if on_progress and duration:
+                on_progress(min(1.0, timestamp / duration))
+            thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), DIFF_SIZE, interpolation=cv2.INTER_AREA)
+            if previous is not None and np.mean(cv2.absdiff(thumbnail, previous) > DIFF_LEVEL) < DUPLICATE_SHARE:
+                continue
+            previous = thumbnail
+            height, width = frame.shape[:2]
+            scale = self.max_side / max(height, width)
+            if scale < 1:
+                frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, FRAME_QUALITY])
+            if ok:
+                frames.append((timestamp, encoded.tobytes()))
+            if len(frames) >= self.max_frames:
+                break
+        if on_progress:
+            on_progress(1.0)
+        return frames
+
+    def __fit_budget(self, frames: list[tuple[float, bytes]]) -> list[tuple[float, bytes]]:
+        total = sum(len(data) for _, data in frames)
+        while self.max_bytes > 0 and total > self.max_bytes and len(frames) > 1:
+            # Равномерное прореживание, последний кадр (чем закончилось видео) сохраняется
+            frames = frames[-1::-2][::-1]
+            total = sum(len(data) for _, data in frames)
+        return frames
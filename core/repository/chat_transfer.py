@@ -0,0 +1,404 @@
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import IO, Iterator
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langgraph.checkpoint.base import empty_checkpoint
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from application.interfaces.Idatabase_session import IDatabaseSession
+from application.interfaces.Irepository_archive import IRepositoryArchive
+from application.interfaces.Irepository_bd_dict import IRepositoryDBDict
+from core.ai.checkpointer import SQLiteCheckpointSaver
+from core.repository import codec
+from core.repository.models.ai_state_model import AIStateModel
+from core.repository.models.chat_summary_model import ChatSummaryModel
+from core.repository.models.checkpoint_model import CheckpointModel, CheckpointBlobModel, CheckpointMessageModel
+from core.repository.models.media_blob_model import MediaBlobModel
+from core.repository.repository_archive import RepositoryArchive
+from core.repository.repository_bd_dict import RepositoryDBDict
+from core.repository.repository_checkpoint import (
+    MESSAGES_CHANNEL,
+    MESSAGE_REFS_TYPE,
+    RepositoryCheckpoint,
+    decode_message_refs,
+    encode_message_refs,
+)
+from core.repository.sqlite_session import SQLiteDatabaseSession
+from domain.enums.content_media_type import ContentMediaType
+
+
+logger = logging.getLogger(__name__)
+
+
+CHATS_FILE = "chats.ndjson"
+MEDIA_DIR = "media"
+FORMAT_VERSION = 1
+# Вторичные индексы таблиц, в которые пишет импорт: удаляются на время загрузки и строятся один раз в конце
+DEFERRED_INDEXES = [*CheckpointModel.__table__.indexes, *ChatSummaryModel.__table__.indexes]
+
+
+def media_path(root: Path, sha256: str) -> Path:
+    """Путь медиафайла в выгрузке: media/ab/abcdef..."""
+    return root / MEDIA_DIR / sha256[:2] / sha256
+
+
+class ChatExporter:
+    """
+    Выгрузка чатов в каталог: chats.ndjson и медиафайлы по sha256.
+
+    В chats.ndjson сначала строка чата, затем по строке на сообщение. Строки пишутся
+    сразу, сообщения читаются из базы пачками: в памяти список ключей сообщений чата
+    и одна пачка. Медиа в сообщениях заменяются ссылками media_ref на файлы в media/.
+
+    Исключения: чат старого формата (вся история одним blob'ом, до первого нового хода)
+    разбирается целиком, а архивный чат читается из сегмента одним кадром - в памяти
+    сжатые строки кадра, сообщения из них разбираются по одному.
+    """
+
+    def __init__(
+        self,
+        repository: IRepositoryDBDict,
+        checkpointer: SQLiteCheckpointSaver,
+        database: IDatabaseSession,
+        archive: IRepositoryArchive | None = None,
+    ):
+        self.repository: IRepositoryDBDict = repository
+        self.checkpointer: SQLiteCheckpointSaver = checkpointer
+        self.database: IDatabaseSession = database
+        self.archive: IRepositoryArchive | None = archive
+
+    def export(self, out_dir: str | Path, chat_ids: list[int] | None = None) -> dict[str, int]:
+        root = Path(out_dir)
+        (root / MEDIA_DIR).mkdir(parents=True, exist_ok=True)
+        stats = {"chats": 0, "messages": 0, "media": 0}
+        if chat_ids is None:
+            chat_ids = sorted(chat_id for chat_id, _ in self.repository.get_list_chats())
+        with open(root / CHATS_FILE, "w", encoding="utf-8") as file:
+            for chat_id in chat_ids:
+                for line in self.iter_chat(chat_id=chat_id, root=root, stats=stats):
+                    file.write(json.dumps(line, ensure_ascii=False))
+                    file.write("\n")
+        logger.info(f"Exported to {root}: {stats}")
+        return stats
+
+    def iter_chat(self, chat_id: int, root: Path, stats: dict[str, int]) -> Iterator[dict]:
+        message_count, messages = self.checkpointer.iter_messages(
+            {"configurable": {"thread_id": str(chat_id), "checkpoint_ns": ""}}
+        )
+        if not message_count and self.archive:
+            message_count, messages = self.__archived_messages(chat_id=chat_id)
+        if not message_count:
+            return
+        with self.database.get_read_session() as session:
+            summary = session.get(ChatSummaryModel, chat_id)
+            title, updated_at, media_bytes = (
+                (summary.title, summary.updated_at, summary.media_bytes) if summary else (None, time.time(), 0)
+            )
+
+        stats["chats"] += 1
+        yield {
+            "type": "chat",
+            "version": FORMAT_VERSION,
+            "chat_id": chat_id,
+            "title": title,
+            "updated_at": updated_at,
+            "media_bytes": media_bytes,
+            "message_count": message_count,
+        }
+        for index, message in enumerate(messages):
+            if isinstance(message.content, list):
+                message = message.model_copy(
+                    update={"content": [self.__export_block(block=block, root=root, stats=stats) for block in message.content]}
+                )
+            stats["messages"] += 1
+            yield {"type": "message", "chat_id": chat_id, "index": index, "message": message_to_dict(message)}
+
+    def __archived_messages(self, chat_id: int) -> tuple[int, Iterator[BaseMessage]]:
+        """История архивного чата прямо из сегмента, без возврата чата в базу"""
+        rows = self.archive.load_rows(chat_id=chat_id)
+        checkpoints = [row for row in (rows or {}).get(CheckpointModel.__tablename__, []) if row["checkpoint_ns"] == ""]
+        if not checkpoints:
+            return 0, iter([])
+        latest = max(checkpoints, key=lambda row: row["checkpoint_id"])
+        checkpoint = self.checkpointer.serde.loads_typed((latest["checkpoint_type"], latest["checkpoint_data"]))
+        version = checkpoint["channel_versions"].get(MESSAGES_CHANNEL)
+        for row in rows[CheckpointBlobModel.__tablename__]:
+            if row["checkpoint_ns"] == "" and row["channel"] == MESSAGES_CHANNEL and row["version"] == version:
+                if row["value_type"] == "empty":
+                    return 0, iter([])
+                if row["value_type"] != MESSAGE_REFS_TYPE:
+                    messages = self.checkpointer.serde.loads_typed((row["value_type"], row["value_data"]))
+                    return len(messages), iter(messages)
+                keys = decode_message_refs(row["value_data"])
+                message_rows = {
+                    message["message_key"]: message
+                    for message in rows.get(CheckpointMessageModel.__tablename__, [])
+                    if message["checkpoint_ns"] == ""
+                }
+                return len(keys), (
+                    self.checkpointer.serde.loads_typed((message_rows[key]["value_type"], message_rows[key]["value_data"]))
+                    for key in keys
+                    if key in message_rows
+                )
+        return 0, iter([])
+
+    def __export_block(self, block, root: Path, stats: dict[str, int]):
+        if not isinstance(block, dict):
+            return block
+        block_type = block.get("type")
+        if block_type == ContentMediaType.MEDIA_REF.value:
+            path = media_path(root=root, sha256=block["sha256"])
+            if not path.exists():
+                with self.database.get_read_session() as session:
+                    data = session.execute(
+                        select(MediaBlobModel.data).where(MediaBlobModel.sha256 == block["sha256"])
+                    ).scalar()
+                if data is None:
+                    logger.warning(f"Media {block['sha256']} not found, exported as dangling ref")
+                    return block
+                self.__write_media(path=path, data=codec.decode_bytes(data), stats=stats)
+            return block
+
+        if block_type == ContentMediaType.IMAGE_URL.value and isinstance(block.get("image_url"), str) \
+                and block["image_url"].startswith("data:") and ";base64," in block["image_url"]:
+            mime_type, base64_data = block["image_url"][len("data:"):].split(";base64,", 1)
+        elif block_type == ContentMediaType.MEDIA.value and block.get("data"):
+            mime_type, base64_data = block.get("mime_type"), block["data"]
+        else:
+            return block
+
+        data = base64.b64decode(base64_data)
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = media_path(root=root, sha256=sha256)
+        if not path.exists():
+            self.__write_media(path=path, data=data, stats=stats)
+        return {
+            "type": ContentMediaType.MEDIA_REF.value,
+            "sha256": sha256,
+            "mime_type": mime_type,
+            "block_type": block_type,
+        }
+
+    @staticmethod
+    def __write_media(path: Path, data: bytes, stats: dict[str, int]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Запись через временный файл: прерванная выгрузка не оставляет обрезанных файлов с правильным именем
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+        stats["media"] += 1
+
+
+class ChatImporter:
+    """
+    Загрузка выгрузки ChatExporter новыми чатами.
+
+    Файл читается построчно: каждое сообщение сразу становится строкой checkpoint_message,
+    в памяти остаются только ключи сообщений текущего чата. Все строки пишутся одной
+    транзакцией пачками executemany, вторичные индексы удаляются на время загрузки
+    и строятся заново в конце, проверка внешних ключей отложена до коммита. Каждый чат
+    получает один чекпоинт с полной историей. Полнотекстовый индекс новых чатов строит
+    SearchService.start_backfill.
+    """
+
+    def __init__(
+        self,
+        database: IDatabaseSession,
+        repository: IRepositoryDBDict,
+        checkpointer: SQLiteCheckpointSaver,
+        batch_size: int = 500,
+    ):
+        self.database: IDatabaseSession = database
+        self.repository: IRepositoryDBDict = repository
+        self.checkpointer: SQLiteCheckpointSaver = checkpointer
+        self.batch_size = batch_size
+
+    def import_dir(self, in_dir: str | Path) -> dict[int, int]:
+        """Возвращает соответствие id чата в выгрузке -> новый id"""
+        root = Path(in_dir)
+        with open(root / CHATS_FILE, encoding="utf-8") as file:
+            return self.import_stream(file=file, root=root)
+
+    def import_stream(self, file: IO[str], root: Path) -> dict[int, int]:
+        started = time.perf_counter()
+        next_id = self.repository.get_next_id()
+        chat_ids: dict[int, int] = {}
+        rows: dict[type, list[dict]] = {}
+        known_media: set[str] = set()
+        chat: dict | None = None
+        keys: list[str] = []
+
+        with self.database.get_session() as session:
+            connection = session.connection()
+            connection.exec_driver_sql("PRAGMA defer_foreign_keys=ON")
+            for index in DEFERRED_INDEXES:
+                index.drop(bind=connection, checkfirst=True)
+
+            for line_number, record in self.__read_records(file):
+                if record["type"] == "chat":
+                    if chat is not None:
+                        self.__add_chat(rows=rows, chat_id=chat_ids[chat["chat_id"]], chat=chat, keys=keys)
+                    chat, keys = record, []
+                    chat_ids[chat["chat_id"]] = next_id
+                    rows.setdefault(AIStateModel, []).append({"id": next_id})
+                    next_id += 1
+                elif record["type"] == "message":
+                    if chat is None or record["chat_id"] != chat["chat_id"]:
+                        raise ValueError(f"Line {line_number}: message outside of its chat")
+                    message = messages_from_dict([record["message"]])[0]
+                    keys.append(self.__add_message(rows=rows, chat_id=chat_ids[chat["chat_id"]], message=message))
+                    self.__add_media(rows=rows, message=message, root=root, known_media=known_media)
+                if len(rows.get(CheckpointMessageModel, [])) >= self.batch_size:
+                    self.__flush(session=session, rows=rows)
+            if chat is not None:
+                self.__add_chat(rows=rows, chat_id=chat_ids[chat["chat_id"]], chat=chat, keys=keys)
+            self.__flush(session=session, rows=rows)
+
+            for index in DEFERRED_INDEXES:
+                index.create(bind=connection, checkfirst=True)
+            session.commit()
+
+        logger.info(
+            f"Imported {len(chat_ids)} chats, {len(known_media)} media files "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        return chat_ids
+
+    @staticmethod
+    def __read_records(file: IO[str]) -> Iterator[tuple[int, dict]]:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record["type"] == "chat" and record.get("version", FORMAT_VERSION) > FORMAT_VERSION:
+                raise ValueError(f"Unsupported export format version: {record['version']}")
+            yield line_number, record
+
+    def __add_message(self, rows: dict[type, list[dict]], chat_id: int, message: BaseMessage) -> str:
+        """Строка сообщения с тем же ключом, что дал бы ей SQLiteCheckpointSaver"""
+        key, value_type, value_data = self.checkpointer.dump_message(message)
+        rows.setdefault(CheckpointMessageModel, []).append({
+            "chat_id": chat_id,
+            "checkpoint_ns": "",
+            "message_key": key,
+            "value_type": value_type,
+            "value_data": codec.encode_bytes(value_data),
+        })
+        return key
+
+    def __add_chat(self, rows: dict[type, list[dict]], chat_id: int, chat: dict, keys: list[str]):
+        serde = self.checkpointer.serde
+        version = self.checkpointer.get_next_version(None, None)
+        checkpoint = empty_checkpoint()
+        checkpoint.pop("channel_values")
+        checkpoint["channel_versions"] = {MESSAGES_CHANNEL: version}
+        checkpoint_type, checkpoint_data = serde.dumps_typed(checkpoint)
+        metadata_type, metadata_data = serde.dumps_typed({"source": "import", "step": -1, "parents": {}})
+
+        rows.setdefault(CheckpointBlobModel, []).append({
+            "chat_id": chat_id,
+            "checkpoint_ns": "",
+            "channel": MESSAGES_CHANNEL,
+            "version": version,
+            "value_type": MESSAGE_REFS_TYPE,
+            "value_data": encode_message_refs(keys),
+        })
+        rows.setdefault(CheckpointModel, []).append({
+            "chat_id": chat_id,
+            "checkpoint_ns": "",
+            "checkpoint_id": checkpoint["id"],
+            "parent_checkpoint_id": None,
+            "checkpoint_type": checkpoint_type,
+            "checkpoint_data": checkpoint_data,
+            "metadata_type": metadata_type,
+            "metadata_data": metadata_data,
+        })
+        rows.setdefault(ChatSummaryModel, []).append({
+            "chat_id": chat_id,
+            "title": chat.get("title"),
+            "message_count": len(keys),
+            "media_bytes": chat.get("media_bytes") or 0,
+            "updated_at": chat.get("updated_at") or time.time(),
+        })
+
+    @staticmethod
+    def __add_media(rows: dict[type, list[dict]], message: BaseMessage, root: Path, known_media: set[str]):
+        if not isinstance(message.content, list):
+            return
+        for block in message.content:
+            if not (isinstance(block, dict) and block.get("type") == ContentMediaType.MEDIA_REF.value):
+                continue
+            sha256 = block["sha256"]
+            if sha256 in known_media:
+                continue
+            known_media.add(sha256)
+            path = media_path(root=root, sha256=sha256)
+            if not path.exists():
+                logger.warning(f"Media file {sha256} missing in export")
+                continue
+            data = path.read_bytes()
+            if hashlib.sha256(data).hexdigest() != sha256:
+                logger.warning(f"Media file {sha256} is corrupted, skipped")
+                continue
+            rows.setdefault(MediaBlobModel, []).append({
+                "sha256": sha256,
+                "mime_type": block.get("mime_type"),
+                "size": len(data),
+                "data": codec.encode_bytes(data),
+            })
+
+    @staticmethod
+    def __flush(session, rows: dict[type, list[dict]]):
+        # ai_state первым: на него ссылаются остальные таблицы
+        for model in (
+            AIStateModel, MediaBlobModel, CheckpointMessageModel, CheckpointBlobModel, CheckpointModel, ChatSummaryModel
+        ):
+            if rows.get(model):
+                session.execute(insert(model).on_conflict_do_nothing(), rows[model])
+        rows.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка и загрузка чатов в формате NDJSON")
+    parser.add_argument("--db-url", default=None, help="по умолчанию SQLALCHEMY_DATABASE_URI из настроек")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="выгрузить чаты в каталог")
+    export_parser.add_argument("out_dir")
+    export_parser.add_argument("--chat-id", type=int, action="append", help="только указанные чаты, можно повторять")
+    import_parser = commands.add_parser("import", help="загрузить чаты из каталога выгрузки")
+    import_parser.add_argument("in_dir")
+    import_parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    database = SQLiteDatabaseSession(db_url=args.db_url) if args.db_url else SQLiteDatabaseSession()
+    repository = RepositoryDBDict(database=database)
+    checkpointer = SQLiteCheckpointSaver(
+        repository=RepositoryCheckpoint(database=database),
+        legacy_repository=repository,
+        # Импорт и выгрузка не должны ничего удалять
+        retention=0,
+    )
+    if args.command == "export":
+        stats = ChatExporter(
+            repository=repository,
+            checkpointer=checkpointer,
+            database=database,
+            archive=RepositoryArchive(database=database),
+        ).export(out_dir=args.out_dir, chat_ids=args.chat_id)
+        print(f"Exported {stats['chats']} chats, {stats['messages']} messages, {stats['media']} media files")
+    else:
+        chat_ids = ChatImporter(
+            database=database, repository=repository, checkpointer=checkpointer, batch_size=args.batch_size
+        ).import_dir(in_dir=args.in_dir)
+        print(f"Imported {len(chat_ids)} chats")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import logging
+import lzma
+import pickle
+import struct
+import zlib
+from typing import Any, Callable
+
+from core.config.config import settings
+from domain.enums.state_codec import StateCodec
+
+
+logger = logging.getLogger(__name__)
+
+
+ZSTD_AVAILABLE = False
+
+try:
+    import zstandard
+
+    ZSTD_AVAILABLE = True
+except ImportError:
+    logger.warning("zstandard not available, zstd codec disabled")
+
+
+# Заголовок: магия + версия формата + id кодека. Данные без заголовка - старый несжатый pickle
+MAGIC = b"AIMS"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(f"!{len(MAGIC)}sBB")
+# Мелкие значения сжимать невыгодно, они пишутся как raw с заголовком
+MIN_COMPRESS_SIZE = 256
+# id пишется в заголовок и не должен меняться после выпуска
+CODEC_IDS: dict[StateCodec, int] = {
+    StateCodec.RAW: 0,
+    StateCodec.ZLIB: 1,
+    StateCodec.LZMA: 2,
+    StateCodec.ZSTD: 3,
+}
+CODECS_BY_ID: dict[int, StateCodec] = {codec_id: codec for codec, codec_id in CODEC_IDS.items()}
+
+
+_codecs: dict[StateCodec, tuple[Callable[[bytes, int | None], bytes], Callable[[bytes], bytes]]] = {}
+
+
+def register_codec(
+    codec: StateCodec,
+    compress: Callable[[bytes, int | None], bytes],
+    decompress: Callable[[bytes], bytes],
+):
+    """Регистрирует реализацию кодека: compress(data, level) и decompress(data)"""
+    _codecs[codec] = (compress, decompress)
+
+
+def available_codecs() -> list[StateCodec]:
+    return list(_codecs)
+
+
+def resolve_codec(codec: StateCodec | str | None = None) -> StateCodec:
+    """Кодек из аргумента или настроек; недоступный zstd заменяется на zlib"""
+    codec = StateCodec(codec or settings.STATE_CODEC)
+    if codec not in _codecs:
+        logger.warning(f"Codec {codec.value} not available, falling back to zlib")
+        return StateCodec.ZLIB
+    return codec
+
+
+def header_codec(data: bytes | None) -> StateCodec | None:
+    """Кодек из заголовка или None для данных старого формата"""
+    if not data or len(data) < HEADER.size or not data.startswith(MAGIC):
+        return None
+    _, version, codec_id = HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported state format version: {version}")
+    if codec_id not in CODECS_BY_ID:
+        raise ValueError(f"Unknown state codec id: {codec_id}")
+    return CODECS_BY_ID[codec_id]
+
+
+def encode_bytes(raw: bytes, codec: StateCodec | str | None = None, level: int | None = None) -> bytes:
+    codec = resolve_codec(codec)
+    # Уровень из настроек относится только к кодеку из настроек: шкалы у кодеков разные
+    if level is None and codec is StateCodec(settings.STATE_CODEC):
+        level = settings.STATE_CODEC_LEVEL
+    if codec is not StateCodec.RAW and len(raw) >= MIN_COMPRESS_SIZE:
+        compress, _ = _codecs[codec]
+        compressed = compress(raw, level)
+        # Уже сжатое (png/jpeg) может не уменьшиться - тогда храним как есть
+        if len(compressed) < len(raw):
+            return HEADER.pack(MAGIC, FORMAT_VERSION, CODEC_IDS[codec]) + compressed
+    return HEADER.pack(MAGIC, FORMAT_VERSION, CODEC_IDS[StateCodec.RAW]) + raw
+
+
+def decode_bytes(data: bytes) -> bytes:
+    codec = header_codec(data)
+    if codec is None:
+        return data
+    if codec not in _codecs:
+        raise ValueError(f"Codec {codec.value} is required to read this state")
+    _, decompress = _codecs[codec]
+    return decompress(memoryview(data)[HEADER.size:])
+
+
+def dumps(obj: Any, codec: StateCodec | str | None = None, level: int | None = None) -> bytes:
+    return encode_bytes(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL), codec=codec, level=level)
+
+
+def loads(data: bytes) -> Any:
+    return pickle.loads(decode_bytes(data))
+
+
+register_codec(StateCodec.RAW, lambda data, level: bytes(data), bytes)
+register_codec(
+    StateCodec.ZLIB,
+    lambda data, level: zlib.compress(data, -1 if level is None else level),
+    zlib.decompress,
+)
+register_codec(
+    StateCodec.LZMA,
+    lambda data, level: lzma.compress(data, preset=level),
+    lzma.decompress,
+)
+if ZSTD_AVAILABLE:
+    register_codec(
+        StateCodec.ZSTD,
+        lambda data, level: zstandard.ZstdCompressor(level=3 if level is None else level).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
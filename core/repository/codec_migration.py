@@ -0,0 +1,122 @@
+import argparse
+import logging
+
+from sqlalchemy import select, update, literal_column
+
+from application.interfaces.Idatabase_session import IDatabaseSession
+from core.repository import codec
+from core.repository.models.ai_state_model import AIStateModel
+from core.repository.sqlite_session import SQLiteDatabaseSession
+from core.repository.models.checkpoint_model import (
+    CheckpointModel,
+    CheckpointWriteModel,
+    CheckpointBlobModel,
+    CheckpointMessageModel,
+)
+from domain.enums.state_codec import StateCodec
+
+
+logger = logging.getLogger(__name__)
+
+
+# Все колонки, которые пишутся через кодек состояния
+ENCODED_COLUMNS = {
+    AIStateModel: [
+        AIStateModel.data_state,
+        AIStateModel.data_storage,
+        AIStateModel.data_writes,
+        AIStateModel.data_default,
+    ],
+    CheckpointModel: [CheckpointModel.checkpoint_data, CheckpointModel.metadata_data],
+    CheckpointWriteModel: [CheckpointWriteModel.value_data],
+    CheckpointBlobModel: [CheckpointBlobModel.value_data],
+    CheckpointMessageModel: [CheckpointMessageModel.value_data],
+}
+
+
+class CodecMigration:
+    """
+    Перекодирует сохранённое состояние в заданный кодек прямо в базе.
+
+    Строки читаются пачками по rowid, каждая пачка - отдельная транзакция,
+    поэтому в памяти одновременно только batch_size значений одной колонки,
+    а прерванную миграцию можно просто запустить заново.
+    """
+
+    def __init__(self, database: IDatabaseSession, target: StateCodec | str | None = None, batch_size: int = 50):
+        self.database = database
+        self.target: StateCodec = codec.resolve_codec(target)
+        self.batch_size = batch_size
+
+    def run(self) -> dict[str, int]:
+        stats = {"rows": 0, "converted": 0, "bytes_before": 0, "bytes_after": 0}
+        for model, columns in ENCODED_COLUMNS.items():
+            for column in columns:
+                self.__migrate_column(model=model, column=column, stats=stats)
+        logger.info(f"Codec migration to {self.target.value} finished: {stats}")
+        return stats
+
+    def vacuum(self):
+        """
+        Возвращает освободившееся место файлу базы и переводит её в auto_vacuum=INCREMENTAL:
+        режим меняется только полным VACUUM, после него фоновая компактизация обходится incremental_vacuum
+        """
+        with self.database.get_session() as session:
+            connection = session.connection()
+            connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.exec_driver_sql("VACUUM")
+
+    def __migrate_column(self, model, column, stats: dict[str, int]):
+        rowid = literal_column("rowid")
+        last_rowid = 0
+        while True:
+            with self.database.get_session() as session:
+                rows = session.execute(
+                    select(rowid, column)
+                    .select_from(model)
+                    .where(rowid > last_rowid, column.is_not(None))
+                    .order_by(rowid)
+                    .limit(self.batch_size)
+                ).all()
+                if not rows:
+                    return
+
+                for row_id, raw in rows:
+                    last_rowid = row_id
+                    stats["rows"] += 1
+                    if not raw or codec.header_codec(raw) is self.target:
+                        continue
+                    encoded = codec.encode_bytes(codec.decode_bytes(raw), codec=self.target)
+                    # Мелкие и несжимаемые значения остаются raw - их не переписываем
+                    if encoded == raw:
+                        continue
+                    session.execute(update(model).where(rowid == row_id).values({column.key: encoded}))
+                    stats["converted"] += 1
+                    stats["bytes_before"] += len(raw)
+                    stats["bytes_after"] += len(encoded)
+                session.commit()
+            logger.info(f"{model.__tablename__}.{column.key}: migrated up to rowid {last_rowid}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перекодирование сохранённого состояния чатов")
+    parser.add_argument("--codec", choices=[item.value for item in StateCodec], default=None,
+                        help="целевой кодек, по умолчанию STATE_CODEC из настроек")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--db-url", default=None, help="по умолчанию SQLALCHEMY_DATABASE_URI из настроек")
+    parser.add_argument("--vacuum", action="store_true", help="сжать файл базы после миграции и включить auto_vacuum=INCREMENTAL")
+    args = parser.parse_args()
+
+    database = SQLiteDatabaseSession(db_url=args.db_url) if args.db_url else SQLiteDatabaseSession()
+    migration = CodecMigration(database=database, target=args.codec, batch_size=args.batch_size)
+    stats = migration.run()
+    if args.vacuum:
+        migration.vacuum()
+    print(
+        f"Converted {stats['converted']} of {stats['rows']} values: "
+        f"{stats['bytes_before']} -> {stats['bytes_after']} bytes"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, Text, Float, ForeignKey
+from core.repository.base import Base
+
+
+class ChatArchiveModel(Base):
+    """Чат, перенесённый в архивный сегмент: в базе остаются ai_state, сводка и поисковый индекс"""
+    __tablename__ = "chat_archive"
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    segment = Column(Text, nullable=False)
+    offset = Column(Integer, nullable=False)
+    length = Column(Integer, nullable=False)
+    sha256 = Column(Text, nullable=False)
+    archived_at = Column(Float, nullable=False, default=0.0)
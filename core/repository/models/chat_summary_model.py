@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, Text, Float, ForeignKey, Index
+from core.repository.base import Base
+
+
+class ChatSummaryModel(Base):
+    __tablename__ = "chat_summary"
+    # Ключ keyset-пагинации списка чатов: (updated_at, chat_id) по убыванию
+    __table_args__ = (Index("ix_chat_summary_updated_at", "updated_at", "chat_id"),)
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    title = Column(Text, nullable=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    media_bytes = Column(Integer, nullable=False, default=0)
+    updated_at = Column(Float, nullable=False, default=0.0)
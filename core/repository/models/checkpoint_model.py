@@ -0,0 +1,68 @@
+from sqlalchemy import Column, Integer, Text, Float, BINARY, ForeignKey, Index
+from core.repository.base import Base
+
+
+class CheckpointModel(Base):
+    __tablename__ = "checkpoint"
+    # Поиск потомков чекпоинта при очистке истории
+    __table_args__ = (Index("ix_checkpoint_parent", "chat_id", "checkpoint_ns", "parent_checkpoint_id"),)
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    checkpoint_ns = Column(Text, primary_key=True, default="")
+    checkpoint_id = Column(Text, primary_key=True)
+    parent_checkpoint_id = Column(Text, nullable=True)
+    checkpoint_type = Column(Text, nullable=False)
+    checkpoint_data = Column(BINARY, nullable=False)
+    metadata_type = Column(Text, nullable=False)
+    metadata_data = Column(BINARY, nullable=False)
+
+
+class CheckpointWriteModel(Base):
+    __tablename__ = "checkpoint_write"
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    checkpoint_ns = Column(Text, primary_key=True, default="")
+    checkpoint_id = Column(Text, primary_key=True)
+    task_id = Column(Text, primary_key=True)
+    idx = Column(Integer, primary_key=True)
+    channel = Column(Text, nullable=False)
+    value_type = Column(Text, nullable=False)
+    value_data = Column(BINARY, nullable=False)
+    task_path = Column(Text, nullable=False, default="")
+
+
+class CheckpointBlobModel(Base):
+    __tablename__ = "checkpoint_blob"
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    checkpoint_ns = Column(Text, primary_key=True, default="")
+    channel = Column(Text, primary_key=True)
+    version = Column(Text, primary_key=True)
+    value_type = Column(Text, nullable=False)
+    value_data = Column(BINARY, nullable=False)
+
+
+class CheckpointMessageModel(Base):
+    """Сообщение канала messages (ключ - id и хэш содержимого): пишется один раз, версия канала в checkpoint_blob - только список ключей"""
+    __tablename__ = "checkpoint_message"
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    checkpoint_ns = Column(Text, primary_key=True, default="")
+    message_key = Column(Text, primary_key=True)
+    value_type = Column(Text, nullable=False)
+    value_data = Column(BINARY, nullable=False)
+
+
+class CheckpointPinModel(Base):
+    """Именованные чекпоинты, политика хранения их не удаляет"""
+    __tablename__ = "checkpoint_pin"
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    checkpoint_ns = Column(Text, primary_key=True, default="")
+    checkpoint_id = Column(Text, primary_key=True)
+    name = Column(Text, nullable=True)
+
+
+class ChatForkModel(Base):
+    """Ветка чата: история до parent_checkpoint_id читается из родительского чата, копируются только новые ходы"""
+    __tablename__ = "chat_fork"
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    # Без каскада: родителя с ветками нельзя удалить, не перенеся точку ветвления в ветки
+    parent_chat_id = Column(Integer, ForeignKey("ai_state.id"), nullable=False, index=True)
+    parent_checkpoint_id = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False, default=0.0)
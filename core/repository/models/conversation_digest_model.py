@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, Text, Float, ForeignKey
+from core.repository.base import Base
+
+
+class ConversationDigestModel(Base):
+    __tablename__ = "conversation_digest"
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    summary = Column(Text, nullable=False)
+    # Сколько первых сообщений истории вошло в summary и id последнего из них - указатель на исходные ходы
+    covered = Column(Integer, nullable=False)
+    last_message_id = Column(Text, nullable=False)
+    model = Column(Text, nullable=False)
+    updated_at = Column(Float, nullable=False, default=0.0)
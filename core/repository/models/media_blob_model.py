@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, Text, BINARY
+from core.repository.base import Base
+
+
+class MediaBlobModel(Base):
+    __tablename__ = "media_blob"
+    sha256 = Column(Text, primary_key=True)
+    mime_type = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)
+    data = Column(BINARY, nullable=False)
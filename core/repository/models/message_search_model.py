@@ -0,0 +1,31 @@
+import logging
+
+from sqlalchemy import Column, Integer, ForeignKey, event, text
+from core.repository.base import Base
+
+
+logger = logging.getLogger(__name__)
+
+
+# Полнотекстовый индекс сообщений. Виртуальную таблицу FTS5 SQLAlchemy не описывает, создаём DDL после create_all
+MESSAGE_FTS_TABLE = "message_fts"
+MESSAGE_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {MESSAGE_FTS_TABLE} "
+    "USING fts5(content, chat_id UNINDEXED, role UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+)
+
+
+class SearchIndexStateModel(Base):
+    """Сколько сообщений чата уже в message_fts"""
+    __tablename__ = "search_index_state"
+    chat_id = Column(Integer, ForeignKey("ai_state.id", ondelete="CASCADE"), primary_key=True)
+    indexed_count = Column(Integer, nullable=False, default=0)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_message_fts(target, connection, **kw):
+    try:
+        connection.execute(text(MESSAGE_FTS_DDL))
+    except Exception as e:
+        # Сборка SQLite без FTS5: приложение работает, поиск просто пустой
+        logger.warning(f"FTS5 not available, message search disabled: {e}")
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, Text, Float, BINARY
+from core.repository.base import Base
+
+
+class ResponseCacheModel(Base):
+    __tablename__ = "response_cache"
+    key = Column(Text, primary_key=True)
+    model = Column(Text, nullable=False)
+    response = Column(BINARY, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(Float, nullable=False)
+    # Вытеснение по размеру - начиная с давно не использованных
+    last_used_at = Column(Float, nullable=False, index=True)
@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import select, delete, update, or_
+from sqlalchemy.dialects.sqlite import insert
+
+from application.interfaces.Idatabase_session import IDatabaseSession
+from application.interfaces.Irepository_archive import IRepositoryArchive
+from core.config.config import settings
+from core.repository import codec
+from core.repository.codec_migration import ENCODED_COLUMNS
+from core.repository.models.ai_state_model import AIStateModel
+from core.repository.models.chat_archive_model import ChatArchiveModel
+from core.repository.models.chat_summary_model import ChatSummaryModel
+from core.repository.models.checkpoint_model import (
+    CheckpointModel,
+    CheckpointWriteModel,
+    CheckpointBlobModel,
+    CheckpointMessageModel,
+    CheckpointPinModel,
+    ChatForkModel,
+)
+from core.repository.models.message_search_model import SearchIndexStateModel
+from domain.entities.chat_archive import ChatArchive
+
+
+logger = logging.getLogger(__name__)
+
+
+# Кадр сегмента: магия + id чата + длина данных, по ним сегмент читается и без базы
+FRAME_MAGIC = b"AIMA"
+FRAME_HEADER = struct.Struct(f"!{len(FRAME_MAGIC)}sQI")
+SEGMENT_PREFIX = "segment-"
+# Строки чата, которые уходят в архив целиком
+ARCHIVED_MODELS = (CheckpointModel, CheckpointWriteModel, CheckpointBlobModel, CheckpointMessageModel, CheckpointPinModel)
+STATE_COLUMNS = [column.key for column in ENCODED_COLUMNS[AIStateModel]]
+
+
+class RepositoryArchive(IRepositoryArchive):
+    """
+    Холодное хранение чатов в сжатых append-only сегментах.
+
+    Все строки чекпоинтов чата и pickle-колонки ai_state разжимаются и сжимаются
+    одним кадром: соседние версии истории почти совпадают и хорошо жмутся вместе.
+    Место в сегментах не переиспользуется - поднятый обратно чат остаётся в файле мёртвым кадром.
+    """
+
+    def __init__(
+        self,
+        database: IDatabaseSession,
+        archive_dir: str | Path = settings.ARCHIVE_DIR,
+        segment_size: int = settings.ARCHIVE_SEGMENT_SIZE,
+    ):
+        self.database = database
+        self.archive_dir = Path(archive_dir)
+        self.segment_size = segment_size
+        self.__lock = threading.Lock()
+
+    def archive_chat(self, chat_id: int) -> ChatArchive | None:
+        with self.__lock, self.database.get_session() as session:
+            if session.get(ChatArchiveModel, chat_id) is not None:
+                return None
+            rows = {
+                model.__tablename__: [
+                    self.__decode_row(model=model, row=dict(row))
+                    for row in session.execute(
+                        select(*model.__table__.columns).where(model.chat_id == chat_id)
+                    ).mappings()
+                ]
+                for model in ARCHIVED_MODELS
+            }
+            state = session.execute(
+                select(*[getattr(AIStateModel, key) for key in STATE_COLUMNS]).where(AIStateModel.id == chat_id)
+            ).mappings().first()
+            rows[AIStateModel.__tablename__] = [self.__decode_row(model=AIStateModel, row=dict(state))] if state else []
+            if not any(rows.values()):
+                return None
+
+            data = codec.dumps(rows)
+            segment, offset = self.__append_frame(chat_id=chat_id, data=data)
+            archive = ChatArchive(
+                chat_id=chat_id,
+                segment=segment,
+                offset=offset,
+                length=len(data),
+                sha256=hashlib.sha256(data).hexdigest(),
+                archived_at=time.time(),
+            )
+            # Кадр уже на диске: при сбое до коммита в сегменте останется лишь недостижимый кадр
+            session.execute(insert(ChatArchiveModel).values(**archive.model_dump()))
+            for model in ARCHIVED_MODELS:
+                session.execute(delete(model).where(model.chat_id == chat_id))
+            session.execute(
+                update(AIStateModel).where(AIStateModel.id == chat_id).values(dict.fromkeys(STATE_COLUMNS))
+            )
+            session.commit()
+        logger.info(f"Archived chat {chat_id} to {segment}: {len(data)} bytes")
+        return archive
+
+    def rehydrate(self, chat_id: int) -> bool:
+        """Возвращает чат из архива в базу; False, если чат не в архиве"""
+        with self.__lock, self.database.get_session() as session:
+            db_data = session.get(ChatArchiveModel, chat_id)
+            if db_data is None:
+                return False
+            rows = self.__read_frame(ChatArchive.model_validate(db_data))
+            for model in ARCHIVED_MODELS:
+                records = [self.__encode_row(model=model, row=row) for row in rows.get(model.__tablename__, [])]
+                if records:
+                    session.execute(insert(model).on_conflict_do_nothing(), records)
+            for row in rows.get(AIStateModel.__tablename__, []):
+                session.execute(
+                    update(AIStateModel)
+                    .where(AIStateModel.id == chat_id)
+                    .values(self.__encode_row(model=AIStateModel, row=row))
+                )
+            session.execute(delete(ChatArchiveModel).where(ChatArchiveModel.chat_id == chat_id))
+            session.commit()
+        logger.info(f"Rehydrated chat {chat_id} from archive")
+        return True
+
+    def get(self, chat_id: int) -> ChatArchive | None:
+        with self.database.get_read_session() as session:
+            db_data = session.get(ChatArchiveModel, chat_id)
+            return ChatArchive.model_validate(db_data) if db_data else None
+
+    def load_rows(self, chat_id: int) -> dict[str, list[dict]] | None:
+        """Строки архивного чата по таблицам (значения закодированы кодеком), без возврата в базу"""
+        archive = self.get(chat_id=chat_id)
+        if archive is None:
+            return None
+        rows = self.__read_frame(archive)
+        return {
+            model.__tablename__: [self.__encode_row(model=model, row=row) for row in rows.get(model.__tablename__, [])]
+            for model in (*ARCHIVED_MODELS, AIStateModel)
+        }
+
+    def stale_chats(self, older_than: float, limit: int = 100) -> list[int]:
+        """
+        Чаты без изменений с older_than (unix time), полностью попавшие в поисковый индекс.
+        Ветки и их родители не архивируются: ветка читает историю из родителя. Сводка
+        с нулём сообщений (backfill без подсчёта) не доказывает, что чат проиндексирован.
+        """
+        query = (
+            select(ChatSummaryModel.chat_id)
+            .join(SearchIndexStateModel, SearchIndexStateModel.chat_id == ChatSummaryModel.chat_id)
+            .outerjoin(ChatArchiveModel, ChatArchiveModel.chat_id == ChatSummaryModel.chat_id)
+            .outerjoin(
+                ChatForkModel,
+                or_(
+                    ChatForkModel.chat_id == ChatSummaryModel.chat_id,
+                    ChatForkModel.parent_chat_id == ChatSummaryModel.chat_id,
+                ),
+            )
+            .where(
+                ChatSummaryModel.updated_at < older_than,
+                ChatSummaryModel.message_count > 0,
+                SearchIndexStateModel.indexed_count >= ChatSummaryModel.message_count,
+                ChatArchiveModel.chat_id.is_(None),
+                ChatForkModel.chat_id.is_(None),
+            )
+            .order_by(ChatSummaryModel.updated_at)
+            .limit(limit)
+        )
+        with self.database.get_read_session() as session:
+            return list(session.execute(query).scalars())
+
+    def __append_frame(self, chat_id: int, data: bytes) -> tuple[str, int]:
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        segments = sorted(self.archive_dir.glob(f"{SEGMENT_PREFIX}*.bin"))
+        if not segments or segments[-1].stat().st_size >= self.segment_size:
+            number = int(segments[-1].stem[len(SEGMENT_PREFIX):]) + 1 if segments else 1
+            path = self.archive_dir / f"{SEGMENT_PREFIX}{number:06d}.bin"
+        else:
+            path = segments[-1]
+        with open(path, "ab") as file:
+            file.write(FRAME_HEADER.pack(FRAME_MAGIC, chat_id, len(data)))
+            offset = file.tell()
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        return path.name, offset
+
+    def __read_frame(self, archive: ChatArchive) -> dict[str, list[dict]]:
+        with open(self.archive_dir / archive.segment, "rb") as file:
+            file.seek(archive.offset - FRAME_HEADER.size)
+            magic, chat_id, length = FRAME_HEADER.unpack(file.read(FRAME_HEADER.size))
+            data = file.read(archive.length)
+        if magic != FRAME_MAGIC or chat_id != archive.chat_id or length != archive.length:
+            raise ValueError(f"Archive frame of chat {archive.chat_id} in {archive.segment} is corrupted")
+        if hashlib.sha256(data).hexdigest() != archive.sha256:
+            raise ValueError(f"Archive frame of chat {archive.chat_id} in {archive.segment} has wrong checksum")
+        return codec.loads(data)
+
+    @staticmethod
+    def __decode_row(model, row: dict) -> dict:
+        for column in ENCODED_COLUMNS[model] if model in ENCODED_COLUMNS else ():
+            if row.get(column.key):
+                row[column.key] = codec.decode_bytes(row[column.key])
+        return row
+
+    @staticmethod
+    def __encode_row(model, row: dict) -> dict:
+        row = dict(row)
+        for column in ENCODED_COLUMNS[model] if model in ENCODED_COLUMNS else ():
+            if row.get(column.key):
+                row[column.key] = codec.encode_bytes(row[column.key])
+        return row
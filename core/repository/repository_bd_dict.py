@@ -1,6 +1,8 @@
 import logging
+from functools import lru_cache
 
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
+from sqlalchemy.dialects.sqlite import insert
 
 from application.interfaces.Idatabase_session import IDatabaseSession
 from application.interfaces.Irepository_bd_dict import IRepositoryDBDict
@@ -11,6 +13,18 @@ from domain.entities.ai_state import AIState
 logger = logging.getLogger(__name__)
 
 
+# Горячие запросы собираются один раз: SQLAlchemy берёт скомпилированный SQL из кэша,
+# sqlite3 - подготовленное выражение из кэша соединения
+LIST_CHATS_STMT = select(AIStateModel.id, AIStateModel.last_message).order_by(AIStateModel.id.desc())
+
+
+@lru_cache(maxsize=32)
+def _columns_stmt(col_names: tuple[str, ...]):
+    return select(*[getattr(AIStateModel, col_name) for col_name in col_names]).where(
+        AIStateModel.id == bindparam("record_id")
+    )
+
+
 class RepositoryDBDict(IRepositoryDBDict):
     def __init__(self, database: IDatabaseSession):
         self.database = database
@@ -30,7 +44,7 @@ class RepositoryDBDict(IRepositoryDBDict):
             session.commit()
 
     def get_chat(self, record_id: int) -> AIState | None:
-        with self.database.get_session() as session:
+        with self.database.get_read_session() as session:
             db_data = session.get(AIStateModel, record_id)
             if db_data:
                 logger.info("Retrieved data from database")
@@ -38,14 +52,38 @@ class RepositoryDBDict(IRepositoryDBDict):
             logger.info("Retrieved data from database")
             return None
 
+    def get_chat_column(self, record_id: int, col_name: str) -> bytes | None:
+        """Читает одну колонку чата, остальные blob-колонки не загружаются"""
+        with self.database.get_read_session() as session:
+            return session.execute(_columns_stmt((col_name,)), {"record_id": record_id}).scalar()
+
+    def get_chat_columns(self, record_id: int, col_names: list[str]) -> dict[str, bytes | None] | None:
+        """Читает указанные колонки чата одним запросом, без ORM-объекта и валидации AIState"""
+        with self.database.get_read_session() as session:
+            row = session.execute(_columns_stmt(tuple(col_names)), {"record_id": record_id}).first()
+            if row is None:
+                return None
+            return dict(zip(col_names, row))
+
+    def save_columns(self, records: dict[int, dict[str, bytes]]) -> None:
+        """Upsert нескольких колонок нескольких чатов одной транзакцией, без предварительного чтения строки"""
+        with self.database.get_session() as session:
+            for record_id, columns in records.items():
+                session.execute(
+                    insert(AIStateModel)
+                    .values(id=record_id, **columns)
+                    .on_conflict_do_update(index_elements=[AIStateModel.id], set_=columns)
+                )
+            session.commit()
+
     def get_next_id(self) -> int:
         return self.database.get_next_id(model=AIStateModel)
 
     def get_list_chats(self) -> (int, str):
-        with self.database.get_session() as session:
+        with self.database.get_read_session() as session:
             #session.query(AIStateModel).with_entities(AIStateModel.id).all()
             #session.execute(select(AIStateModel.id)).scalars().all()
-            return session.execute(select(AIStateModel.id, AIStateModel.last_message).order_by(AIStateModel.id.desc())).all()
+            return session.execute(LIST_CHATS_STMT).all()
 
     def delete_chat(self, record_id: int):
         with self.database.get_session() as session:
@@ -0,0 +1,160 @@
+import logging
+import time
+import uuid
+from typing import Callable
+
+from sqlalchemy import select, tuple_, func, bindparam
+from sqlalchemy.dialects.sqlite import insert
+
+from application.interfaces.Idatabase_session import IDatabaseSession
+from application.interfaces.Irepository_chat_summary import IRepositoryChatSummary
+from core.repository.models.ai_state_model import AIStateModel
+from core.repository.models.chat_summary_model import ChatSummaryModel
+from core.repository.models.checkpoint_model import CheckpointModel
+from domain.entities.chat_summary import ChatSummary
+
+
+logger = logging.getLogger(__name__)
+
+
+# Начало отсчёта времени UUID (15.10.1582) относительно unix time, в интервалах по 100 нс
+UUID_EPOCH_OFFSET = 0x01B21DD213814000
+# Ограничение SQLite на число параметров запроса
+IDS_CHUNK = 500
+
+
+def checkpoint_time(checkpoint_id: str | None) -> float | None:
+    """Время создания чекпоинта из его id (uuid6 LangGraph) или None, если id другого формата"""
+    try:
+        value = uuid.UUID(checkpoint_id)
+    except (TypeError, ValueError):
+        return None
+    if value.version != 6:
+        return None
+    high = value.int >> 64
+    timestamp = ((high >> 32) << 28) | (((high >> 16) & 0xFFFF) << 12) | (high & 0x0FFF)
+    return (timestamp - UUID_EPOCH_OFFSET) / 1e7
+
+
+FIRST_PAGE_STMT = (
+    select(ChatSummaryModel)
+    .order_by(ChatSummaryModel.updated_at.desc(), ChatSummaryModel.chat_id.desc())
+    .limit(bindparam("limit"))
+)
+NEXT_PAGE_STMT = (
+    select(ChatSummaryModel)
+    .where(
+        tuple_(ChatSummaryModel.updated_at, ChatSummaryModel.chat_id)
+        < tuple_(bindparam("updated_at"), bindparam("chat_id"))
+    )
+    .order_by(ChatSummaryModel.updated_at.desc(), ChatSummaryModel.chat_id.desc())
+    .limit(bindparam("limit"))
+)
+
+
+class RepositoryChatSummary(IRepositoryChatSummary):
+    """Сводка по чатам для списка в UI, обновляется при каждом ответе агента"""
+
+    def __init__(self, database: IDatabaseSession):
+        self.database = database
+
+    def record_turn(self, chat_id: int, title: str | None, message_count: int, media_bytes: int) -> ChatSummary:
+        values = {
+            "chat_id": chat_id,
+            "title": title,
+            "message_count": message_count,
+            "media_bytes": media_bytes,
+            "updated_at": time.time(),
+        }
+        with self.database.get_session() as session:
+            # В режиме InMemorySaver строка ai_state пишется флашером позже, а внешний ключ нужен сейчас
+            session.execute(
+                insert(AIStateModel)
+                .values(id=chat_id)
+                .on_conflict_do_nothing(index_elements=[AIStateModel.id])
+            )
+            stmt = insert(ChatSummaryModel).values(**values)
+            session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[ChatSummaryModel.chat_id],
+                    set_={
+                        # Заголовок - первое сообщение чата, дальше не меняется
+                        "title": func.coalesce(ChatSummaryModel.title, stmt.excluded.title),
+                        "message_count": stmt.excluded.message_count,
+                        "media_bytes": ChatSummaryModel.media_bytes + stmt.excluded.media_bytes,
+                        "updated_at": stmt.excluded.updated_at,
+                    },
+                )
+            )
+            session.commit()
+        return self.get(chat_id=chat_id)
+
+    def get(self, chat_id: int) -> ChatSummary | None:
+        with self.database.get_read_session() as session:
+            db_data = session.get(ChatSummaryModel, chat_id)
+            if db_data:
+                return ChatSummary.model_validate(db_data)
+            return None
+
+    def list_page(self, limit: int = 50, before: tuple[float, int] | None = None) -> list[ChatSummary]:
+        """Страница списка от самых свежих; before - (updated_at, chat_id) последнего элемента предыдущей страницы"""
+        if before is None:
+            query, params = FIRST_PAGE_STMT, {"limit": limit}
+        else:
+            query, params = NEXT_PAGE_STMT, {"limit": limit, "updated_at": before[0], "chat_id": before[1]}
+        with self.database.get_read_session() as session:
+            return [ChatSummary.model_validate(row) for row in session.execute(query, params).scalars()]
+
+    def backfill(self, message_count: Callable[[int], int] | None = None) -> int:
+        """
+        Создаёт сводки для чатов, сохранённых до появления chat_summary.
+
+        updated_at - время последнего чекпоинта чата (или время backfill, если чекпоинтов нет),
+        чтобы старые чаты не уходили в конец списка и не считались давно неиспользуемыми.
+        message_count - из message_count(chat_id); без него 0, и архив такие чаты не трогает.
+        """
+        with self.database.get_read_session() as session:
+            chat_ids = list(
+                session.execute(
+                    select(AIStateModel.id).where(AIStateModel.id.not_in(select(ChatSummaryModel.chat_id)))
+                ).scalars()
+            )
+        if not chat_ids:
+            return 0
+
+        counts = {chat_id: self.__count(message_count=message_count, chat_id=chat_id) for chat_id in chat_ids}
+        latest: dict[int, str] = {}
+        with self.database.get_read_session() as session:
+            for start in range(0, len(chat_ids), IDS_CHUNK):
+                latest.update(
+                    session.execute(
+                        select(CheckpointModel.chat_id, func.max(CheckpointModel.checkpoint_id))
+                        .where(CheckpointModel.chat_id.in_(chat_ids[start:start + IDS_CHUNK]))
+                        .group_by(CheckpointModel.chat_id)
+                    ).all()
+                )
+        now = time.time()
+        rows = [
+            {
+                "chat_id": chat_id,
+                "message_count": counts[chat_id],
+                "media_bytes": 0,
+                "updated_at": checkpoint_time(latest.get(chat_id)) or now,
+            }
+            for chat_id in chat_ids
+        ]
+        with self.database.get_session() as session:
+            session.execute(insert(ChatSummaryModel).on_conflict_do_nothing(), rows)
+            session.commit()
+        logger.info(f"Backfilled {len(rows)} chat summaries")
+        return len(rows)
+
+    @staticmethod
+    def __count(message_count: Callable[[int], int] | None, chat_id: int) -> int:
+        if message_count is None:
+            return 0
+        try:
+            return message_count(chat_id)
+        except Exception as e:
+            logger.error(f"Message count error for chat {chat_id}: {e}")
+            return 0
@@ -0,0 +1,661 @@
+import json
+import logging
+import threading
+import time
+
+from collections import Counter
+
+from sqlalchemy import select, delete, update, tuple_, bindparam, func, literal
+from sqlalchemy.dialects.sqlite import insert
+
+from application.interfaces.Idatabase_session import IDatabaseSession
+from application.interfaces.Irepository_checkpoint import IRepositoryCheckpoint
+from core.repository import codec
+from core.repository.models.ai_state_model import AIStateModel
+from core.repository.models.checkpoint_model import (
+    CheckpointModel,
+    CheckpointWriteModel,
+    CheckpointBlobModel,
+    CheckpointMessageModel,
+    CheckpointPinModel,
+    ChatForkModel,
+)
+from domain.entities.chat_fork import ChatFork
+from domain.entities.checkpoint_record import (
+    CheckpointRecord,
+    CheckpointWriteRecord,
+    CheckpointBlobRecord,
+    CheckpointMessageRecord,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Канал messages хранится построчно: сообщение - строка checkpoint_message, записанная один раз,
+# а blob версии канала с value_type MESSAGE_REFS_TYPE - только упорядоченный список ключей сообщений
+MESSAGES_CHANNEL = "messages"
+MESSAGE_REFS_TYPE = "message_refs"
+# Ограничение SQLite на число параметров запроса
+KEYS_CHUNK = 500
+
+
+def encode_message_refs(keys: list[str]) -> bytes:
+    return codec.encode_bytes(json.dumps(keys).encode("utf-8"))
+
+
+def decode_message_refs(data: bytes) -> list[str]:
+    return json.loads(codec.decode_bytes(data))
+
+
+# Горячие запросы загрузки чата собираются один раз, параметры передаются при выполнении
+LATEST_CHECKPOINT_STMT = (
+    select(CheckpointModel)
+    .where(
+        CheckpointModel.chat_id == bindparam("chat_id"),
+        CheckpointModel.checkpoint_ns == bindparam("checkpoint_ns"),
+    )
+    # id чекпоинтов (uuid6) монотонно растут, последний - максимальный
+    .order_by(CheckpointModel.checkpoint_id.desc())
+    .limit(1)
+)
+# Последний чекпоинт родителя не позже точки ветвления
+LATEST_UPTO_STMT = LATEST_CHECKPOINT_STMT.where(CheckpointModel.checkpoint_id <= bindparam("upto"))
+CHECKPOINT_BY_ID_STMT = select(CheckpointModel).where(
+    CheckpointModel.chat_id == bindparam("chat_id"),
+    CheckpointModel.checkpoint_ns == bindparam("checkpoint_ns"),
+    CheckpointModel.checkpoint_id == bindparam("checkpoint_id"),
+)
+BLOBS_STMT = select(CheckpointBlobModel).where(
+    CheckpointBlobModel.chat_id == bindparam("chat_id"),
+    CheckpointBlobModel.checkpoint_ns == bindparam("checkpoint_ns"),
+    tuple_(CheckpointBlobModel.channel, CheckpointBlobModel.version).in_(bindparam("versions", expanding=True)),
+)
+WRITES_STMT = (
+    select(CheckpointWriteModel)
+    .where(
+        CheckpointWriteModel.chat_id == bindparam("chat_id"),
+        CheckpointWriteModel.checkpoint_ns == bindparam("checkpoint_ns"),
+        CheckpointWriteModel.checkpoint_id == bindparam("checkpoint_id"),
+    )
+    .order_by(
+        CheckpointWriteModel.task_path,
+        CheckpointWriteModel.task_id,
+        CheckpointWriteModel.idx,
+    )
+)
+MESSAGES_STMT = select(CheckpointMessageModel).where(
+    CheckpointMessageModel.chat_id == bindparam("chat_id"),
+    CheckpointMessageModel.checkpoint_ns == bindparam("checkpoint_ns"),
+    CheckpointMessageModel.message_key.in_(bindparam("keys", expanding=True)),
+)
+MESSAGE_KEYS_STMT = select(CheckpointMessageModel.message_key).where(
+    CheckpointMessageModel.chat_id == bindparam("chat_id"),
+    CheckpointMessageModel.checkpoint_ns == bindparam("checkpoint_ns"),
+    CheckpointMessageModel.message_key.in_(bindparam("keys", expanding=True)),
+)
+HAS_CHECKPOINTS_STMT = (
+    select(CheckpointModel.checkpoint_id).where(CheckpointModel.chat_id == bindparam("chat_id")).limit(1)
+)
+
+
+class RepositoryCheckpoint(IRepositoryCheckpoint):
+    """
+    Построчное хранение чекпоинтов: одна строка на чекпоинт, запись и версию канала,
+    сообщения канала messages - по строке на сообщение (см. MESSAGE_REFS_TYPE).
+
+    Ветка (chat_fork) хранит только свои новые строки: чтение чекпоинтов, записей и blob'ов,
+    которых нет в ветке, продолжается в родителе не дальше точки ветвления.
+    """
+
+    def __init__(self, database: IDatabaseSession):
+        self.database = database
+        # chat_id -> ветка или None; ветка не меняется после создания, кэш сбрасывается при создании и удалении
+        self.__forks: dict[int, ChatFork | None] = {}
+        self.__forks_lock = threading.Lock()
+
+    def put_checkpoint(
+        self,
+        checkpoint: CheckpointRecord,
+        blobs: list[CheckpointBlobRecord],
+        messages: list[CheckpointMessageRecord] | None = None,
+    ) -> None:
+        with self.database.get_session() as session:
+            # Строка чата в ai_state нужна для списка чатов и внешних ключей
+            session.execute(
+                insert(AIStateModel)
+                .values(id=checkpoint.chat_id)
+                .on_conflict_do_nothing(index_elements=[AIStateModel.id])
+            )
+            if messages:
+                # Ключ включает хэш содержимого: строка с тем же ключом уже записана и совпадает
+                session.execute(
+                    insert(CheckpointMessageModel).on_conflict_do_nothing(),
+                    [message.model_dump() for message in messages],
+                )
+            if blobs:
+                # Версия канала неизменяема, поэтому повторная вставка просто пропускается
+                session.execute(
+                    insert(CheckpointBlobModel).on_conflict_do_nothing(),
+                    [blob.model_dump() for blob in blobs],
+                )
+            values = checkpoint.model_dump()
+            session.execute(
+                insert(CheckpointModel)
+                .values(**values)
+                .on_conflict_do_update(
+                    index_elements=[
+                        CheckpointModel.chat_id,
+                        CheckpointModel.checkpoint_ns,
+                        CheckpointModel.checkpoint_id,
+                    ],
+                    set_={
+                        key: values[key]
+                        for key in ("parent_checkpoint_id", "checkpoint_type", "checkpoint_data", "metadata_type", "metadata_data")
+                    },
+                )
+            )
+            session.commit()
+        logger.info(
+            f"Saved checkpoint {checkpoint.checkpoint_id} for chat {checkpoint.chat_id}, "
+            f"blobs: {len(blobs)}, messages: {len(messages or [])}"
+        )
+
+    def put_writes(self, writes: list[CheckpointWriteRecord]) -> None:
+        if not writes:
+            return
+        # Обычные записи не перезаписываются, специальные (idx < 0: ошибки, прерывания) заменяются
+        regular = [write.model_dump() for write in writes if write.idx >= 0]
+        special = [write.model_dump() for write in writes if write.idx < 0]
+        with self.database.get_session() as session:
+            # В ainvoke записи шага могут прийти раньше первого чекпоинта нового чата
+            session.execute(
+                insert(AIStateModel)
+                .values(id=writes[0].chat_id)
+                .on_conflict_do_nothing(index_elements=[AIStateModel.id])
+            )
+            if regular:
+                session.execute(insert(CheckpointWriteModel).on_conflict_do_nothing(), regular)
+            if special:
+                stmt = insert(CheckpointWriteModel)
+                session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[
+                            CheckpointWriteModel.chat_id,
+                            CheckpointWriteModel.checkpoint_ns,
+                            CheckpointWriteModel.checkpoint_id,
+                            CheckpointWriteModel.task_id,
+                            CheckpointWriteModel.idx,
+                        ],
+                        set_={
+                            "channel": stmt.excluded.channel,
+                            "value_type": stmt.excluded.value_type,
+                            "value_data": stmt.excluded.value_data,
+                            "task_path": stmt.excluded.task_path,
+                        },
+                    ),
+                    special,
+                )
+            session.commit()
+
+    def get_checkpoint(self, chat_id: int, checkpoint_ns: str = "", checkpoint_id: str | None = None) -> CheckpointRecord | None:
+        with self.database.get_read_session() as session:
+            for source_chat_id, upto in self.__lineage(chat_id):
+                params = {"chat_id": source_chat_id, "checkpoint_ns": checkpoint_ns}
+                if checkpoint_id:
+                    if upto and checkpoint_id > upto:
+                        continue
+                    query = CHECKPOINT_BY_ID_STMT
+                    params["checkpoint_id"] = checkpoint_id
+                elif upto:
+                    query = LATEST_UPTO_STMT
+                    params["upto"] = upto
+                else:
+                    query = LATEST_CHECKPOINT_STMT
+                db_data = session.execute(query, params).scalars().first()
+                if db_data:
+                    # Для ветки строка родителя выглядит как её собственная
+                    return CheckpointRecord.model_validate(db_data).model_copy(update={"chat_id": chat_id})
+            return None
+
+    def list_checkpoints(
+        self,
+        chat_id: int | None = None,
+        checkpoint_ns: str | None = None,
+        before: str | None = None,
+        limit: int | None = None,
+    ) -> list[CheckpointRecord]:
+        if chat_id is None or len(lineage := self.__lineage(chat_id)) == 1:
+            return self.__select_checkpoints(chat_id=chat_id, checkpoint_ns=checkpoint_ns, before=before, limit=limit)
+
+        records = [
+            record.model_copy(update={"chat_id": chat_id})
+            for source_chat_id, upto in lineage
+            for record in self.__select_checkpoints(
+                chat_id=source_chat_id, checkpoint_ns=checkpoint_ns, before=before, upto=upto, limit=limit
+            )
+        ]
+        records.sort(key=lambda record: record.checkpoint_id, reverse=True)
+        records.sort(key=lambda record: record.checkpoint_ns)
+        return records[:limit] if limit is not None else records
+
+    def __select_checkpoints(
+        self,
+        chat_id: int | None,
+        checkpoint_ns: str | None,
+        before: str | None,
+        limit: int | None,
+        upto: str | None = None,
+    ) -> list[CheckpointRecord]:
+        query = select(CheckpointModel)
+        if chat_id is not None:
+            query = query.where(CheckpointModel.chat_id == chat_id)
+        if checkpoint_ns is not None:
+            query = query.where(CheckpointModel.checkpoint_ns == checkpoint_ns)
+        if before:
+            query = query.where(CheckpointModel.checkpoint_id < before)
+        if upto:
+            query = query.where(CheckpointModel.checkpoint_id <= upto)
+        query = query.order_by(
+            CheckpointModel.chat_id,
+            CheckpointModel.checkpoint_ns,
+            CheckpointModel.checkpoint_id.desc(),
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        with self.database.get_read_session() as session:
+            return [CheckpointRecord.model_validate(row) for row in session.execute(query).scalars()]
+
+    def get_blobs(self, chat_id: int, checkpoint_ns: str, versions: dict[str, str]) -> list[CheckpointBlobRecord]:
+        if not versions:
+            return []
+        missing = {(channel, str(version)) for channel, version in versions.items()}
+        result = []
+        with self.database.get_read_session() as session:
+            # Каналы, не менявшиеся в ветке, лежат у родителя
+            for source_chat_id, _ in self.__lineage(chat_id):
+                params = {"chat_id": source_chat_id, "checkpoint_ns": checkpoint_ns, "versions": list(missing)}
+                for row in session.execute(BLOBS_STMT, params).scalars():
+                    result.append(CheckpointBlobRecord.model_validate(row).model_copy(update={"chat_id": chat_id}))
+                    missing.discard((row.channel, row.version))
+                if not missing:
+                    break
+        return result
+
+    def get_messages(self, chat_id: int, checkpoint_ns: str, keys: list[str]) -> list[CheckpointMessageRecord]:
+        """Строки сообщений по ключам, в произвольном порядке; сообщения до точки ветвления лежат у родителя"""
+        missing = set(keys)
+        result = []
+        with self.database.get_read_session() as session:
+            for source_chat_id, _ in self.__lineage(chat_id):
+                for chunk in self.__chunks(list(missing)):
+                    params = {"chat_id": source_chat_id, "checkpoint_ns": checkpoint_ns, "keys": chunk}
+                    for row in session.execute(MESSAGES_STMT, params).scalars():
+                        result.append(CheckpointMessageRecord.model_validate(row).model_copy(update={"chat_id": chat_id}))
+                        missing.discard(row.message_key)
+                if not missing:
+                    break
+        return result
+
+    def existing_message_keys(self, chat_id: int, checkpoint_ns: str, keys: list[str]) -> set[str]:
+        """Ключи из keys, строки которых уже записаны (в чате или у его родителей)"""
+        missing = set(keys)
+        with self.database.get_read_session() as session:
+            for source_chat_id, _ in self.__lineage(chat_id):
+                for chunk in self.__chunks(list(missing)):
+                    params = {"chat_id": source_chat_id, "checkpoint_ns": checkpoint_ns, "keys": chunk}
+                    missing.difference_update(session.execute(MESSAGE_KEYS_STMT, params).scalars())
+                if not missing:
+                    break
+        return set(keys) - missing
+
+    def prune_messages(self, chat_id: int) -> int:
+        """Удаляет строки сообщений, на которые не ссылается ни один blob канала messages чата"""
+        with self.database.get_session() as session:
+            live: set[tuple[str, str]] = set()
+            for checkpoint_ns, value_data in session.execute(
+                select(CheckpointBlobModel.checkpoint_ns, CheckpointBlobModel.value_data).where(
+                    CheckpointBlobModel.chat_id == chat_id,
+                    CheckpointBlobModel.value_type == MESSAGE_REFS_TYPE,
+                )
+            ):
+                live.update((checkpoint_ns, key) for key in decode_message_refs(value_data))
+            unused = [
+                tuple(row)
+                for row in session.execute(
+                    select(CheckpointMessageModel.checkpoint_ns, CheckpointMessageModel.message_key)
+                    .where(CheckpointMessageModel.chat_id == chat_id)
+                )
+                if tuple(row) not in live
+            ]
+            for chunk in self.__chunks(unused):
+                session.execute(
+                    delete(CheckpointMessageModel).where(
+                        CheckpointMessageModel.chat_id == chat_id,
+                        tuple_(CheckpointMessageModel.checkpoint_ns, CheckpointMessageModel.message_key).in_(chunk),
+                    )
+                )
+            session.commit()
+        if unused:
+            logger.info(f"Deleted {len(unused)} unreferenced messages of chat {chat_id}")
+        return len(unused)
+
+    def get_writes(self, chat_id: int, checkpoint_ns: str, checkpoint_id: str) -> list[CheckpointWriteRecord]:
+        with self.database.get_read_session() as session:
+            for source_chat_id, upto in self.__lineage(chat_id):
+                if upto and checkpoint_id > upto:
+                    continue
+                params = {"chat_id": source_chat_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}
+                rows = session.execute(WRITES_STMT, params).scalars().all()
+                if rows:
+                    return [CheckpointWriteRecord.model_validate(row).model_copy(update={"chat_id": chat_id}) for row in rows]
+        return []
+
+    def has_checkpoints(self, chat_id: int) -> bool:
+        if self.get_fork(chat_id=chat_id):
+            return True
+        with self.database.get_read_session() as session:
+            return session.execute(HAS_CHECKPOINTS_STMT, {"chat_id": chat_id}).first() is not None
+
+    def prune_checkpoints(self, chat_id: int, checkpoint_ns: str, keep: int) -> list[str]:
+        """
+        Удаляет чекпоинты старше keep последних вместе с их записями.
+
+        Не трогает именованные чекпоинты, точки ветвления (у которых больше одного
+        потомка) и концы веток. Blob'ы не удаляются - их собирает delete_blobs.
+        """
+        if keep <= 0:
+            return []
+        with self.database.get_session() as session:
+            rows = session.execute(
+                select(CheckpointModel.checkpoint_id, CheckpointModel.parent_checkpoint_id)
+                .where(CheckpointModel.chat_id == chat_id, CheckpointModel.checkpoint_ns == checkpoint_ns)
+                .order_by(CheckpointModel.checkpoint_id.desc())
+            ).all()
+            if len(rows) <= keep:
+                return []
+
+            children = Counter(parent_id for _, parent_id in rows if parent_id)
+            pinned = set(
+                session.execute(
+                    select(CheckpointPinModel.checkpoint_id).where(
+                        CheckpointPinModel.chat_id == chat_id,
+                        CheckpointPinModel.checkpoint_ns == checkpoint_ns,
+                    )
+                ).scalars()
+            )
+            # Точки ветвления: ветки читают из них свою историю
+            pinned.update(
+                session.execute(
+                    select(ChatForkModel.parent_checkpoint_id).where(ChatForkModel.parent_chat_id == chat_id)
+                ).scalars()
+            )
+            to_delete = [
+                checkpoint_id
+                for checkpoint_id, _ in rows[keep:]
+                if checkpoint_id not in pinned and children[checkpoint_id] == 1
+            ]
+            for start in range(0, len(to_delete), 500):
+                chunk = to_delete[start:start + 500]
+                for model in (CheckpointWriteModel, CheckpointModel):
+                    session.execute(
+                        delete(model).where(
+                            model.chat_id == chat_id,
+                            model.checkpoint_ns == checkpoint_ns,
+                            model.checkpoint_id.in_(chunk),
+                        )
+                    )
+            session.commit()
+        if to_delete:
+            logger.info(f"Pruned {len(to_delete)} checkpoints of chat {chat_id}")
+        return to_delete
+
+    def list_blob_keys(self, chat_id: int) -> list[tuple[str, str, str]]:
+        with self.database.get_read_session() as session:
+            return [
+                tuple(row)
+                for row in session.execute(
+                    select(
+                        CheckpointBlobModel.checkpoint_ns,
+                        CheckpointBlobModel.channel,
+                        CheckpointBlobModel.version,
+                    ).where(CheckpointBlobModel.chat_id == chat_id)
+                )
+            ]
+
+    def delete_blobs(self, chat_id: int, keys: list[tuple[str, str, str]]) -> None:
+        if not keys:
+            return
+        with self.database.get_session() as session:
+            for start in range(0, len(keys), 300):
+                session.execute(
+                    delete(CheckpointBlobModel).where(
+                        CheckpointBlobModel.chat_id == chat_id,
+                        tuple_(
+                            CheckpointBlobModel.checkpoint_ns,
+                            CheckpointBlobModel.channel,
+                            CheckpointBlobModel.version,
+                        ).in_(keys[start:start + 300]),
+                    )
+                )
+            session.commit()
+        logger.info(f"Deleted {len(keys)} unreferenced blobs of chat {chat_id}")
+
+    def chats_over_retention(self, keep: int) -> list[int]:
+        with self.database.get_read_session() as session:
+            return list(
+                session.execute(
+                    select(CheckpointModel.chat_id)
+                    .group_by(CheckpointModel.chat_id, CheckpointModel.checkpoint_ns)
+                    .having(func.count() > keep)
+                    .distinct()
+                ).scalars()
+            )
+
+    def pin_checkpoint(self, chat_id: int, checkpoint_ns: str, checkpoint_id: str, name: str | None = None) -> None:
+        with self.database.get_session() as session:
+            stmt = insert(CheckpointPinModel).values(
+                chat_id=chat_id, checkpoint_ns=checkpoint_ns, checkpoint_id=checkpoint_id, name=name
+            )
+            session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[
+                        CheckpointPinModel.chat_id,
+                        CheckpointPinModel.checkpoint_ns,
+                        CheckpointPinModel.checkpoint_id,
+                    ],
+                    set_={"name": stmt.excluded.name},
+                )
+            )
+            session.commit()
+
+    def unpin_checkpoint(self, chat_id: int, checkpoint_ns: str, checkpoint_id: str) -> None:
+        with self.database.get_session() as session:
+            session.execute(
+                delete(CheckpointPinModel).where(
+                    CheckpointPinModel.chat_id == chat_id,
+                    CheckpointPinModel.checkpoint_ns == checkpoint_ns,
+                    CheckpointPinModel.checkpoint_id == checkpoint_id,
+                )
+            )
+            session.commit()
+
+    def incremental_vacuum(self, max_pages: int | None = None) -> int:
+        """
+        Возвращает файлу базы свободные страницы. Работает только в базе с auto_vacuum=INCREMENTAL:
+        старую базу переводит офлайн-миграция (codec_migration --vacuum), полный VACUUM здесь не делается.
+        """
+        with self.database.get_session() as session:
+            connection = session.connection()
+            free_pages = connection.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+            if not free_pages:
+                return 0
+            if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                logger.info(
+                    f"{free_pages} free pages, but auto_vacuum is not INCREMENTAL: run codec_migration --vacuum"
+                )
+                return 0
+            pages = f"({max_pages})" if max_pages else ""
+            session.commit()
+            # Прагма освобождает по странице на шаг, а execute драйвера делает только первый шаг;
+            # executescript выполняет её до конца
+            session.connection().connection.driver_connection.executescript(f"PRAGMA incremental_vacuum{pages};")
+        logger.info(f"Incremental vacuum freed up to {free_pages} pages")
+        return free_pages
+
+    def create_fork(self, chat_id: int, parent_chat_id: int, parent_checkpoint_id: str) -> ChatFork:
+        """Новый чат chat_id, история которого - история parent_chat_id до parent_checkpoint_id включительно"""
+        # Ветка ссылается на чат, где строка чекпоинта лежит на самом деле: у ветки без новых ходов её нет
+        for source_chat_id, upto in self.__lineage(parent_chat_id):
+            if upto and parent_checkpoint_id > upto:
+                continue
+            with self.database.get_read_session() as session:
+                exists = session.execute(
+                    select(CheckpointModel.checkpoint_id).where(
+                        CheckpointModel.chat_id == source_chat_id,
+                        CheckpointModel.checkpoint_id == parent_checkpoint_id,
+                    ).limit(1)
+                ).first()
+            if exists:
+                parent_chat_id = source_chat_id
+                break
+        else:
+            raise ValueError(f"Checkpoint {parent_checkpoint_id} not found in chat {parent_chat_id}")
+
+        fork = ChatFork(
+            chat_id=chat_id,
+            parent_chat_id=parent_chat_id,
+            parent_checkpoint_id=parent_checkpoint_id,
+            created_at=time.time(),
+        )
+        with self.database.get_session() as session:
+            session.execute(
+                insert(AIStateModel)
+                .values(id=chat_id)
+                .on_conflict_do_nothing(index_elements=[AIStateModel.id])
+            )
+            session.execute(insert(ChatForkModel).values(**fork.model_dump()))
+            session.commit()
+        with self.__forks_lock:
+            self.__forks.pop(chat_id, None)
+        logger.info(f"Forked chat {parent_chat_id} at {parent_checkpoint_id} into chat {chat_id}")
+        return fork
+
+    def get_fork(self, chat_id: int) -> ChatFork | None:
+        with self.__forks_lock:
+            if chat_id in self.__forks:
+                return self.__forks[chat_id]
+        with self.database.get_read_session() as session:
+            db_data = session.get(ChatForkModel, chat_id)
+            fork = ChatFork.model_validate(db_data) if db_data else None
+        with self.__forks_lock:
+            self.__forks[chat_id] = fork
+        return fork
+
+    def list_forks(self, parent_chat_id: int) -> list[ChatFork]:
+        with self.database.get_read_session() as session:
+            return [
+                ChatFork.model_validate(row)
+                for row in session.execute(
+                    select(ChatForkModel).where(ChatForkModel.parent_chat_id == parent_chat_id)
+                ).scalars()
+            ]
+
+    def delete_chat(self, chat_id: int, fork_versions: dict[int, dict[str, str]] | None = None) -> None:
+        """fork_versions: ветка -> channel_versions её точки ветвления, только эти blob'ы копируются в ветку"""
+        own_fork = self.get_fork(chat_id=chat_id)
+        with self.database.get_session() as session:
+            # Ветки удаляемого чата получают копию точки ветвления, её записей и её версий каналов
+            for fork in self.list_forks(parent_chat_id=chat_id):
+                self.__detach_fork(
+                    session=session,
+                    fork=fork,
+                    parent_fork=own_fork,
+                    versions=(fork_versions or {}).get(fork.chat_id, {}),
+                )
+            for model in (
+                CheckpointWriteModel,
+                CheckpointBlobModel,
+                CheckpointMessageModel,
+                CheckpointPinModel,
+                CheckpointModel,
+                ChatForkModel,
+            ):
+                session.execute(delete(model).where(model.chat_id == chat_id))
+            session.commit()
+        with self.__forks_lock:
+            self.__forks.clear()
+
+    @staticmethod
+    def __detach_fork(session, fork: ChatFork, parent_fork: ChatFork | None, versions: dict[str, str]):
+        blob_key = tuple_(CheckpointBlobModel.channel, CheckpointBlobModel.version).in_(
+            [(channel, str(version)) for channel, version in versions.items()]
+        )
+        for model, key in (
+            (CheckpointModel, CheckpointModel.checkpoint_id == fork.parent_checkpoint_id),
+            (CheckpointWriteModel, CheckpointWriteModel.checkpoint_id == fork.parent_checkpoint_id),
+            (CheckpointBlobModel, blob_key),
+        ):
+            if model is CheckpointBlobModel and not versions:
+                continue
+            columns = [column for column in model.__table__.columns if column.key != "chat_id"]
+            session.execute(
+                insert(model)
+                .from_select(
+                    ["chat_id", *[column.key for column in columns]],
+                    select(literal(fork.chat_id), *columns).where(model.chat_id == fork.parent_chat_id, key),
+                )
+                .on_conflict_do_nothing()
+            )
+        # Сообщения точки ветвления, записанные в удаляемом чате; более ранние остаются у деда
+        refs = session.execute(
+            select(CheckpointBlobModel.checkpoint_ns, CheckpointBlobModel.value_data).where(
+                CheckpointBlobModel.chat_id == fork.parent_chat_id,
+                CheckpointBlobModel.channel == MESSAGES_CHANNEL,
+                CheckpointBlobModel.version == str(versions.get(MESSAGES_CHANNEL)),
+                CheckpointBlobModel.value_type == MESSAGE_REFS_TYPE,
+            )
+        ).all()
+        columns = [column for column in CheckpointMessageModel.__table__.columns if column.key != "chat_id"]
+        for checkpoint_ns, value_data in refs:
+            for chunk in RepositoryCheckpoint.__chunks(decode_message_refs(value_data)):
+                session.execute(
+                    insert(CheckpointMessageModel)
+                    .from_select(
+                        ["chat_id", *[column.key for column in columns]],
+                        select(literal(fork.chat_id), *columns).where(
+                            CheckpointMessageModel.chat_id == fork.parent_chat_id,
+                            CheckpointMessageModel.checkpoint_ns == checkpoint_ns,
+                            CheckpointMessageModel.message_key.in_(chunk),
+                        ),
+                    )
+                    .on_conflict_do_nothing()
+                )
+        if parent_fork is None:
+            session.execute(delete(ChatForkModel).where(ChatForkModel.chat_id == fork.chat_id))
+        else:
+            # Более ранняя история остаётся у деда
+            session.execute(
+                update(ChatForkModel)
+                .where(ChatForkModel.chat_id == fork.chat_id)
+                .values(
+                    parent_chat_id=parent_fork.parent_chat_id,
+                    parent_checkpoint_id=parent_fork.parent_checkpoint_id,
+                )
+            )
+        logger.info(f"Detached fork {fork.chat_id} from deleted chat {fork.parent_chat_id}")
+
+    @staticmethod
+    def __chunks(items: list) -> list[list]:
+        return [items[start:start + KEYS_CHUNK] for start in range(0, len(items), KEYS_CHUNK)]
+
+    def __lineage(self, chat_id: int) -> list[tuple[int, str | None]]:
+        """Чат и его предки: (chat_id, последний чекпоинт, видимый из ветки)"""
+        lineage: list[tuple[int, str | None]] = [(chat_id, None)]
+        upto: str | None = None
+        fork = self.get_fork(chat_id=chat_id)
+        while fork is not None:
+            upto = min(upto, fork.parent_checkpoint_id) if upto else fork.parent_checkpoint_id
+            lineage.append((fork.parent_chat_id, upto))
+            fork = self.get_fork(chat_id=fork.parent_chat_id)
+        return lineage
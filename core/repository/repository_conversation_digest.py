@@ -0,0 +1,46 @@
+import logging
+import time
+
+from sqlalchemy.dialects.sqlite import insert
+
+from application.interfaces.Idatabase_session import IDatabaseSession
+from application.interfaces.Irepository_conversation_digest import IRepositoryConversationDigest
+from core.repository.models.ai_state_model import AIStateModel
+from core.repository.models.conversation_digest_model import ConversationDigestModel
+from domain.entities.conversation_digest import ConversationDigest
+
+
+logger = logging.getLogger(__name__)
+
+
+class RepositoryConversationDigest(IRepositoryConversationDigest):
+    """Краткое содержание старых ходов чата, по одной строке на чат"""
+
+    def __init__(self, database: IDatabaseSession):
+        self.database = database
+
+    def get(self, chat_id: int) -> ConversationDigest | None:
+        with self.database.get_read_session() as session:
+            db_data = session.get(ConversationDigestModel, chat_id)
+            if db_data:
+                return ConversationDigest.model_validate(db_data)
+            return None
+
+    def put(self, digest: ConversationDigest) -> None:
+        values = digest.model_dump()
+        values["updated_at"] = values["updated_at"] or time.time()
+        with self.database.get_session() as session:
+            # В режиме InMemorySaver строка ai_state пишется флашером позже, а внешний ключ нужен сейчас
+            session.execute(
+                insert(AIStateModel)
+                .values(id=digest.chat_id)
+                .on_conflict_do_nothing(index_elements=[AIStateModel.id])
+            )
+            stmt = insert(ConversationDigestModel).values(**values)
+            session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[ConversationDigestModel.chat_id],
+                    set_={key: stmt.excluded[key] for key in values if key != "chat_id"},
+                )
+            )
+            session.commit()
@@ -0,0 +1,53 @@
+import hashlib
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from application.interfaces.Idatabase_session import IDatabaseSession
+from application.interfaces.Irepository_media import IRepositoryMedia
+from core.repository import codec
+from core.repository.models.media_blob_model import MediaBlobModel
+from domain.entities.media_blob import MediaBlob
+
+
+logger = logging.getLogger(__name__)
+
+
+class RepositoryMedia(IRepositoryMedia):
+    """Медиафайлы по sha256 содержимого: одинаковые байты хранятся один раз"""
+
+    def __init__(self, database: IDatabaseSession):
+        self.database = database
+
+    def put(self, data: bytes, mime_type: str) -> str:
+        sha256 = hashlib.sha256(data).hexdigest()
+        if self.exists(sha256=sha256):
+            return sha256
+        with self.database.get_session() as session:
+            session.execute(
+                insert(MediaBlobModel)
+                .values(sha256=sha256, mime_type=mime_type, size=len(data), data=codec.encode_bytes(data))
+                .on_conflict_do_nothing(index_elements=[MediaBlobModel.sha256])
+            )
+            session.commit()
+        logger.info(f"Saved media {sha256} ({mime_type}, {len(data)} bytes)")
+        return sha256
+
+    def get(self, sha256: str) -> MediaBlob | None:
+        with self.database.get_read_session() as session:
+            db_data = session.get(MediaBlobModel, sha256)
+            if db_data is None:
+                return None
+            return MediaBlob(
+                sha256=db_data.sha256,
+                mime_type=db_data.mime_type,
+                size=db_data.size,
+                data=codec.decode_bytes(db_data.data),
+            )
+
+    def exists(self, sha256: str) -> bool:
+        with self.database.get_read_session() as session:
+            return session.execute(
+                select(MediaBlobModel.sha256).where(MediaBlobModel.sha256 == sha256)
+            ).first() is not None
@@ -0,0 +1,77 @@
+import logging
+import time
+from typing import Any
+
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.dialects.sqlite import insert
+
+from application.interfaces.Idatabase_session import IDatabaseSession
+from application.interfaces.Irepository_response_cache import IRepositoryResponseCache
+from core.repository import codec
+from core.repository.models.response_cache_model import ResponseCacheModel
+
+
+logger = logging.getLogger(__name__)
+
+
+class RepositoryResponseCache(IRepositoryResponseCache):
+    """Ответы модели на одиночные запросы: TTL при чтении, предел размера при записи"""
+
+    def __init__(self, database: IDatabaseSession):
+        self.database = database
+
+    def get(self, key: str, ttl: float) -> Any | None:
+        with self.database.get_read_session() as session:
+            row = session.execute(
+                select(ResponseCacheModel.response, ResponseCacheModel.created_at).where(ResponseCacheModel.key == key)
+            ).first()
+        if row is None:
+            return None
+        now = time.time()
+        with self.database.get_session() as session:
+            if ttl > 0 and row.created_at < now - ttl:
+                session.execute(delete(ResponseCacheModel).where(ResponseCacheModel.key == key))
+                session.commit()
+                return None
+            session.execute(update(ResponseCacheModel).where(ResponseCacheModel.key == key).values(last_used_at=now))
+            session.commit()
+        return codec.loads(row.response)
+
+    def put(self, key: str, model: str, response: Any, max_bytes: int) -> None:
+        data = codec.dumps(response)
+        now = time.time()
+        with self.database.get_session() as session:
+            stmt = insert(ResponseCacheModel).values(
+                key=key, model=model, response=data, size=len(data), created_at=now, last_used_at=now
+            )
+            session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[ResponseCacheModel.key],
+                    set_={column: stmt.excluded[column] for column in ("response", "size", "created_at", "last_used_at")},
+                )
+            )
+            if max_bytes > 0:
+                self.__evict(session=session, max_bytes=max_bytes)
+            session.commit()
+
+    def clear(self) -> int:
+        with self.database.get_session() as session:
+            removed = session.execute(delete(ResponseCacheModel)).rowcount
+            session.commit()
+        return removed
+
+    @staticmethod
+    def __evict(session, max_bytes: int):
+        total = session.execute(select(func.coalesce(func.sum(ResponseCacheModel.size), 0))).scalar()
+        if total <= max_bytes:
+            return
+        keys = []
+        for key, size in session.execute(
+            select(ResponseCacheModel.key, ResponseCacheModel.size).order_by(ResponseCacheModel.last_used_at)
+        ):
+            if total <= max_bytes:
+                break
+            keys.append(key)
+            total -= size
+        session.execute(delete(ResponseCacheModel).where(ResponseCacheModel.key.in_(keys)))
+        logger.info(f"Evicted {len(keys)} cached responses")
@@ -0,0 +1,133 @@
+import logging
+
+from sqlalchemy import select, text, or_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+
+from application.interfaces.Idatabase_session import IDatabaseSession
+from application.interfaces.Irepository_search import IRepositorySearch
+from core.repository.models.ai_state_model import AIStateModel
+from core.repository.models.chat_summary_model import ChatSummaryModel
+from core.repository.models.message_search_model import MESSAGE_FTS_TABLE, SearchIndexStateModel
+from domain.entities.search_result import SearchResult
+
+
+logger = logging.getLogger(__name__)
+
+
+INSERT_MESSAGE_STMT = text(f"INSERT INTO {MESSAGE_FTS_TABLE} (content, chat_id, role) VALUES (:content, :chat_id, :role)")
+DELETE_CHAT_STMT = text(f"DELETE FROM {MESSAGE_FTS_TABLE} WHERE chat_id = :chat_id")
+# Удалённые чаты из виртуальной таблицы каскадом не уходят, отсекаем их по ai_state
+SEARCH_STMT = text(
+    f"""
+    SELECT {MESSAGE_FTS_TABLE}.chat_id AS chat_id,
+           chat_summary.title AS title,
+           snippet({MESSAGE_FTS_TABLE}, 0, '[', ']', '…', 12) AS snippet,
+           bm25({MESSAGE_FTS_TABLE}) AS rank
+    FROM {MESSAGE_FTS_TABLE}
+    LEFT JOIN chat_summary ON chat_summary.chat_id = {MESSAGE_FTS_TABLE}.chat_id
+    WHERE {MESSAGE_FTS_TABLE} MATCH :query
+      AND {MESSAGE_FTS_TABLE}.chat_id IN (SELECT id FROM ai_state)
+    ORDER BY rank
+    LIMIT :limit
+    """
+)
+
+
+class RepositorySearch(IRepositorySearch):
+    """Поиск по тексту сообщений всех чатов через FTS5"""
+
+    def __init__(self, database: IDatabaseSession):
+        self.database = database
+
+    def index_turn(self, chat_id: int, messages: list[tuple[str, str]], message_count: int) -> bool:
+        """
+        Дописывает в индекс сообщения нового хода.
+
+        Если индекс не сходится с историей (чат из старой базы, ход с вызовами инструментов,
+        обрезанная история), ничего не пишет и возвращает False - чат нужно переиндексировать.
+        """
+        with self.database.get_session() as session:
+            # В режиме InMemorySaver строка ai_state может ещё не быть записана флашером
+            session.execute(
+                insert(AIStateModel)
+                .values(id=chat_id)
+                .on_conflict_do_nothing(index_elements=[AIStateModel.id])
+            )
+            indexed_count = session.execute(
+                select(SearchIndexStateModel.indexed_count).where(SearchIndexStateModel.chat_id == chat_id)
+            ).scalar() or 0
+            if indexed_count != message_count - len(messages):
+                return False
+
+            rows = [{"content": content, "chat_id": chat_id, "role": role} for role, content in messages if content]
+            if rows:
+                session.execute(INSERT_MESSAGE_STMT, rows)
+            self.__set_indexed_count(session=session, chat_id=chat_id, indexed_count=message_count)
+            session.commit()
+        return True
+
+    def reindex_chat(self, chat_id: int, messages: list[tuple[str, str]]) -> None:
+        with self.database.get_session() as session:
+            session.execute(DELETE_CHAT_STMT, {"chat_id": chat_id})
+            rows = [{"content": content, "chat_id": chat_id, "role": role} for role, content in messages if content]
+            if rows:
+                session.execute(INSERT_MESSAGE_STMT, rows)
+            self.__set_indexed_count(session=session, chat_id=chat_id, indexed_count=len(messages))
+            session.commit()
+        logger.info(f"Reindexed chat {chat_id}: {len(messages)} messages")
+
+    def chats_to_backfill(self, limit: int = 100) -> list[int]:
+        """Чаты без записи в индексе или проиндексированные не полностью"""
+        query = (
+            select(AIStateModel.id)
+            .outerjoin(SearchIndexStateModel, SearchIndexStateModel.chat_id == AIStateModel.id)
+            .outerjoin(ChatSummaryModel, ChatSummaryModel.chat_id == AIStateModel.id)
+            .where(
+                or_(
+                    SearchIndexStateModel.chat_id.is_(None),
+                    SearchIndexStateModel.indexed_count < ChatSummaryModel.message_count,
+                )
+            )
+            .order_by(AIStateModel.id.desc())
+            .limit(limit)
+        )
+        with self.database.get_read_session() as session:
+            return list(session.execute(query).scalars())
+
+    def search(self, query: str, limit: int = 20) -> list[SearchResult]:
+        match_query = self.__to_match_query(query)
+        if not match_query:
+            return []
+        try:
+            with self.database.get_read_session() as session:
+                rows = session.execute(SEARCH_STMT, {"query": match_query, "limit": limit * 5}).mappings().all()
+        except OperationalError as e:
+            logger.error(f"Search error: {e}")
+            return []
+
+        # Лучшее совпадение на чат, порядок - по рангу bm25
+        results: dict[int, SearchResult] = {}
+        for row in rows:
+            if row["chat_id"] not in results:
+                results[row["chat_id"]] = SearchResult(**row)
+        return list(results.values())[:limit]
+
+    @staticmethod
+    def __set_indexed_count(session, chat_id: int, indexed_count: int):
+        stmt = insert(SearchIndexStateModel).values(chat_id=chat_id, indexed_count=indexed_count)
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[SearchIndexStateModel.chat_id],
+                set_={"indexed_count": stmt.excluded.indexed_count},
+            )
+        )
+
+    @staticmethod
+    def __to_match_query(query: str) -> str:
+        """Слова пользователя как фразы FTS5 (без операторов), последнее - по префиксу"""
+        terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+        if not terms:
+            return ""
+        terms[-1] += "*"
+        return " ".join(terms)
@@ -2,9 +2,11 @@ from contextlib import contextmanager
 
 from typing import Generator, Type
 
-from sqlalchemy import create_engine, text, select, func
+from sqlalchemy import create_engine, event, text, select, func
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import StaticPool
 import logging
 
 from application.interfaces.Idatabase_session import IDatabaseSession
@@ -16,10 +18,94 @@ from core.repository.models import * #импорт всех моделей по
 logger = logging.getLogger(__name__)
 
 
+# Профили PRAGMA. WAL во всех профилях: читатели не ждут писателя и наоборот
+PRAGMA_PROFILES: dict[str, dict[str, str | int]] = {
+    # fsync на каждый коммит, без mmap
+    "safe": {
+        # Для новых баз: место от удалённых чекпоинтов возвращается incremental_vacuum без полного VACUUM.
+        # Должен идти до journal_mode - переход в WAL уже записывает заголовок файла
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+        "mmap_size": 0,
+        "busy_timeout": 10000,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    },
+    # В WAL synchronous=NORMAL теряет при сбое питания только последние коммиты, но не портит базу
+    "balanced": {
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -32000,
+        "mmap_size": 268435456,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    },
+    "fast": {
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 1073741824,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    },
+}
+
+
 class SQLiteDatabaseSession(IDatabaseSession):
-    def __init__(self, db_url: str = settings.SQLALCHEMY_DATABASE_URI):
-        self.engine = create_engine(db_url, echo=True)
+    """
+    Соединения с SQLite: одно соединение на запись и пул соединений только на чтение.
+
+    Писатели из разных потоков по очереди берут единственное соединение из пула,
+    вместо того чтобы ловить SQLITE_BUSY. Читатели в WAL видят последний
+    закоммиченный снимок и не ждут запись больших blob'ов.
+    """
+
+    def __init__(
+        self,
+        db_url: str = settings.SQLALCHEMY_DATABASE_URI,
+        pragma_profile: str = settings.SQLITE_PRAGMA_PROFILE,
+    ):
+        self.__pragmas: dict[str, str | int] = {**PRAGMA_PROFILES[pragma_profile], **settings.SQLITE_PRAGMAS}
+        connect_args = {
+            "check_same_thread": False,
+            # Кэш подготовленных выражений sqlite3 на соединение
+            "cached_statements": settings.SQLITE_CACHED_STATEMENTS,
+        }
+
+        if make_url(db_url).database in (None, "", ":memory:"):
+            # Базу в памяти видит только её соединение, поэтому чтение и запись идут через одно
+            self.engine = create_engine(
+                db_url, echo=settings.SQLITE_ECHO, poolclass=StaticPool, connect_args=connect_args
+            )
+            event.listen(self.engine, "connect", self.__configure_writer)
+            self.read_engine = self.engine
+        else:
+            self.engine = create_engine(
+                db_url,
+                echo=settings.SQLITE_ECHO,
+                pool_size=1,
+                max_overflow=0,
+                pool_timeout=settings.SQLITE_WRITE_TIMEOUT,
+                connect_args=connect_args,
+            )
+            event.listen(self.engine, "connect", self.__configure_writer)
+            self.read_engine = create_engine(
+                db_url,
+                echo=settings.SQLITE_ECHO,
+                pool_size=settings.SQLITE_READ_POOL_SIZE,
+                max_overflow=settings.SQLITE_READ_POOL_SIZE,
+                connect_args=connect_args,
+            )
+            event.listen(self.read_engine, "connect", self.__configure_reader)
+
         self.Session = sessionmaker(bind=self.engine)
+        self.ReadSession = sessionmaker(bind=self.read_engine)
         self._init_db()
 
     def _init_db(self):
@@ -38,6 +124,15 @@ class SQLiteDatabaseSession(IDatabaseSession):
         finally:
             session.close()
 
+    @contextmanager
+    def get_read_session(self) -> Generator[Session, any, None]:
+        """Сессия на соединении только для чтения, не ждёт писателя"""
+        session = self.ReadSession()
+        try:
+            yield session
+        finally:
+            session.close()
+
     def get_next_id(self, model: Type[Base]) -> int:
         try:
             # Попытка получить из sqlite_sequence
@@ -53,5 +148,25 @@ class SQLiteDatabaseSession(IDatabaseSession):
             pass
 
         # Fallback на MAX(id)
-        result = session.execute(select(func.max(model.id))).scalar()
-        return (result or 0) + 1
\ No newline at end of file
+        with self.get_read_session() as session:
+            result = session.execute(select(func.max(model.id))).scalar()
+            return (result or 0) + 1
+
+    def __configure_writer(self, dbapi_connection, connection_record):
+        self.__apply_pragmas(dbapi_connection, self.__pragmas)
+
+    def __configure_reader(self, dbapi_connection, connection_record):
+        # journal_mode и auto_vacuum хранятся в файле базы и уже выставлены писателем
+        pragmas = {
+            name: value for name, value in self.__pragmas.items() if name not in ("journal_mode", "auto_vacuum")
+        }
+        self.__apply_pragmas(dbapi_connection, {**pragmas, "query_only": "ON"})
+
+    @staticmethod
+    def __apply_pragmas(dbapi_connection, pragmas: dict[str, str | int]):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
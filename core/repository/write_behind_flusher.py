@@ -0,0 +1,122 @@
+import atexit
+import hashlib
+import logging
+import threading
+
+from application.interfaces.Irepository_bd_dict import IRepositoryDBDict
+from core.config.config import settings
+from core.repository import codec
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindFlusher:
+    """
+    Фоновая запись колонок ai_state.
+
+    Повторные пометки одной пары (record_id, col_name) схлопываются в последнюю,
+    неизменившиеся данные отсекаются по хешу последней записанной версии,
+    все накопленные колонки пишутся одной транзакцией.
+    """
+
+    def __init__(self, repository: IRepositoryDBDict, delay: float = settings.WRITE_BEHIND_DELAY):
+        self.__repository: IRepositoryDBDict = repository
+        self.__delay = delay
+        self.__pending: dict[tuple[int, str], bytes] = {}
+        self.__persisted_hashes: dict[tuple[int, str], bytes] = {}
+        self.__condition = threading.Condition()
+        self.__write_lock = threading.Lock()
+        self.__running = True
+
+        self.__thread = threading.Thread(target=self.__loop, name="WriteBehindFlusher", daemon=True)
+        self.__thread.start()
+        atexit.register(self.shutdown)
+
+    def mark_dirty(self, record_id: int, col_name: str, raw: bytes):
+        """
+        Ставит снимок колонки (pickle до сжатия) в очередь на запись, вызывающий поток не ждёт SQLite.
+        Снимок сериализует вызывающий: живые словари могут измениться до записи.
+        """
+        with self.__condition:
+            self.__pending[(record_id, col_name)] = raw
+            self.__condition.notify()
+
+    def remember(self, record_id: int, col_name: str, raw: bytes | None):
+        """Запоминает хеш уже сохранённых в БД данных (pickle до сжатия), чтобы не переписывать их без изменений"""
+        if raw:
+            with self.__condition:
+                self.__persisted_hashes[(record_id, col_name)] = self.__digest(raw)
+
+    def flush(self):
+        """Синхронно записывает всё накопленное"""
+        with self.__write_lock:
+            self.__write_batch(self.__take_pending())
+
+    def shutdown(self):
+        if not self.__running:
+            return
+        logger.info("Shutting down write-behind flusher")
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify()
+        self.__thread.join(timeout=5)
+        self.flush()
+
+    def __loop(self):
+        while True:
+            with self.__condition:
+                while self.__running and not self.__pending:
+                    self.__condition.wait()
+                if not self.__running:
+                    return
+                # Даём накопиться повторным пометкам, чтобы записать их одним UPDATE
+                self.__condition.wait(timeout=self.__delay)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush error: {e}")
+
+    def __take_pending(self) -> dict[tuple[int, str], bytes]:
+        with self.__condition:
+            batch, self.__pending = self.__pending, {}
+        return batch
+
+    def __requeue(self, batch: dict[tuple[int, str], bytes]):
+        with self.__condition:
+            for key, raw in batch.items():
+                # Более свежий снимок, пришедший за время записи, не перетираем
+                self.__pending.setdefault(key, raw)
+            self.__condition.notify()
+
+    def __write_batch(self, batch: dict[tuple[int, str], bytes]):
+        if not batch:
+            return
+
+        records: dict[int, dict[str, bytes]] = {}
+        hashes: dict[tuple[int, str], bytes] = {}
+        retry: dict[tuple[int, str], bytes] = {}
+        for (record_id, col_name), pickled_data in batch.items():
+            # Хеш считается до сжатия, чтобы неизменившиеся данные не сжимать повторно
+            digest = self.__digest(pickled_data)
+            if self.__persisted_hashes.get((record_id, col_name)) == digest:
+                continue
+            records.setdefault(record_id, {})[col_name] = codec.encode_bytes(pickled_data)
+            hashes[(record_id, col_name)] = digest
+
+        if records:
+            try:
+                self.__repository.save_columns(records=records)
+                with self.__condition:
+                    self.__persisted_hashes.update(hashes)
+                logger.info(f"Flushed {len(hashes)} columns of {len(records)} records")
+            except Exception as e:
+                logger.error(f"Write-behind save error: {e}")
+                retry.update({key: batch[key] for key in hashes})
+
+        if retry:
+            self.__requeue(retry)
+
+    @staticmethod
+    def __digest(raw: bytes) -> bytes:
+        return hashlib.blake2b(raw, digest_size=16).digest()
@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+
+class ChatArchive(BaseModel):
+    chat_id: int
+    segment: str
+    offset: int
+    length: int
+    sha256: str
+    archived_at: float = 0.0
+
+    model_config = {
+        "from_attributes": True
+    }
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+
+class ChatFork(BaseModel):
+    chat_id: int
+    parent_chat_id: int
+    parent_checkpoint_id: str
+    created_at: float = 0.0
+
+    model_config = {
+        "from_attributes": True
+    }
@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class ChatPage(BaseModel):
+    # Сообщения страницы в хронологическом порядке: [{"human": content}, {"ai": content}, ...]
+    messages: list[dict]
+    # Курсор для следующей (более старой) страницы, None - история загружена целиком
+    before: int | None = None
@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+
+
+class ChatSummary(BaseModel):
+    chat_id: int
+    title: str | None = None
+    message_count: int = 0
+    media_bytes: int = 0
+    updated_at: float = 0.0
+
+    model_config = {
+        "from_attributes": True
+    }
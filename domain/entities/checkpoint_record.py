@@ -0,0 +1,57 @@
+from pydantic import BaseModel
+
+
+class CheckpointRecord(BaseModel):
+    chat_id: int
+    checkpoint_ns: str = ""
+    checkpoint_id: str
+    parent_checkpoint_id: str | None = None
+    checkpoint_type: str
+    checkpoint_data: bytes
+    metadata_type: str
+    metadata_data: bytes
+
+    model_config = {
+        "from_attributes": True
+    }
+
+
+class CheckpointWriteRecord(BaseModel):
+    chat_id: int
+    checkpoint_ns: str = ""
+    checkpoint_id: str
+    task_id: str
+    idx: int
+    channel: str
+    value_type: str
+    value_data: bytes
+    task_path: str = ""
+
+    model_config = {
+        "from_attributes": True
+    }
+
+
+class CheckpointBlobRecord(BaseModel):
+    chat_id: int
+    checkpoint_ns: str = ""
+    channel: str
+    version: str
+    value_type: str
+    value_data: bytes
+
+    model_config = {
+        "from_attributes": True
+    }
+
+
+class CheckpointMessageRecord(BaseModel):
+    chat_id: int
+    checkpoint_ns: str = ""
+    message_key: str
+    value_type: str
+    value_data: bytes
+
+    model_config = {
+        "from_attributes": True
+    }
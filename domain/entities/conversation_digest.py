@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+
+class ConversationDigest(BaseModel):
+    chat_id: int
+    summary: str
+    covered: int
+    last_message_id: str
+    model: str
+    updated_at: float = 0.0
+
+    model_config = {
+        "from_attributes": True
+    }
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+
+class MediaBlob(BaseModel):
+    sha256: str
+    mime_type: str
+    size: int
+    data: bytes
+
+    model_config = {
+        "from_attributes": True
+    }
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+class MediaHandle(BaseModel):
+    """Ссылка на медиа в истории чата, данные подгружаются только при показе"""
+    chat_id: int
+    message_index: int
+    block_index: int
+    mime_type: str
+    sha256: str | None = None
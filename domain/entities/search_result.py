@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class SearchResult(BaseModel):
+    chat_id: int
+    title: str | None = None
+    snippet: str
+    rank: float
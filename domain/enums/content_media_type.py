@@ -9,6 +9,8 @@ class ContentMediaType(Enum):
     TEXT = "text"
     MEDIA = "media"
     IMAGE_URL = "image_url"
+    MEDIA_REF = "media_ref"
+    MEDIA_HANDLE = "media_handle"
 
 
 class MimeType(Enum):
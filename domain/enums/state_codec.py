@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class StateCodec(Enum):
+    RAW = "raw"
+    ZLIB = "zlib"
+    LZMA = "lzma"
+    ZSTD = "zstd"
@@ -12,6 +12,8 @@ class Status(Enum):
     PROCESSING_RECORD = ("🔇", "В процессе расшифровки")
     FINISHED_RECOGNITION = ("🎯", "Распознано")
     WAITING_AGENT_RESPONSE = ("🟡", "Ожидает ответ агента")
+    PROCESSING_VIDEO = ("🎥", "Подготовка видео")
+    FINISHED_VIDEO = ("🎥", "Видео подготовлено")
 
     def __init__(self, icon, text):
         self.icon = icon
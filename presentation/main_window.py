@@ -1,5 +1,6 @@
 import tkinter as tk
 import logging
+import threading
 from typing import Callable
 
 from PIL import Image, ImageGrab
@@ -7,6 +8,7 @@ import pystray
 from chlorophyll import CodeView
 from application.services.view_service import ViewService
 from core.event_dispatcher import dispatcher
+from domain.entities.chat_summary import ChatSummary
 from domain.enums.content_media_type import (
     ContentMediaType,
     EXTENSION_MAP,
@@ -21,13 +23,23 @@ from presentation.selection_window import SelectionWindow
 from presentation.status_bar import StatusBar
 import base64
 from tkinter import filedialog, messagebox
-import tempfile
+import io
 import os
 
 
 logger = logging.getLogger(__name__)
 
 
+CHAT_PAGE_SIZE = 50
+HISTORY_PAGE_SIZE = 20
+SEARCH_DELAY_MS = 300
+# Период вывода накопленного текста стримящегося ответа: один insert на пачку токенов
+STREAM_FLUSH_MS = 50
+STREAM_MARK = "agent_stream"
+# Одинаковый промпт для одинакового скриншота - ответ берётся из кэша ответов
+PIC_TO_TEXT_PROMPT = "Выдели весь текст со скриншота без изменений"
+
+
 class MainWindow(tk.Tk):
     def __init__(self, view_service: ViewService):
         super().__init__()
@@ -69,10 +81,27 @@ class MainWindow(tk.Tk):
         )
         self.new_chat_button.pack(fill="both", expand=False, padx=10, pady=(5, 5))
 
+        # Поиск по тексту всех чатов
+        search_lbl = tk.Label(self.left_frame, text="Поиск по чатам:", bg="white", anchor="w")
+        search_lbl.pack(fill="x", padx=10)
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(self.left_frame, textvariable=self.search_var)
+        self.search_entry.pack(fill="x", expand=False, padx=10, pady=(0, 5))
+        self.search_entry.bind("<KeyRelease>", self.__schedule_search)
+        self.__search_job = None
+        self.__search_mode = False
+
         self.chat_listbox = tk.Listbox(self.left_frame)
         self.chat_listbox.pack(fill="both", expand=True, padx=10, pady=(5, 5))
         self.chat_listbox.bind("<<ListboxSelect>>", self.select_chat)
+        self.chat_listbox.bind("<Button-3>", self.show_chat_context_menu)  # Правая кнопка мыши
+        # Следующая страница подгружается, когда список прокручен до конца
+        self.chat_listbox.configure(yscrollcommand=self.__on_chat_list_scroll)
         self.current_chat_id: int | None = None
+        self.__chat_ids: list[int] = []  # индекс строки listbox -> id чата
+        self.__chat_cursor: tuple[float, int] | None = None
+        self.__chat_list_exhausted = False
+        self.__chat_list_loading = False
         self.update_chat_listbox()
 
         # === Правая панель ===
@@ -91,6 +120,17 @@ class MainWindow(tk.Tk):
         self.editor = None
         self.input_editor = None
 
+        # Подгрузка более старых сообщений открытого чата
+        self.load_older_button = tk.Button(
+            self.right_frame, text="⬆ Загрузить ранние сообщения", command=self.load_older_messages
+        )
+        self.__history_cursor: int | None = None
+        # Части ответа из потока рантайма, ещё не выведенные в редактор: (id чата, текст)
+        self.__stream_buffer: list[tuple[int, str]] = []
+        self.__stream_lock = threading.Lock()
+        self.__stream_chat_id: int | None = None
+        self.__stream_job = None
+
         # === Контейнеры для редакторов ===
         self.editor_frame = tk.Frame(self.right_frame, bg="white", height=1)
         self.editor_frame.pack(fill="both", expand=True, padx=10, pady=(5, 5))
@@ -143,12 +183,13 @@ class MainWindow(tk.Tk):
         self.view_service.start_record_audio()
 
     def __stop_record_audio(self, event):
-        audio_wav_base64 = self.view_service.stop_record_audio()
-        self.attach_audio(audio_wav_base64=audio_wav_base64)
+        audio_base64, mime_type = self.view_service.stop_record_audio()
+        self.attach_audio(audio_base64=audio_base64, mime_type=mime_type)
 
 
     def create_new_chat(self):
         self.__create_editor(self.editor_frame, "editor", initial_data="", height=1)
+        self.__set_history_cursor(None)
         self.current_chat_id = self.view_service.create_new_chat()
 
     def run_app(self):
@@ -156,9 +197,81 @@ class MainWindow(tk.Tk):
 
     def update_chat_listbox(self):
         self.chat_listbox.delete(0, tk.END)  # Очищает список
-        self.chat_sessions = self.view_service.get_chat_list()
-        for name in self.chat_sessions:
-            self.chat_listbox.insert(tk.END, name)
+        self.__chat_ids = []
+        self.__chat_cursor = None
+        self.__chat_list_exhausted = False
+        self.load_more_chats()
+
+    def load_more_chats(self):
+        """Дописывает в конец списка следующую страницу чатов"""
+        if self.__chat_list_exhausted or self.__chat_list_loading:
+            return
+        self.__chat_list_loading = True
+        try:
+            page = self.view_service.get_chat_page(limit=CHAT_PAGE_SIZE, before=self.__chat_cursor)
+            for summary in page:
+                self.chat_listbox.insert(tk.END, self.__chat_label(summary))
+                self.__chat_ids.append(summary.chat_id)
+            if page:
+                self.__chat_cursor = (page[-1].updated_at, page[-1].chat_id)
+            if len(page) < CHAT_PAGE_SIZE:
+                self.__chat_list_exhausted = True
+        finally:
+            self.__chat_list_loading = False
+
+    def refresh_chat_in_listbox(self, chat_id: int):
+        """Поднимает обновлённый чат в начало списка, не перечитывая остальные"""
+        if self.__search_mode:
+            return
+        summary = self.view_service.get_chat_summary(chat_id=chat_id)
+        if summary is None:
+            return
+        if chat_id in self.__chat_ids:
+            index = self.__chat_ids.index(chat_id)
+            self.chat_listbox.delete(index)
+            self.__chat_ids.pop(index)
+        self.chat_listbox.insert(0, self.__chat_label(summary))
+        self.__chat_ids.insert(0, chat_id)
+        if chat_id == self.current_chat_id:
+            self.chat_listbox.selection_clear(0, tk.END)
+            self.chat_listbox.selection_set(0)
+
+    def __schedule_search(self, event=None):
+        # Ищем, когда пользователь перестал печатать
+        if self.__search_job is not None:
+            self.after_cancel(self.__search_job)
+        self.__search_job = self.after(SEARCH_DELAY_MS, self.search_chats)
+
+    def search_chats(self):
+        self.__search_job = None
+        query = self.search_var.get().strip()
+        if not query:
+            if self.__search_mode:
+                self.__search_mode = False
+                self.update_chat_listbox()
+            return
+
+        self.__search_mode = True
+        results = self.view_service.search_chats(query=query)
+        self.chat_listbox.delete(0, tk.END)
+        self.__chat_ids = []
+        # Результаты поиска - одной страницей, без подгрузки при прокрутке
+        self.__chat_list_exhausted = True
+        for result in results:
+            title = result.title or f"Чат {result.chat_id}"
+            self.chat_listbox.insert(tk.END, f"{title}: {' '.join(result.snippet.split())}")
+            self.__chat_ids.append(result.chat_id)
+
+    def __on_chat_list_scroll(self, first, last):
+        if float(last) >= 1.0:
+            self.load_more_chats()
+
+    @staticmethod
+    def __chat_label(summary: ChatSummary) -> str:
+        title = summary.title or f"Чат {summary.chat_id}"
+        if summary.message_count:
+            return f"{title} ({summary.message_count})"
+        return title
 
     def __create_editor(self, container, attr_name, initial_data=None, height=10, expand: bool = True):
         # Удалить старый, если есть
@@ -299,67 +412,69 @@ class MainWindow(tk.Tk):
             spacing3=5,
         )
 
-    def __add_message_to_editor(self, editor, message: str, sender: str, media_files: list = None):
+    def __add_message_to_editor(self, editor, message: str, sender: str, media_files: list = None, position: str = "end-1c"):
         """Добавляет стилизованное сообщение в указанный редактор с поддержкой медиафайлов"""
-        # Добавляем разделитель если чат не пустой
-        current_content = editor.get("1.0", tk.END).strip()
+        # Добавляем разделитель если перед позицией вставки уже есть сообщения
+        current_content = editor.get("1.0", position).strip()
         if current_content:
             # Добавляем пустую строку как разделитель
-            separator_start = editor.index("end-1c")  # Позиция перед последним символом
-            editor.insert("end-1c", "\n")
-            separator_end = editor.index("end-1c")
+            separator_start = editor.index(position)  # Позиция перед последним символом
+            editor.insert(position, "\n")
+            separator_end = editor.index(position)
             editor.tag_add("separator", separator_start, separator_end)
 
         if sender.lower() == "user":
             # Добавляем метку пользователя
-            label_start = editor.index("end-1c")
-            editor.insert("end-1c", " 👤 Пользователь ")
-            label_end = editor.index("end-1c")
+            label_start = editor.index(position)
+            editor.insert(position, " 👤 Пользователь ")
+            label_end = editor.index(position)
             editor.tag_add("user_label", label_start, label_end)
 
             # Переход на новую строку
-            editor.insert("end-1c", "\n")
+            editor.insert(position, "\n")
 
             # Добавляем медиафайлы если есть
             if media_files:
                 for media_data in media_files:
-                    self.__add_media_to_editor(editor, media_data, "user")
+                    self.__add_media_to_editor(editor, media_data, "user", position)
 
             # Добавляем текстовое сообщение если есть
             if message:
-                message_start = editor.index("end-1c")
-                editor.insert("end-1c", message + "\n")
-                message_end = editor.index("end-1c")
+                message_start = editor.index(position)
+                editor.insert(position, message + "\n")
+                message_end = editor.index(position)
                 editor.tag_add("user_message", message_start, message_end)
 
         elif sender.lower() == "agent":
             # Добавляем метку агента
-            label_start = editor.index("end-1c")
-            editor.insert("end-1c", " 🤖 AI Агент ")
-            label_end = editor.index("end-1c")
+            label_start = editor.index(position)
+            editor.insert(position, " 🤖 AI Агент ")
+            label_end = editor.index(position)
             editor.tag_add("agent_label", label_start, label_end)
 
             # Переход на новую строку
-            editor.insert("end-1c", "\n")
+            editor.insert(position, "\n")
 
             # Добавляем медиафайлы если есть (хотя агент обычно не отправляет медиафайлы)
             if media_files:
                 for media_data in media_files:
-                    self.__add_media_to_editor(editor, media_data, "agent")
+                    self.__add_media_to_editor(editor, media_data, "agent", position)
 
             # Добавляем текстовое сообщение
             if message:
-                message_start = editor.index("end-1c")
-                editor.insert("end-1c", message + "\n")
-                message_end = editor.index("end-1c")
+                message_start = editor.index(position)
+                editor.insert(position, message + "\n")
+                message_end = editor.index(position)
                 editor.tag_add("agent_message", message_start, message_end)
 
-        # Прокручиваем к концу
-        editor.see(tk.END)
+        # Прокручиваем к концу, если сообщение добавлено в конец
+        if position == "end-1c":
+            editor.see(tk.END)
 
-    def __add_media_to_editor(self, editor, media_data: dict, sender: str):
+    def __add_media_to_editor(self, editor, media_data: dict, sender: str, position: str = "end-1c"):
         """Добавляет медиафайл в редактор"""
         # {"mime_type": mime_type, "base64": base64_data, "type": "image"}
+        # или {"mime_type": mime_type, "handle": MediaHandle, "type": "image"} для истории
         if not media_data:
             return
 
@@ -367,11 +482,14 @@ class MainWindow(tk.Tk):
         mime_type = media_data.get('mime_type', '')
         file_type: ContentMediaType = media_data.get('type', ContentMediaType.UNKNOWN)
 
-        media_start = editor.index("end-1c")
+        media_start = editor.index(position)
         line_start = f"{media_start} linestart"
         line_end = f"{media_start} lineend"
 
         if file_type == ContentMediaType.IMAGE:
+            # Картинку из истории подгружаем только сейчас, при показе
+            if not base64_data and media_data.get('handle'):
+                base64_data = self.view_service.resolve_media(handle=media_data['handle'])
             # For images, show the actual image
             photo_image = self.view_service.base64_to_image(base64_data)
             if photo_image:
@@ -379,8 +497,8 @@ class MainWindow(tk.Tk):
                 editor._images.append(photo_image)
 
                 # Вставляем изображение
-                editor.image_create("end-1c", image=photo_image)
-                editor.insert("end-1c", "\n")
+                editor.image_create(position, image=photo_image)
+                editor.insert(position, "\n")
 
                 # Создаем тег для клика по аудио
                 image_tag = f"image_{len(getattr(editor, '_image_data', []))}"
@@ -399,7 +517,7 @@ class MainWindow(tk.Tk):
             # For audio, show a placeholder with file info
             icon = "🎵"
             audio_text = f"{icon} Аудио: ({mime_type}) [Нажмите для прикрепления]"
-            editor.insert("end-1c", audio_text + "\n")
+            editor.insert(position, audio_text + "\n")
 
             # Создаем тег для клика по аудио
             audio_tag = f"audio_{len(getattr(editor, '_audio_data', []))}"
@@ -416,7 +534,7 @@ class MainWindow(tk.Tk):
             # For video, show a placeholder with file info
             icon = "🎥"
             video_text = f"{icon} Видео: ({mime_type}) [Нажмите для прикрепления]"
-            editor.insert("end-1c", video_text + "\n")
+            editor.insert(position, video_text + "\n")
 
             # Создаем тег для клика по видео
             video_tag = f"video_{len(getattr(editor, '_video_data', []))}"
@@ -433,7 +551,7 @@ class MainWindow(tk.Tk):
             # For unknown files
             icon = "📎"
             file_text = f"{icon} Файл: ({mime_type}) [Нажмите для прикрепления]"
-            editor.insert("end-1c", file_text + "\n")
+            editor.insert(position, file_text + "\n")
 
             # Создаем кликабельный тег
             file_tag = f"file_{len(getattr(editor, '_file_data', []))}"
@@ -445,7 +563,7 @@ class MainWindow(tk.Tk):
             editor.tag_config(file_tag, foreground="blue", underline=True)
             editor.tag_bind(file_tag, "<Button-1>", lambda e, data=media_data: self.attach_media_from_chat(data))
 
-        media_end = editor.index("end-1c")
+        media_end = editor.index(position)
 
         # Применяем соответствующий стиль
         if sender == "user":
@@ -469,6 +587,10 @@ class MainWindow(tk.Tk):
         try:
             # Создаем копию данных медиафайла
             new_media = media_data.copy()
+            if not new_media.get('base64') and new_media.get('handle'):
+                new_media['base64'] = self.view_service.resolve_media(handle=new_media.pop('handle'))
+                if not new_media['base64']:
+                    raise ValueError("медиафайл недоступен")
 
             # Добавляем к прикрепленным файлам
             self.attached_files.append(new_media)
@@ -494,40 +616,35 @@ class MainWindow(tk.Tk):
 
     def attach_image(self, image: Image.Image):
         if image:
-            # Создаем временный файл для изображения
-            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_file:
-                image.save(tmp_file.name, "PNG")
-
-                # Читаем как base64
-                with open(tmp_file.name, "rb") as f:
-                    base64_data = base64.b64encode(f.read()).decode("utf-8")
-
-                # Удаляем временный файл
-                os.unlink(tmp_file.name)
-
-                # Добавляем к прикрепленным файлам
-                file_data = {
-                    "base64": base64_data,
-                    "mime_type": "image/png",
-                    "type": ContentMediaType.IMAGE,
-                    "name": f"clipboard_image_{len(self.attached_files) + 1}.png",
-                }
-                self.attached_files.append(file_data)
-                self.update_attachments_display()
+            # PNG в памяти с быстрым сжатием: перед отправкой изображение всё равно перекодирует ImagePipeline
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG", compress_level=1)
+            base64_data = base64.b64encode(buffer.getvalue()).decode("utf-8")
 
-                logger.info("Изображение прикреплено")
-                return "break"  # Предотвращаем стандартную вставку
+            # Добавляем к прикрепленным файлам
+            file_data = {
+                "base64": base64_data,
+                "mime_type": "image/png",
+                "type": ContentMediaType.IMAGE,
+                "name": f"clipboard_image_{len(self.attached_files) + 1}.png",
+            }
+            self.attached_files.append(file_data)
+            self.update_attachments_display()
+
+            logger.info("Изображение прикреплено")
+            return "break"  # Предотвращаем стандартную вставку
         else:
             # Если изображения нет, разрешаем стандартную вставку текста
             return None
 
-    def attach_audio(self, audio_wav_base64: str):
+    def attach_audio(self, audio_base64: str, mime_type: str = MimeType.WAV.value):
+        extension = next((ext for ext, (mime, _) in EXTENSION_MAP.items() if mime == mime_type), "wav")
         # Добавляем к прикрепленным файлам
         file_data = {
-            "base64": audio_wav_base64,
-            "mime_type": MimeType.WAV.value,
+            "base64": audio_base64,
+            "mime_type": mime_type,
             "type": ContentMediaType.AUDIO,
-            "name": f"clipboard_audio_{len(self.attached_files) + 1}.wav",
+            "name": f"clipboard_audio_{len(self.attached_files) + 1}.{extension}",
         }
         self.attached_files.append(file_data)
         self.update_attachments_display()
@@ -549,6 +666,33 @@ class MainWindow(tk.Tk):
         except Exception as e:
             logger.error(f"Ошибка при показе контекстного меню: {e}")
 
+    def show_chat_context_menu(self, event):
+        """Контекстное меню чата в списке: ветвление"""
+        index = self.chat_listbox.nearest(event.y)
+        if index < 0 or index >= len(self.__chat_ids):
+            return
+        chat_id = self.__chat_ids[index]
+        try:
+            context_menu = tk.Menu(self, tearoff=0)
+            context_menu.add_command(label="Продолжить в новой ветке", command=lambda: self.fork_chat(chat_id))
+            context_menu.add_command(
+                label="Ветка без последнего хода", command=lambda: self.fork_chat(chat_id, turns_back=1)
+            )
+            context_menu.tk_popup(event.x_root, event.y_root)
+        except Exception as e:
+            logger.error(f"Ошибка при показе контекстного меню: {e}")
+
+    def fork_chat(self, chat_id: int, turns_back: int = 0):
+        fork_chat_id = self.view_service.fork_chat(chat_id=chat_id, turns_back=turns_back)
+        if fork_chat_id is None:
+            messagebox.showinfo("Ветка чата", "Не удалось создать ветку этого чата")
+            return
+        self.current_chat_id = fork_chat_id
+        self.refresh_chat_in_listbox(chat_id=fork_chat_id)
+        chat_page = self.view_service.get_chat(chat_id=fork_chat_id, limit=HISTORY_PAGE_SIZE)
+        self.__create_editor(self.editor_frame, "editor", initial_data=chat_page.messages, height=1)
+        self.__set_history_cursor(chat_page.before)
+
     def copy_selected_text(self):
         """Копирует выделенный текст в буфер обмена"""
         try:
@@ -641,6 +785,18 @@ class MainWindow(tk.Tk):
                 # Определяем MIME тип
                 mime_type, file_type = self.__get_mime_type(file_path)
 
+                if file_type == ContentMediaType.VIDEO and self.view_service.needs_video_sampling(file_path):
+                    # Большое видео не читаем целиком: в фоне готовятся ключевые кадры
+                    self.view_service.sample_video(
+                        path=file_path,
+                        callback=lambda content, error=None: self.after(
+                            0, lambda: self.__attach_video_frames(
+                                file_path=file_path, mime_type=mime_type, content=content, error=error
+                            )
+                        ),
+                    )
+                    return
+
                 # Читаем и конвертируем в base64
                 with open(file_path, "rb") as media_file:
                     file_data = {
@@ -659,6 +815,20 @@ class MainWindow(tk.Tk):
                 logger.error(f"Ошибка при чтении файла: {e}")
                 messagebox.showerror("Ошибка", f"Не удалось загрузить файл: {e}")
 
+    def __attach_video_frames(self, file_path: str, mime_type: str, content: list[dict] | None, error: Exception | None):
+        if error is not None:
+            messagebox.showerror("Ошибка", f"Не удалось подготовить видео: {error}")
+            return
+        file_data = {
+            'content': content,  # Подписи и кадры, уходят в сообщение вместо файла
+            'name': file_path.split("/")[-1],
+            'mime_type': mime_type,
+            'type': ContentMediaType.VIDEO,
+        }
+        self.attached_files.append(file_data)
+        self.update_attachments_display()
+        logger.info(f"Видео прикреплено ключевыми кадрами: {file_data['name']}")
+
     def __parse_history_message(self, message: list | str) -> tuple[str, list]:
         textmessage = None
         media = []
@@ -667,6 +837,13 @@ class MainWindow(tk.Tk):
             for i in message:
                 if ContentMediaType.TEXT.value in i:
                     textmessage = i.get(ContentMediaType.TEXT.value, None)
+                elif i.get('type') == ContentMediaType.MEDIA_HANDLE.value:
+                    # Данные медиа не загружены, только handle - подгрузятся при показе
+                    handle = i.get("handle")
+                    type = self.__get_media_type_by_mime(mime_type=handle.mime_type)
+                    media.append(
+                        {"mime_type": handle.mime_type, "handle": handle, "type": type}
+                    )
                 elif ContentMediaType.IMAGE_URL.value in i.get('type', ""):
                     try:
                         media_data = i.get("image_url")
@@ -691,15 +868,36 @@ class MainWindow(tk.Tk):
 
         return textmessage, media
 
-    def __load_chat_messages(self, editor, messages_data):
+    def __load_chat_messages(self, editor, messages_data, position: str = "end-1c"):
         """Загружает список сообщений в редактор с правильной стилизацией"""
         for message_dict in messages_data:
             if "human" in message_dict:
                 message, media_files = self.__parse_history_message(message=message_dict["human"])
-                self.__add_message_to_editor(editor=editor, message=message, sender="user", media_files=media_files)
+                self.__add_message_to_editor(editor=editor, message=message, sender="user", media_files=media_files, position=position)
             elif "ai" in message_dict:
                 message, media_files = self.__parse_history_message(message=message_dict["ai"])
-                self.__add_message_to_editor(editor=editor, message=message, sender="agent", media_files=media_files)
+                self.__add_message_to_editor(editor=editor, message=message, sender="agent", media_files=media_files, position=position)
+
+    def load_older_messages(self):
+        """Дорисовывает над историей предыдущую страницу сообщений"""
+        if self.__history_cursor is None:
+            return
+        page = self.view_service.get_older_messages(before=self.__history_cursor, limit=HISTORY_PAGE_SIZE)
+        # Метка с правой гравитацией сдвигается за вставленным текстом, сообщения идут по порядку
+        self.editor.mark_set("history_start", "1.0")
+        self.editor.mark_gravity("history_start", tk.RIGHT)
+        self.__load_chat_messages(self.editor, page.messages, position="history_start")
+        if page.messages:
+            self.editor.insert("history_start", "\n")
+        self.editor.see("1.0")
+        self.__set_history_cursor(page.before)
+
+    def __set_history_cursor(self, before: int | None):
+        self.__history_cursor = before
+        if before is None:
+            self.load_older_button.pack_forget()
+        else:
+            self.load_older_button.pack(fill="x", padx=10, before=self.editor_frame)
 
     def change_language(self, event=None):
         logger.info(f"change_language: {event}")
@@ -713,14 +911,14 @@ class MainWindow(tk.Tk):
         selection = self.chat_listbox.curselection()
         if not selection:
             return
-        chat_name = self.chat_listbox.get(selection[0])
-        self.current_chat_id = chat_name
+        self.current_chat_id = self.__chat_ids[selection[0]]
 
         # Получаем структурированные данные чата
-        chat_data = self.view_service.get_chat(chat_id=self.current_chat_id)
-        self.__create_editor(self.editor_frame, "editor", initial_data=chat_data, height=1)
+        chat_page = self.view_service.get_chat(chat_id=self.current_chat_id, limit=HISTORY_PAGE_SIZE)
+        self.__create_editor(self.editor_frame, "editor", initial_data=chat_page.messages, height=1)
+        self.__set_history_cursor(chat_page.before)
 
-    def send_message(self):
+    def send_message(self, use_cache: bool = False):
         text = self.input_editor.get("1.0", tk.END).strip()
 
         # Проверяем что есть либо текст либо медиафайлы
@@ -755,6 +953,9 @@ class MainWindow(tk.Tk):
                     "data": file_data['base64'],
                     "mime_type": file_data['mime_type'],
                 })
+            elif file_data['type'] == ContentMediaType.VIDEO and file_data.get('content'):
+                # Большое видео - ключевые кадры с отметками времени
+                message_content.extend(file_data['content'])
             elif file_data['type'] == ContentMediaType.VIDEO:
                 # Для видео используем аналогичный формат
                 message_content.append(
@@ -765,12 +966,78 @@ class MainWindow(tk.Tk):
                     }
                 )
 
-        self.view_service.send_message(
+        chat_id = self.view_service.send_message(
             message=message_content,
-            callback=self.callback_appending_ai_message
+            # Ответ приходит в потоке рантайма, виджеты Tk трогаем только из главного потока
+            callback=lambda **kwargs: self.after(0, lambda: self.callback_appending_ai_message(**kwargs)),
+            on_delta=self.on_stream_delta,
+            use_cache=use_cache,
         )
-
-    def callback_appending_ai_message(self, messages):
+        if self.current_chat_id is None:
+            self.current_chat_id = chat_id
+        self.__open_stream(chat_id=chat_id)
+
+    def on_stream_delta(self, delta: str, chat_id: int):
+        """Вызывается из потока рантайма на каждый токен: только копит текст, редактор обновляет __flush_stream"""
+        with self.__stream_lock:
+            self.__stream_buffer.append((chat_id, delta))
+
+    def __open_stream(self, chat_id: int):
+        """Открывает в редакторе сообщение агента, в которое дописывается стримящийся ответ"""
+        if self.__stream_chat_id is not None:
+            # Ответ на предыдущее сообщение ещё идёт, следующий ответ появится целиком
+            return
+        self.__stream_chat_id = chat_id
+        self.editor.mark_set(STREAM_MARK, "end-1c")
+        self.editor.mark_gravity(STREAM_MARK, "left")
+        self.__add_message_to_editor(self.editor, "", "agent")
+        if self.__stream_job is None:
+            self.__stream_job = self.after(STREAM_FLUSH_MS, self.__flush_stream)
+
+    def __flush_stream(self):
+        if self.__stream_chat_id is None:
+            with self.__stream_lock:
+                self.__stream_buffer = []
+            self.__stream_job = None
+            return
+        self.__render_stream()
+        self.__stream_job = self.after(STREAM_FLUSH_MS, self.__flush_stream)
+
+    def __render_stream(self):
+        """Дописывает накопленный текст в черновик стрима; только из потока Tk"""
+        with self.__stream_lock:
+            deltas, self.__stream_buffer = self.__stream_buffer, []
+        text = "".join(delta for chat_id, delta in deltas if chat_id == self.__stream_chat_id)
+        # После переключения чата редактор пересоздан и метки потока в нём нет
+        if text and self.current_chat_id == self.__stream_chat_id and STREAM_MARK in self.editor.mark_names():
+            start = self.editor.index("end-1c")
+            self.editor.insert("end-1c", text)
+            self.editor.tag_add("agent_message", start, "end-1c")
+            self.editor.see(tk.END)
+
+    def __close_stream(self, chat_id: int):
+        """
+        Убирает черновик стрима: итоговый ответ выводится обычным сообщением.
+        Вызывается в потоке Tk вместе с выводом ответа, поэтому черновик не меняется во время удаления.
+        """
+        if chat_id != self.__stream_chat_id:
+            return
+        # Последний проход: буфер разобран до удаления, ничего не останется после черновика
+        self.__render_stream()
+        self.__stream_chat_id = None
+        if STREAM_MARK in self.editor.mark_names():
+            self.editor.delete(STREAM_MARK, "end-1c")
+            self.editor.mark_unset(STREAM_MARK)
+
+    def callback_appending_ai_message(self, messages, chat_id: int | None = None, error: Exception | None = None):
+        if chat_id is not None:
+            self.__close_stream(chat_id=chat_id)
+        if error is not None:
+            return
+        if chat_id is not None and self.current_chat_id is not None and chat_id != self.current_chat_id:
+            # Пока ждали ответа, открыт другой чат: ответ уже в истории своего чата, обновляем только список
+            self.refresh_chat_in_listbox(chat_id=chat_id)
+            return
         # Добавляем новые сообщения из результата
         for message_dict in messages:
             if "human" in message_dict:
@@ -786,17 +1053,38 @@ class MainWindow(tk.Tk):
         # Очищаем поле ввода и сбрасываем прикрепленный медиафайл
         self.input_editor.delete("1.0", tk.END)
         self.clear_all_attachments()
-        self.update_chat_listbox()
-        dispatcher.send(signal=Signal.set_status, status=Status.IDLE)
+        if self.current_chat_id is None:
+            self.current_chat_id = self.view_service.get_current_chat_id()
+        self.refresh_chat_in_listbox(chat_id=self.current_chat_id)
 
 
     def pic_to_text(self):
+        """
+        Текст со скриншота области. Запрос уходит без истории (в новом чате, если в текущем
+        уже есть сообщения), поэтому повтор на том же изображении отвечается из кэша ответов.
+        Набранный черновик и его вложения сохраняются.
+        """
         self.mark_area()
         frame = self.view_service.get_screenshot(
             coords=self.view_service.coords
         )
-        self.attach_image(image=frame)
-
+        if frame is None:
+            return
+        draft_text = self.input_editor.get("1.0", "end-1c")
+        draft_files = list(self.attached_files)
+        if self.current_chat_id is not None:
+            self.create_new_chat()
+        try:
+            self.attached_files = []
+            self.attach_image(image=frame)
+            self.input_editor.delete("1.0", tk.END)
+            self.input_editor.insert("1.0", PIC_TO_TEXT_PROMPT)
+            self.send_message(use_cache=True)
+        finally:
+            self.input_editor.delete("1.0", tk.END)
+            self.input_editor.insert("1.0", draft_text)
+            self.attached_files = draft_files
+            self.update_attachments_display()
 
     def mark_area(self, call_cack_func: Callable = lambda *args,**kwargs: None):
         if self.selection_window is None:
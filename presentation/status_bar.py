@@ -41,6 +41,7 @@ class StatusBar:
 
         dispatcher.connect(sender=self, signal=Signal.set_status, receiver=self.set_status, weak=True)
 
-    def set_status(self, status: Status):
-        self.root.after(0, lambda: self.status_label.config(text=f"{status.icon} {status.text}"))
+    def set_status(self, status: Status, detail: str | None = None):
+        text = f"{status.icon} {status.text} {detail}" if detail else f"{status.icon} {status.text}"
+        self.root.after(0, lambda: self.status_label.config(text=text))
 
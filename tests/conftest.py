@@ -0,0 +1,60 @@
+import os
+
+# Настройки требуют ключ API, тестам сеть не нужна
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from core.ai.checkpointer import SQLiteCheckpointSaver
+from core.repository.repository_bd_dict import RepositoryDBDict
+from core.repository.repository_checkpoint import RepositoryCheckpoint
+from core.repository.sqlite_session import SQLiteDatabaseSession
+from domain.entities.ai_state import AIState
+
+
+@pytest.fixture
+def database(tmp_path) -> SQLiteDatabaseSession:
+    """База во временном файле: чтение и запись идут через разные соединения, как в приложении"""
+    database = SQLiteDatabaseSession(db_url=f"sqlite+pysqlite:///{tmp_path / 'test.db'}")
+    yield database
+    database.engine.dispose()
+    database.read_engine.dispose()
+
+
+@pytest.fixture
+def repository(database) -> RepositoryDBDict:
+    return RepositoryDBDict(database=database)
+
+
+@pytest.fixture
+def make_saver(database):
+    """Новый чекпоинтер поверх той же базы - ничего не помнит о прошлых записях"""
+    def factory(retention: int = 0) -> SQLiteCheckpointSaver:
+        return SQLiteCheckpointSaver(repository=RepositoryCheckpoint(database=database), retention=retention)
+    return factory
+
+
+@pytest.fixture
+def make_chat(repository):
+    def factory(chat_id: int) -> dict:
+        repository.create(AIState(id=chat_id))
+        return {"configurable": {"thread_id": str(chat_id), "checkpoint_ns": ""}}
+    return factory
+
+
+def echo_graph(checkpointer: SQLiteCheckpointSaver):
+    """Граф из одного узла, отвечающего эхом: ход без модели, но с настоящими чекпоинтами LangGraph"""
+    def echo(state: MessagesState) -> dict:
+        return {"messages": [AIMessage(content=f"echo {state['messages'][-1].content}")]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("echo", echo)
+    builder.add_edge(START, "echo")
+    builder.add_edge("echo", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def contents(messages) -> list[str]:
+    return [message.content for message in messages]
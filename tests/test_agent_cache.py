@@ -0,0 +1,63 @@
+from application.services.agent_cache import AgentCache
+
+
+class FakeService:
+    """Вместо AIService: кэшу нужны только id чата, оценка памяти и close"""
+
+    def __init__(self, chat_id: int, size: int = 0):
+        self.chat_id = chat_id
+        self.size = size
+        self.closed = False
+
+    def get_current_chat_id(self) -> int:
+        return self.chat_id
+
+    def memory_usage(self) -> int:
+        return self.size
+
+    def close(self):
+        self.closed = True
+
+
+def test_least_recent_chat_is_evicted_and_closed():
+    cache = AgentCache(max_size=2, max_bytes=0)
+    services = [FakeService(chat_id) for chat_id in (1, 2, 3)]
+    cache.put(services[0])
+    cache.put(services[1])
+    cache.get(chat_id=1)
+
+    cache.put(services[2])
+
+    assert cache.get(chat_id=2) is None
+    assert services[1].closed
+    assert cache.get(chat_id=1) is services[0] and not services[0].closed
+
+
+def test_byte_limit_evicts_least_recent_until_under_limit():
+    cache = AgentCache(max_size=10, max_bytes=100)
+    # Чаты с SQLiteCheckpointSaver историю не держат (0 байт), но вытесняются в порядке LRU
+    for chat_id in (1, 2, 3):
+        cache.put(FakeService(chat_id))
+    large = [FakeService(4, size=60), FakeService(5, size=60)]
+    for service in large:
+        cache.put(service)
+
+    assert [cache.get(chat_id) is not None for chat_id in (1, 2, 3, 4, 5)] == [False, False, False, False, True]
+    assert large[0].closed
+
+
+def test_sqlite_chats_are_limited_by_count_only():
+    cache = AgentCache(max_size=3, max_bytes=1)
+    for chat_id in range(1, 6):
+        cache.put(FakeService(chat_id))
+
+    assert [chat_id for chat_id in range(1, 6) if cache.get(chat_id) is not None] == [3, 4, 5]
+
+
+def test_current_chat_is_never_evicted():
+    cache = AgentCache(max_size=0, max_bytes=1)
+    service = FakeService(1, size=1000)
+
+    cache.put(service)
+
+    assert cache.get(chat_id=1) is service
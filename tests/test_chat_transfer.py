@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import os
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from application.services.media_service import MediaService
+from core.ai.checkpointer import SQLiteCheckpointSaver
+from core.repository.chat_transfer import CHATS_FILE, ChatExporter, ChatImporter, media_path
+from core.repository.repository_bd_dict import RepositoryDBDict
+from core.repository.repository_chat_summary import RepositoryChatSummary
+from core.repository.repository_checkpoint import RepositoryCheckpoint
+from core.repository.repository_media import RepositoryMedia
+from core.repository.sqlite_session import SQLiteDatabaseSession
+from tests.conftest import contents, echo_graph
+
+
+IMAGE = os.urandom(3000)
+IMAGE_SHA256 = hashlib.sha256(IMAGE).hexdigest()
+
+
+@pytest.fixture
+def target(tmp_path) -> SQLiteDatabaseSession:
+    database = SQLiteDatabaseSession(db_url=f"sqlite+pysqlite:///{tmp_path / 'target.db'}")
+    yield database
+    database.engine.dispose()
+    database.read_engine.dispose()
+
+
+def config(chat_id: int) -> dict:
+    return {"configurable": {"thread_id": str(chat_id), "checkpoint_ns": ""}}
+
+
+@pytest.fixture
+def exported(database, repository, make_saver, make_chat, tmp_path):
+    saver = make_saver()
+    graph = echo_graph(saver)
+    image_block = {"type": "image_url", "image_url": f"data:image/png;base64,{base64.b64encode(IMAGE).decode()}"}
+    # Сообщения с изображением пишутся без хода: эхо повторило бы base64 в ответе.
+    # Чат 1 - изображение в сообщении, чат 2 - то же изображение ссылкой на media_blob
+    graph.invoke({"messages": [HumanMessage(content="first turn")]}, make_chat(1))
+    graph.update_state(config(1), {"messages": [HumanMessage(content=[{"type": "text", "text": "inline"}, image_block])]})
+    media = MediaService(repository=RepositoryMedia(database=database))
+    graph.invoke({"messages": [HumanMessage(content="ref")]}, make_chat(2))
+    graph.update_state(config(2), {"messages": [HumanMessage(content=media.to_refs([image_block]))]})
+    summaries = RepositoryChatSummary(database=database)
+    summaries.record_turn(chat_id=1, title="first turn", message_count=3, media_bytes=len(IMAGE))
+
+    out_dir = tmp_path / "export"
+    stats = ChatExporter(repository=repository, checkpointer=saver, database=database).export(out_dir)
+    return out_dir, stats
+
+
+def test_export_writes_each_media_file_once(exported):
+    out_dir, stats = exported
+
+    assert stats == {"chats": 2, "messages": 6, "media": 1}
+    assert media_path(root=out_dir, sha256=IMAGE_SHA256).read_bytes() == IMAGE
+    assert "base64" not in (out_dir / CHATS_FILE).read_text(encoding="utf-8")
+
+
+def test_import_restores_history_media_and_summary(exported, target):
+    out_dir, _ = exported
+    repository = RepositoryDBDict(database=target)
+    saver = SQLiteCheckpointSaver(repository=RepositoryCheckpoint(database=target), retention=0)
+
+    chat_ids = ChatImporter(database=target, repository=repository, checkpointer=saver).import_dir(out_dir)
+    assert list(chat_ids) == [1, 2]
+
+    first = saver.get_tuple(config(chat_ids[1])).checkpoint["channel_values"]["messages"]
+    assert contents(first)[:2] == ["first turn", "echo first turn"]
+    assert first[2].content == [
+        {"type": "text", "text": "inline"},
+        {"type": "media_ref", "sha256": IMAGE_SHA256, "mime_type": "image/png", "block_type": "image_url"},
+    ]
+    second = saver.get_tuple(config(chat_ids[2])).checkpoint["channel_values"]["messages"]
+    assert second[2].content[0]["sha256"] == IMAGE_SHA256
+    assert MediaService(repository=RepositoryMedia(database=target)).get_base64(IMAGE_SHA256) == \
+        base64.b64encode(IMAGE).decode()
+
+    summary = RepositoryChatSummary(database=target).get(chat_id=chat_ids[1])
+    assert (summary.title, summary.message_count) == ("first turn", 3)
+
+    # Импортированный чат продолжается обычным ходом
+    echo_graph(saver).invoke({"messages": [HumanMessage(content="third turn")]}, config(chat_ids[1]))
+    history = saver.get_tuple(config(chat_ids[1])).checkpoint["channel_values"]["messages"]
+    assert len(history) == 5
+    assert contents(history)[-2:] == ["third turn", "echo third turn"]
+
+
+def test_repeated_import_creates_new_chats(exported, target):
+    out_dir, _ = exported
+    importer = ChatImporter(
+        database=target,
+        repository=RepositoryDBDict(database=target),
+        checkpointer=SQLiteCheckpointSaver(repository=RepositoryCheckpoint(database=target), retention=0),
+    )
+
+    first = importer.import_dir(out_dir)
+    second = importer.import_dir(out_dir)
+
+    assert set(first.values()).isdisjoint(second.values())
@@ -0,0 +1,163 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from sqlalchemy import func, select
+
+from core.ai.context_window import TOKEN_COUNT_KEY
+from core.repository.models.checkpoint_model import CheckpointMessageModel
+from tests.conftest import contents, echo_graph
+
+
+def ask(graph, config: dict, *questions: str):
+    for question in questions:
+        graph.invoke({"messages": [HumanMessage(content=question)]}, config)
+
+
+def test_history_survives_reload(make_saver, make_chat):
+    config = make_chat(1)
+    ask(echo_graph(make_saver()), config, "q1", "q2")
+
+    checkpoint = make_saver().get_tuple(config)
+
+    assert contents(checkpoint.checkpoint["channel_values"]["messages"]) == ["q1", "echo q1", "q2", "echo q2"]
+
+
+def test_list_is_newest_first(make_saver, make_chat):
+    config = make_chat(1)
+    saver = make_saver()
+    ask(echo_graph(saver), config, "q1", "q2")
+
+    checkpoints = list(make_saver().list(config))
+    ids = [checkpoint.config["configurable"]["checkpoint_id"] for checkpoint in checkpoints]
+
+    assert ids == sorted(ids, reverse=True)
+    assert checkpoints[0].checkpoint["id"] == saver.get_tuple(config).checkpoint["id"]
+    # Родитель каждого чекпоинта - следующий в списке
+    assert [checkpoint.parent_config["configurable"]["checkpoint_id"] for checkpoint in checkpoints[:-1]] == ids[1:]
+    assert checkpoints[-1].parent_config is None
+    assert len(list(make_saver().list(config, filter={"source": "input"}))) == 2
+    assert len(list(make_saver().list(config, limit=2))) == 2
+
+
+def test_pending_writes_round_trip(make_saver, make_chat):
+    config = make_chat(1)
+    saver = make_saver()
+    ask(echo_graph(saver), config, "q1")
+    checkpoint_config = saver.get_tuple(config).config
+
+    saver.put_writes(checkpoint_config, [("messages", [HumanMessage(content="pending")])], task_id="task")
+
+    writes = make_saver().get_tuple(checkpoint_config).pending_writes
+    assert [(task_id, channel, contents(value)) for task_id, channel, value in writes] == [
+        ("task", "messages", ["pending"])
+    ]
+
+
+def message_rows(database) -> int:
+    with database.get_read_session() as session:
+        return session.execute(select(func.count()).select_from(CheckpointMessageModel)).scalar()
+
+
+def test_messages_are_stored_once(database, make_saver, make_chat):
+    config = make_chat(1)
+    saver = make_saver()
+    ask(echo_graph(saver), config, "q1", "q2", "q3")
+
+    history = saver.get_tuple(config).checkpoint["channel_values"]["messages"]
+
+    # Каждый ход пишет только свои два сообщения, а не всю историю заново
+    assert message_rows(database) == len(history)
+
+
+def test_replaced_message_survives_reload(database, make_saver, make_chat):
+    config = make_chat(1)
+    saver = make_saver()
+    graph = echo_graph(saver)
+    ask(graph, config, "q1", "q2")
+    answer = saver.get_tuple(config).checkpoint["channel_values"]["messages"][1]
+    rows = message_rows(database)
+
+    # add_messages заменяет сообщение с тем же id на месте
+    graph.update_state(config, {"messages": [AIMessage(id=answer.id, content="edited")]})
+    make_chat(2)
+    fork = saver.fork_thread(config=config, thread_id="2")
+
+    reloaded = make_saver()
+    assert contents(reloaded.get_tuple(config).checkpoint["channel_values"]["messages"]) == [
+        "q1", "edited", "q2", "echo q2"
+    ]
+    assert contents(reloaded.get_tuple(fork).checkpoint["channel_values"]["messages"])[1] == "edited"
+    assert message_rows(database) == rows + 1
+
+
+def test_token_count_is_stored_with_message(make_saver, make_chat):
+    config = make_chat(1)
+    ask(echo_graph(make_saver()), config, "q1")
+
+    _, messages = make_saver().get_messages(config=config, start=0, end=2)
+
+    assert all(isinstance(message.additional_kwargs.get(TOKEN_COUNT_KEY), int) for message in messages)
+    assert all("token_count" not in message.response_metadata for message in messages)
+
+
+def test_get_messages_reads_a_page(make_saver, make_chat):
+    config = make_chat(1)
+    ask(echo_graph(make_saver()), config, "q1", "q2", "q3")
+    saver = make_saver()
+
+    total, page = saver.get_messages(config=config, start=2, end=4)
+    count, messages = saver.iter_messages(config, batch_size=4)
+
+    assert total == 6
+    assert contents(page) == ["q2", "echo q2"]
+    assert count == 6
+    assert contents(messages) == ["q1", "echo q1", "q2", "echo q2", "q3", "echo q3"]
+
+
+def test_fork_outlives_deleted_parent(make_saver, make_chat):
+    parent = make_chat(1)
+    saver = make_saver()
+    graph = echo_graph(saver)
+    ask(graph, parent, "q1")
+    fork_point = saver.get_tuple(parent).config
+    ask(graph, parent, "q2")
+
+    make_chat(2)
+    fork = saver.fork_thread(config=fork_point, thread_id="2")
+    ask(graph, {"configurable": {"thread_id": "2", "checkpoint_ns": ""}}, "fork q")
+    saver.delete_thread("1")
+
+    reloaded = make_saver()
+    fork_config = {"configurable": {"thread_id": "2", "checkpoint_ns": ""}}
+    assert reloaded.get_tuple(parent) is None
+    assert contents(reloaded.get_tuple(fork_config).checkpoint["channel_values"]["messages"]) == [
+        "q1", "echo q1", "fork q", "echo fork q"
+    ]
+    assert contents(reloaded.get_tuple(fork).checkpoint["channel_values"]["messages"]) == ["q1", "echo q1"]
+
+
+def test_retention_keeps_pinned_and_fork_points(make_saver, make_chat):
+    config = make_chat(1)
+    saver = make_saver(retention=2)
+    graph = echo_graph(saver)
+    ask(graph, config, "q1")
+    pinned = saver.get_tuple(config).config
+    saver.pin(pinned, name="first answer")
+    ask(graph, config, "q2")
+    fork_point = saver.get_tuple(config).config
+    make_chat(2)
+    saver.fork_thread(config=fork_point, thread_id="2")
+    ask(graph, config, "q3", "q4", "q5")
+    for chat_id in saver.take_dirty_chats():
+        saver.compact_thread(chat_id=chat_id)
+
+    reloaded = make_saver()
+    kept = {checkpoint.config["configurable"]["checkpoint_id"] for checkpoint in reloaded.list(config)}
+
+    assert pinned["configurable"]["checkpoint_id"] in kept
+    assert fork_point["configurable"]["checkpoint_id"] in kept
+    # Два последних по retention, именованный и точка ветвления
+    assert len(kept) == 4
+    assert contents(reloaded.get_tuple(pinned).checkpoint["channel_values"]["messages"]) == ["q1", "echo q1"]
+    assert contents(
+        reloaded.get_tuple({"configurable": {"thread_id": "2", "checkpoint_ns": ""}}).checkpoint["channel_values"]["messages"]
+    ) == ["q1", "echo q1", "q2", "echo q2"]
+    assert len(contents(reloaded.get_tuple(config).checkpoint["channel_values"]["messages"])) == 10
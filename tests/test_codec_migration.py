@@ -0,0 +1,30 @@
+from langchain_core.messages import HumanMessage
+from sqlalchemy import select
+
+from core.repository import codec
+from core.repository.codec_migration import CodecMigration, ENCODED_COLUMNS
+from domain.enums.state_codec import StateCodec
+from tests.conftest import contents, echo_graph
+
+
+def test_migrated_state_reads_back(database, make_saver, make_chat):
+    config = make_chat(1)
+    graph = echo_graph(make_saver())
+    # Длинные сообщения, чтобы значения сжимались, а не писались как raw
+    for index in range(3):
+        graph.invoke({"messages": [HumanMessage(content=f"question {index} " * 50)]}, config)
+
+    stats = CodecMigration(database=database, target=StateCodec.LZMA).run()
+
+    assert stats["converted"] > 0
+    with database.get_read_session() as session:
+        for model, columns in ENCODED_COLUMNS.items():
+            for column in columns:
+                # Пустые значения (канал без данных, value_type "empty") пишутся без заголовка
+                for (data,) in session.execute(select(column).where(column.is_not(None), column != b"")):
+                    assert codec.header_codec(data) in (StateCodec.LZMA, StateCodec.RAW)
+    messages = make_saver().get_tuple(config).checkpoint["channel_values"]["messages"]
+    assert contents(messages)[::2] == [f"question {index} " * 50 for index in range(3)]
+
+    # Повторный запуск ничего не перекодирует
+    assert CodecMigration(database=database, target=StateCodec.LZMA).run()["converted"] == 0
@@ -0,0 +1,83 @@
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from core.ai.context_window import TOKEN_COUNT_KEY, ContextWindowManager, count_tokens
+from tests.conftest import contents
+
+
+def sized(message_class, content: str, tokens: int, **kwargs):
+    """Сообщение с заранее известным числом токенов"""
+    return message_class(content=content, additional_kwargs={TOKEN_COUNT_KEY: tokens}, **kwargs)
+
+
+def dialog() -> list:
+    return [
+        sized(SystemMessage, "system", 10),
+        sized(HumanMessage, "q1", 30),
+        sized(AIMessage, "a1", 30),
+        sized(HumanMessage, "q2", 20),
+        sized(AIMessage, "a2", 20),
+        sized(HumanMessage, "q3", 20),
+        sized(AIMessage, "a3", 20),
+    ]
+
+
+def test_short_history_is_not_trimmed():
+    messages = dialog()
+
+    assert ContextWindowManager(max_tokens=150).trim(messages) is messages
+    assert ContextWindowManager(max_tokens=0).trim(messages) is messages
+
+
+def test_window_keeps_system_and_starts_with_user_message():
+    # 115 токенов без системного: влезают a1..a3, но окно не может начаться с ответа
+    trimmed = ContextWindowManager(max_tokens=125).trim(dialog())
+
+    assert contents(trimmed) == ["system", "q2", "a2", "q3", "a3"]
+
+
+def test_window_without_user_message_takes_the_last_one_over_budget():
+    messages = [
+        sized(HumanMessage, "q1", 10),
+        sized(HumanMessage, "q2", 10),
+        sized(AIMessage, "call", 10, tool_calls=[{"name": "search", "args": {}, "id": "1"}]),
+        sized(ToolMessage, "result", 50, tool_call_id="1"),
+        sized(AIMessage, "answer", 10),
+    ]
+
+    trimmed = ContextWindowManager(max_tokens=70).trim(messages)
+
+    assert contents(trimmed) == ["q2", "call", "result", "answer"]
+
+
+def test_history_hook_replaces_state_messages():
+    manager = ContextWindowManager(max_tokens=100, mode="history")
+    messages = dialog()
+
+    update = manager.trim_history_hook({"messages": messages})
+
+    assert isinstance(update["messages"][0], RemoveMessage)
+    assert update["messages"][0].id == REMOVE_ALL_MESSAGES
+    assert contents(update["messages"][1:]) == ["system", "q2", "a2", "q3", "a3"]
+    assert manager.trim_history_hook({"messages": messages[:3]}) == {}
+
+
+def test_token_count_is_stored_once_in_a_new_dict():
+    shared = {"source": "clipboard"}
+    message = HumanMessage(content="x" * 40, additional_kwargs=shared)
+
+    assert count_tokens(message) == 13
+    assert message.additional_kwargs == {"source": "clipboard", TOKEN_COUNT_KEY: 13}
+    assert shared == {"source": "clipboard"}
+
+    message.content = "changed"
+    assert count_tokens(message) == 13
+
+
+def test_model_answer_uses_reported_output_tokens():
+    message = AIMessage(
+        content="short",
+        usage_metadata={"input_tokens": 100, "output_tokens": 42, "total_tokens": 142},
+    )
+
+    assert count_tokens(message) == 42
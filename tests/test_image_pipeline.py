@@ -0,0 +1,82 @@
+import io
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+from core.media.image_pipeline import ImagePipeline
+from domain.enums.content_media_type import MimeType
+
+
+@pytest.fixture(scope="module")
+def pipeline() -> ImagePipeline:
+    return ImagePipeline(max_side=512, workers=2)
+
+
+def encode(image: Image.Image, image_format: str = "PNG") -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def decode(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data)).convert("RGB")
+
+
+def diagram(mode: str, background) -> Image.Image:
+    image = Image.new(mode, (1024, 768), background)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((100, 100, 900, 600), outline=(20, 20, 20, 255) if mode == "RGBA" else (20, 20, 20), width=8)
+    for row in range(8):
+        draw.text((150, 150 + row * 50), "схема: узел -> узел" * 3, fill=(0, 0, 0, 255) if mode == "RGBA" else (0, 0, 0))
+    return image
+
+
+def test_transparent_diagram_gets_white_background(pipeline):
+    source = diagram("RGBA", (0, 0, 0, 0))
+
+    data, mime_type = pipeline.process(encode(source))
+
+    result = decode(data)
+    assert mime_type == MimeType.PNG.value
+    assert result.size == (512, 384)
+    # Прозрачный фон - белый, рамка осталась тёмной
+    assert min(result.getpixel((10, 10))) > 240
+    assert max(result.getpixel((52, 150))) < 100
+
+
+def test_screenshot_is_kept_lossless_png(pipeline):
+    data, mime_type = pipeline.process(encode(diagram("RGB", (255, 255, 255))))
+
+    assert mime_type == MimeType.PNG.value
+    assert decode(data).size == (512, 384)
+
+
+def test_photo_is_encoded_lossy(pipeline):
+    noise = Image.frombytes("RGB", (800, 600), os.urandom(800 * 600 * 3))
+
+    data, mime_type = pipeline.process(encode(noise))
+
+    assert mime_type in (MimeType.WEBP.value, MimeType.JPEG.value)
+    assert decode(data).size == (512, 384)
+
+
+def test_small_image_that_does_not_shrink_is_kept(pipeline):
+    buffer = io.BytesIO()
+    Image.new("L", (16, 16), 255).save(buffer, "PNG", optimize=True)
+
+    assert pipeline.process(buffer.getvalue()) is None
+
+
+def test_content_blocks_are_replaced_in_place(pipeline):
+    import base64
+
+    image_url = f"data:{MimeType.PNG.value};base64,{base64.b64encode(encode(diagram('RGB', 'white'))).decode()}"
+    content = [{"type": "text", "text": "что на схеме?"}, {"type": "image_url", "image_url": image_url}]
+
+    result = pipeline.process_content(content)
+
+    assert result[0] == content[0]
+    assert result[1]["image_url"].startswith(f"data:{MimeType.PNG.value};base64,")
+    assert len(result[1]["image_url"]) < len(image_url)
+    assert content[1]["image_url"] == image_url
@@ -0,0 +1,102 @@
+import pytest
+
+from core.ai import rate_limit
+from core.ai.rate_limit import RateLimiter, TokenBucket, is_rate_limit_error, retry_after
+
+
+class ClientError(Exception):
+    """Как ошибка google-genai: код и статус в атрибутах"""
+
+    def __init__(self, message: str, code: int, status: str):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def quota_error() -> Exception:
+    try:
+        try:
+            raise ClientError("429 RESOURCE_EXHAUSTED. {'retryDelay': '12s'}", code=429, status="RESOURCE_EXHAUSTED")
+        except ClientError as e:
+            raise RuntimeError("ChatGoogleGenerativeAIError: quota") from e
+    except RuntimeError as e:
+        return e
+
+
+def test_burst_is_limited_by_capacity_then_by_rate(clock):
+    bucket = TokenBucket(rate_per_minute=60)
+
+    assert [bucket.reserve() for _ in range(15)] == [0.0] * 15
+    # Корзина пуста: вызовы встают в очередь по секунде (60 в минуту)
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+    assert bucket.reserve(blocking=False) is None
+
+    clock[0] += 60
+    assert bucket.reserve(blocking=False) == 0.0
+
+
+def test_rate_is_halved_on_429_and_restored_on_success(clock):
+    bucket = TokenBucket(rate_per_minute=60, min_rate_per_minute=10)
+
+    bucket.on_rate_limited(retry_after=12)
+    assert bucket.rate_per_minute == 30
+    assert bucket.reserve() == pytest.approx(12.0)
+
+    for _ in range(3):
+        bucket.on_rate_limited()
+    assert bucket.rate_per_minute == 10
+
+    for _ in range(20):
+        bucket.on_success()
+    assert bucket.rate_per_minute == 60
+    assert bucket.metrics()["throttled"] == 4
+
+
+def test_wrapped_quota_error_is_recognized():
+    error = quota_error()
+
+    assert is_rate_limit_error(error)
+    assert retry_after(error) == 12.0
+
+
+def test_other_errors_are_not_rate_limits():
+    # Текст ошибки не в счёт: "429" и "quota" бывают и в других сообщениях
+    error = ClientError("quota for 429 tokens exceeded", code=400, status="INVALID_ARGUMENT")
+
+    assert not is_rate_limit_error(error)
+    assert not is_rate_limit_error(ValueError("429"))
+    assert retry_after(ValueError("no hint")) is None
+
+
+def test_wait_reports_quota_errors_to_the_bucket(clock):
+    limiter = RateLimiter(max_calls_per_minute=60)
+
+    def call():
+        raise quota_error()
+
+    with pytest.raises(RuntimeError):
+        limiter.wait(call)
+
+    metrics = limiter.metrics()[rate_limit.DEFAULT_KEY]
+    assert (metrics["rate_per_minute"], metrics["throttled"]) == (30, 1)
+    assert limiter.acquire(blocking=False) is False
+
+
+def test_keys_have_separate_quotas(clock):
+    limiter = RateLimiter(max_calls_per_minute=4, limits={"slow-model": 1})
+
+    assert limiter.acquire(key="slow-model", blocking=False)
+    assert not limiter.acquire(key="slow-model", blocking=False)
+    assert limiter.acquire(key="fast-model", blocking=False)
+
+    limiter.update_rate_limit(8)
+    assert limiter.bucket("fast-model").capacity == 2
+    assert limiter.bucket("slow-model").max_rate_per_minute == 1
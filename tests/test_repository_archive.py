@@ -0,0 +1,85 @@
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from core.repository.repository_archive import RepositoryArchive
+from core.repository.repository_chat_summary import RepositoryChatSummary, checkpoint_time
+from core.repository.repository_search import RepositorySearch
+from tests.conftest import contents, echo_graph
+
+
+@pytest.fixture
+def archive(database, tmp_path) -> RepositoryArchive:
+    return RepositoryArchive(database=database, archive_dir=tmp_path / "archive", segment_size=1 << 20)
+
+
+def count_messages(saver):
+    return lambda chat_id: saver.get_messages(
+        config={"configurable": {"thread_id": str(chat_id), "checkpoint_ns": ""}}, start=0, end=0
+    )[0]
+
+
+def test_backfill_uses_history_time_and_size(database, make_saver, make_chat):
+    config = make_chat(1)
+    saver = make_saver()
+    echo_graph(saver).invoke({"messages": [HumanMessage(content="q1")]}, config)
+    latest = saver.get_tuple(config).config["configurable"]["checkpoint_id"]
+    summaries = RepositoryChatSummary(database=database)
+
+    assert summaries.backfill(message_count=count_messages(saver)) == 1
+
+    summary = summaries.get(chat_id=1)
+    assert summary.message_count == 2
+    assert summary.updated_at == pytest.approx(checkpoint_time(latest))
+    assert summary.updated_at == pytest.approx(time.time(), abs=60)
+    assert summaries.backfill(message_count=count_messages(saver)) == 0
+
+
+def test_backfilled_chat_is_not_stale_until_indexed_and_old(database, make_saver, make_chat, archive):
+    config = make_chat(1)
+    saver = make_saver()
+    echo_graph(saver).invoke({"messages": [HumanMessage(content="q1")]}, config)
+    RepositoryChatSummary(database=database).backfill(message_count=count_messages(saver))
+    search = RepositorySearch(database=database)
+
+    search.reindex_chat(chat_id=1, messages=[("human", "q1")])
+    assert archive.stale_chats(older_than=time.time() + 60) == []
+
+    search.reindex_chat(chat_id=1, messages=[("human", "q1"), ("ai", "echo q1")])
+    assert archive.stale_chats(older_than=time.time() - 3600) == []
+    assert archive.stale_chats(older_than=time.time() + 60) == [1]
+
+
+def test_uncounted_summary_is_never_stale(database, make_chat, archive):
+    make_chat(1)
+    RepositoryChatSummary(database=database).backfill()
+    # Пустой индекс при нуле сообщений в сводке - ещё не доказательство, что чат проиндексирован
+    RepositorySearch(database=database).reindex_chat(chat_id=1, messages=[])
+
+    assert archive.stale_chats(older_than=time.time() + 60) == []
+
+
+def test_archived_chat_rehydrates(make_saver, make_chat, archive):
+    config = make_chat(1)
+    echo_graph(make_saver()).invoke({"messages": [HumanMessage(content="q1")]}, config)
+
+    assert archive.archive_chat(chat_id=1) is not None
+    assert make_saver().get_tuple(config) is None
+    assert archive.rehydrate(chat_id=1)
+    assert contents(make_saver().get_tuple(config).checkpoint["channel_values"]["messages"]) == ["q1", "echo q1"]
+    assert archive.get(chat_id=1) is None
+
+
+def test_corrupted_frame_is_rejected(make_saver, make_chat, archive):
+    config = make_chat(1)
+    echo_graph(make_saver()).invoke({"messages": [HumanMessage(content="q1")]}, config)
+    record = archive.archive_chat(chat_id=1)
+    path = archive.archive_dir / record.segment
+    data = bytearray(path.read_bytes())
+    data[record.offset] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match="checksum"):
+        archive.rehydrate(chat_id=1)
+    assert archive.get(chat_id=1) is not None
@@ -0,0 +1,41 @@
+import pytest
+
+from core.repository import repository_chat_summary
+from core.repository.repository_chat_summary import RepositoryChatSummary
+
+
+@pytest.fixture
+def summaries(database, monkeypatch) -> RepositoryChatSummary:
+    # Чаты 1-3 и 4-6 обновлены в одну и ту же секунду: порядок внутри - по chat_id
+    now = [100.0]
+    monkeypatch.setattr(repository_chat_summary.time, "time", lambda: now[0])
+    repository = RepositoryChatSummary(database=database)
+    for chat_id in range(1, 7):
+        now[0] = 100.0 if chat_id <= 3 else 200.0
+        repository.record_turn(chat_id=chat_id, title=f"chat {chat_id}", message_count=2, media_bytes=0)
+    now[0] = 300.0
+    return repository
+
+
+def read_all(summaries: RepositoryChatSummary, limit: int) -> list[list[int]]:
+    pages = []
+    before = None
+    while True:
+        page = summaries.list_page(limit=limit, before=before)
+        if not page:
+            return pages
+        pages.append([summary.chat_id for summary in page])
+        before = (page[-1].updated_at, page[-1].chat_id)
+
+
+def test_pages_go_from_newest_without_gaps_on_equal_time(summaries):
+    assert read_all(summaries, limit=2) == [[6, 5], [4, 3], [2, 1]]
+    assert read_all(summaries, limit=4) == [[6, 5, 4, 3], [2, 1]]
+
+
+def test_updated_chat_moves_to_the_first_page(summaries):
+    summaries.record_turn(chat_id=2, title="new title", message_count=4, media_bytes=10)
+
+    assert read_all(summaries, limit=3) == [[2, 6, 5], [4, 3, 1]]
+    summary = summaries.get(chat_id=2)
+    assert (summary.title, summary.message_count, summary.media_bytes) == ("chat 2", 4, 10)
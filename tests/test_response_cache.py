@@ -0,0 +1,85 @@
+import base64
+import hashlib
+import os
+
+import pytest
+
+from application.services.response_cache_service import ResponseCacheService
+from core.repository import codec, repository_response_cache
+from core.repository.repository_response_cache import RepositoryResponseCache
+
+
+IMAGE = b"\x89PNG screenshot bytes"
+
+
+@pytest.fixture
+def cache_repository(database) -> RepositoryResponseCache:
+    return RepositoryResponseCache(database=database)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(repository_response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def image_block() -> dict:
+    return {"type": "image_url", "image_url": f"data:image/png;base64,{base64.b64encode(IMAGE).decode()}"}
+
+
+def test_key_ignores_whitespace_and_image_transport():
+    inline = ResponseCacheService.key("model", "system", [{"type": "text", "text": "Выдели  текст\n"}, image_block()])
+    stored = ResponseCacheService.key(
+        "model",
+        " system ",
+        [
+            {"type": "text", "text": "Выдели текст"},
+            {"type": "media_ref", "sha256": hashlib.sha256(IMAGE).hexdigest(), "mime_type": "image/png"},
+        ],
+    )
+
+    assert inline == stored
+
+
+@pytest.mark.parametrize(
+    "model, system_prompt, text",
+    [("other-model", "system", "Выдели текст"), ("model", "other system", "Выдели текст"), ("model", "system", "Реши")],
+)
+def test_key_depends_on_model_prompt_and_text(model, system_prompt, text):
+    base = ResponseCacheService.key("model", "system", [{"type": "text", "text": "Выдели текст"}, image_block()])
+
+    assert ResponseCacheService.key(model, system_prompt, [{"type": "text", "text": text}, image_block()]) != base
+
+
+def test_entry_expires_after_ttl(cache_repository, clock):
+    service = ResponseCacheService(repository=cache_repository, ttl=60, max_bytes=0)
+    service.put(key="key", model="model", answer="ответ")
+
+    clock[0] += 59
+    assert service.get("key") == "ответ"
+
+    clock[0] += 2
+    assert service.get("key") is None
+    # Просроченная запись удаляется при чтении
+    clock[0] -= 61
+    assert service.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(cache_repository, clock):
+    answer = os.urandom(600).hex()
+    # Предел вмещает две записи, но не три
+    max_bytes = len(codec.dumps(answer)) * 5 // 2
+    service = ResponseCacheService(repository=cache_repository, ttl=0, max_bytes=max_bytes)
+    for key in ("first", "second"):
+        clock[0] += 1
+        service.put(key=key, model="model", answer=answer)
+    clock[0] += 1
+    assert service.get("first") == answer
+
+    clock[0] += 1
+    service.put(key="third", model="model", answer=answer)
+
+    assert service.get("second") is None
+    assert service.get("first") == answer
+    assert service.get("third") == answer
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from application.services.search_service import SearchService
+from core.repository.repository_search import RepositorySearch
+from tests.conftest import echo_graph
+
+
+@pytest.fixture
+def search(database) -> RepositorySearch:
+    return RepositorySearch(database=database)
+
+
+def found(search: RepositorySearch, query: str) -> list[int]:
+    return [result.chat_id for result in search.search(query=query)]
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_turns_are_appended_in_order(search, make_chat):
+    make_chat(1)
+
+    assert search.index_turn(chat_id=1, messages=[("human", "первый вопрос"), ("ai", "ответ")], message_count=2)
+    assert search.index_turn(chat_id=1, messages=[("human", "второй"), ("ai", "ответ")], message_count=4)
+    # Ход, после которого индекс не сходится с историей, не пишется
+    assert not search.index_turn(chat_id=1, messages=[("human", "пропущенный"), ("ai", "ответ")], message_count=9)
+
+    assert found(search, "второй") == [1]
+    assert found(search, "пропущенный") == []
+
+
+def test_query_is_not_parsed_as_fts_syntax(search, make_chat):
+    make_chat(1)
+    search.index_turn(chat_id=1, messages=[("human", 'кавычка " и NEAR(a b) OR звёздочка*')], message_count=1)
+
+    assert found(search, 'кавычка "') == [1]
+    assert found(search, "NEAR(a") == [1]
+    assert found(search, "OR") == [1]
+    # Последнее слово - по префиксу
+    assert found(search, "звёзд") == [1]
+    assert search.search(query="   ") == []
+
+
+def test_out_of_sync_turn_triggers_reindex(search, make_saver, make_chat):
+    config = make_chat(1)
+    saver = make_saver()
+    echo_graph(saver).invoke({"messages": [HumanMessage(content="потерянный ход")]}, config)
+    echo_graph(saver).invoke({"messages": [HumanMessage(content="новый ход")]}, config)
+    service = SearchService(repository=search, checkpointer=saver)
+
+    # В индексе нет первого хода - дописать второй нельзя, чат переиндексируется целиком
+    service.index_turn(chat_id=1, human_message="новый ход", response=[{"ai": "echo новый ход"}], message_count=4)
+
+    assert wait_for(lambda: found(search, "потерянный") == [1])
+    assert found(search, "новый") == [1]
+
+
+def test_backfill_indexes_old_chats(search, make_saver, make_chat):
+    for chat_id in (1, 2):
+        echo_graph(make_saver()).invoke({"messages": [HumanMessage(content=f"старый чат {chat_id}")]}, make_chat(chat_id))
+
+    assert sorted(search.chats_to_backfill()) == [1, 2]
+    SearchService(repository=search, checkpointer=make_saver()).start_backfill()
+
+    assert wait_for(lambda: search.chats_to_backfill() == [])
+    assert sorted(found(search, "старый")) == [1, 2]
@@ -0,0 +1,85 @@
+import base64
+
+import pytest
+
+from core.media.video_sampler import VideoSampler
+from domain.enums.content_media_type import ContentMediaType, MimeType
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+
+FPS = 10
+SECONDS = 10
+
+
+def write_video(path, moving: bool) -> str:
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), FPS, (640, 360))
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (360, 640, 3), dtype=np.uint8)
+    for index in range(FPS * SECONDS):
+        frame = background.copy()
+        if moving:
+            # Каждую секунду на кадре новая область
+            x = (index // FPS) * 60
+            frame[100:260, x:x + 60] = 255
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+@pytest.fixture
+def moving_video(tmp_path) -> str:
+    return write_video(tmp_path / "moving.avi", moving=True)
+
+
+@pytest.fixture
+def static_video(tmp_path) -> str:
+    return write_video(tmp_path / "static.avi", moving=False)
+
+
+def test_frames_are_sampled_at_fps(moving_video):
+    progress = []
+
+    frames = VideoSampler(fps=1, max_side=320, max_frames=100, max_bytes=0).sample(moving_video, progress.append)
+
+    assert [round(timestamp) for timestamp, _ in frames] == list(range(SECONDS))
+    assert progress[-1] == 1.0
+    image = cv2.imdecode(np.frombuffer(frames[0][1], np.uint8), cv2.IMREAD_COLOR)
+    assert max(image.shape[:2]) == 320
+
+
+def test_static_frames_are_skipped(static_video):
+    frames = VideoSampler(fps=2, max_side=320, max_frames=100, max_bytes=0).sample(static_video)
+
+    assert len(frames) == 1
+
+
+def test_long_video_is_limited_to_max_frames(moving_video):
+    # Шаг 10 / 4 = 2.5 секунды - кадры берутся перемоткой
+    frames = VideoSampler(fps=1, max_side=320, max_frames=4, max_bytes=0).sample(moving_video)
+
+    timestamps = [timestamp for timestamp, _ in frames]
+    assert 1 < len(frames) <= 4
+    assert timestamps == sorted(timestamps)
+
+
+def test_frames_are_thinned_to_byte_budget(moving_video):
+    sampler = VideoSampler(fps=1, max_side=320, max_frames=100, max_bytes=0)
+    all_frames = sampler.sample(moving_video)
+    sampler.max_bytes = sum(len(data) for _, data in all_frames) // 3
+
+    frames = sampler.sample(moving_video)
+
+    assert sum(len(data) for _, data in frames) <= sampler.max_bytes
+    assert len(frames) < len(all_frames)
+    assert frames[-1][0] == all_frames[-1][0]
+
+
+def test_to_content_labels_each_frame():
+    content = VideoSampler.to_content("demo.mp4", [(0.0, b"first"), (75.4, b"second")])
+
+    assert content[0]["type"] == ContentMediaType.TEXT.value
+    assert "demo.mp4" in content[0]["text"]
+    assert [block["text"] for block in content[1::2]] == ["[00:00]", "[01:15]"]
+    assert content[4]["image_url"] == f"data:{MimeType.JPEG.value};base64,{base64.b64encode(b'second').decode()}"
@@ -0,0 +1,49 @@
+import pickle
+from collections import defaultdict
+
+import pytest
+
+from core.ai.db_dict import SQLAlchemyDBDict
+from core.repository import codec
+from core.repository.write_behind_flusher import WriteBehindFlusher
+
+
+@pytest.fixture
+def flusher(repository) -> WriteBehindFlusher:
+    # Длинная задержка: в тестах запись идёт только через flush
+    flusher = WriteBehindFlusher(repository=repository, delay=60)
+    yield flusher
+    flusher.shutdown()
+
+
+def stored(repository, chat_id: int, col_name: str):
+    raw = repository.get_chat_column(record_id=chat_id, col_name=col_name)
+    return pickle.loads(codec.decode_bytes(raw)) if raw else None
+
+
+def test_snapshot_is_taken_at_sync_time(repository, flusher):
+    create_db_dict, chat_id = SQLAlchemyDBDict.db_dict_factory(repository=repository, record_id=1, flusher=flusher)
+    storage = create_db_dict(lambda: defaultdict(dict))
+    storage["1"][""] = {"checkpoint-1": "state"}
+
+    storage.sync_data()
+    # Следующий ход меняет вложенный словарь до того, как флашер дошёл до записи
+    storage["1"][""]["checkpoint-2"] = "state"
+    flusher.flush()
+
+    assert stored(repository, chat_id, storage.col_name) == {"1": {"": {"checkpoint-1": "state"}}}
+
+
+def test_unchanged_column_is_not_rewritten(repository, flusher):
+    create_db_dict, chat_id = SQLAlchemyDBDict.db_dict_factory(repository=repository, record_id=1, flusher=flusher)
+    writes = create_db_dict(dict)
+    writes["key"] = "value"
+    writes.sync_data()
+    flusher.flush()
+    repository.save_columns(records={chat_id: {writes.col_name: codec.dumps({"changed": "elsewhere"})}})
+
+    writes.sync_data()
+    flusher.flush()
+
+    # Тот же снимок уже записан - флашер колонку не трогает
+    assert stored(repository, chat_id, writes.col_name) == {"changed": "elsewhere"}